@@ -0,0 +1,92 @@
+"""Structured-output schemas for the analysis completions.
+
+The completions are requested with ``response_format`` set to a strict JSON
+schema generated from these models, so the response is plain JSON of a known
+shape and is validated with ``model_validate_json`` instead of being picked
+apart with regular expressions.
+"""
+import copy
+from typing import Dict, List, Type
+
+from pydantic import BaseModel
+
+
+class CarAnalysis(BaseModel):
+    matchScore: int
+    strengths: List[str]
+    considerations: List[str]
+    commonProblems: str
+    highMileageConcerns: str
+    valueAssessment: str
+    recommendation: str
+    checklistItems: List[str]
+    comparison: str
+    summary: str
+
+
+class ListingAnalysis(BaseModel):
+    """The listing-specific part of ``CarAnalysis``."""
+    matchScore: int
+    strengths: List[str]
+    considerations: List[str]
+    valueAssessment: str
+    recommendation: str
+    summary: str
+
+
+class ModelInsights(BaseModel):
+    """The model-level part of ``CarAnalysis``, precomputed per BMW model."""
+    commonProblems: str
+    highMileageConcerns: str
+    checklistItems: List[str]
+    comparison: str
+
+
+class AnalysisBlock(BaseModel):
+    id: str
+    analysis: CarAnalysis
+
+
+class ListingAnalysisBlock(BaseModel):
+    id: str
+    analysis: ListingAnalysis
+
+
+class ShortlistResponse(BaseModel):
+    selected_ids: List[str]
+
+
+class AnalysisResponse(BaseModel):
+    # Listed first so the IDs stream in before the long analyses
+    selected_ids: List[str]
+    analyses: List[AnalysisBlock]
+
+
+def _strict(schema: Dict) -> Dict:
+    """Apply the strict-mode rules: closed objects, every property required."""
+    if isinstance(schema, dict):
+        if schema.get("type") == "object" and "properties" in schema:
+            schema["additionalProperties"] = False
+            schema["required"] = list(schema["properties"])
+        for value in schema.values():
+            _strict(value)
+    elif isinstance(schema, list):
+        for value in schema:
+            _strict(value)
+    return schema
+
+
+_formats = {}
+
+def response_format(model: Type[BaseModel]) -> Dict:
+    """``response_format`` argument requesting JSON that validates as ``model``."""
+    if model not in _formats:
+        _formats[model] = {
+            "type": "json_schema",
+            "json_schema": {
+                "name": model.__name__,
+                "strict": True,
+                "schema": _strict(copy.deepcopy(model.model_json_schema())),
+            },
+        }
+    return _formats[model]
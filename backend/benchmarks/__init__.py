@@ -0,0 +1,4 @@
+"""Benchmark harness for the search pipeline.
+
+See ``python -m benchmarks.run --help`` (run from ``backend``).
+"""
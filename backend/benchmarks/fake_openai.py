@@ -0,0 +1,101 @@
+"""Local stand-in for ``AsyncOpenAI`` returning canned analyses.
+
+Only ``client.chat.completions.create`` is implemented.  The reply is valid
+JSON for the requested ``response_format`` schema and refers to listing IDs
+taken from the request, so it passes the server's validation unchanged.
+Each call sleeps for ``latency`` seconds plus up to ``jitter`` seconds.
+"""
+import asyncio
+import json
+import random
+from types import SimpleNamespace
+
+LISTING_ANALYSIS = {
+    "matchScore": 82,
+    "strengths": ["Reasonable mileage for the year", "Price below comparable listings"],
+    "considerations": ["Check the service history", "Tyres may need replacing soon"],
+    "valueAssessment": "Fairly priced for its age and mileage.",
+    "recommendation": "Worth a viewing and an independent inspection.",
+    "summary": "A solid example of the model with a plausible history.",
+}
+MODEL_INSIGHTS = {
+    "commonProblems": "Timing chain stretch and EGR cooler leaks on early engines.",
+    "highMileageConcerns": "Turbocharger, DPF and suspension bushings beyond 200,000 km.",
+    "checklistItems": ["Cold start for chain rattle", "Check for oil leaks", "Read fault codes"],
+    "comparison": "Cheaper to run than most rivals of the same age.",
+}
+
+
+def _block(car_id: str, listing_only: bool = False) -> dict:
+    analysis = dict(LISTING_ANALYSIS) if listing_only else {**LISTING_ANALYSIS, **MODEL_INSIGHTS}
+    return {"id": car_id, "analysis": analysis}
+
+
+def canned_response(schema_name: str, request: dict) -> str:
+    """Completion text for a request of the given ``response_format`` schema."""
+    if schema_name in ("AnalysisBlock", "ListingAnalysisBlock"):
+        return json.dumps(_block(request["listing"]["id"], schema_name == "ListingAnalysisBlock"))
+    ids = request.get("valid_ids") or [listing["id"] for listing in request.get("listings", [])]
+    ids = ids[:3]
+    if schema_name == "ShortlistResponse":
+        return json.dumps({"selected_ids": ids})
+    return json.dumps({"selected_ids": ids, "analyses": [_block(car_id) for car_id in ids]})
+
+
+def _usage(prompt: str, completion: str):
+    # Same 4-characters-per-token approximation as the server's fallback
+    prompt_tokens, completion_tokens = len(prompt) // 4, len(completion) // 4
+    return SimpleNamespace(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+    )
+
+
+class _Stream:
+    def __init__(self, content: str, usage, chunk_size: int):
+        self._content = content
+        self._usage = usage
+        self._chunk_size = chunk_size
+
+    async def _chunks(self):
+        for start in range(0, len(self._content), self._chunk_size):
+            delta = SimpleNamespace(content=self._content[start:start + self._chunk_size])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+        yield SimpleNamespace(choices=[], usage=self._usage)
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def close(self):
+        pass
+
+
+class _Completions:
+    def __init__(self, client):
+        self._client = client
+
+    async def create(self, messages, response_format, stream=False, **kwargs):
+        client = self._client
+        client.calls += 1
+        prompt = "".join(message["content"] for message in messages)
+        content = canned_response(response_format["json_schema"]["name"], json.loads(messages[-1]["content"]))
+        await asyncio.sleep(client.latency + client._rng.uniform(0, client.jitter))
+
+        usage = _usage(prompt, content)
+        if stream:
+            return _Stream(content, usage, client.stream_chunk_size)
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+class FakeOpenAI:
+    """Drop-in for ``AsyncOpenAI`` in benchmarks: ``server.client = FakeOpenAI(...)``."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, stream_chunk_size: int = 16, seed: int = 42):
+        self.latency = latency
+        self.jitter = jitter
+        self.stream_chunk_size = stream_chunk_size
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self.chat = SimpleNamespace(completions=_Completions(self))
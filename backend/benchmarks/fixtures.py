@@ -0,0 +1,191 @@
+"""Synthetic car_listings.db and bmw_cars.db fixtures.
+
+Listings mimic the scraped data: Latvian display strings for price
+("12 500 €"), mileage ("185 000 km") and year ("2011 janvāris"), engine and
+colour names as the site writes them, and option lists grouped by category.
+Generation is seeded, so the same size and seed always give the same rows.
+
+    python -m benchmarks.fixtures --rows 100000 --out bench_data
+"""
+import argparse
+import logging
+import os
+import random
+import sqlite3
+import time
+
+import listings_schema
+from listings_schema import LISTING_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# (listing model, bmw_models name, production years, engine spec, fuel type)
+MODELS = [
+    ("118i", "118i", "2015-2019", "1.5 petrol", "Petrol"),
+    ("120d", "120d", "2011-2019", "2.0 diesel", "Diesel"),
+    ("320d", "320d", "2012-2019", "2.0 diesel", "Diesel"),
+    ("320d", "320d", "2019-present", "2.0 diesel", "Diesel"),
+    ("330e", "330e", "2016-2019", "2.0 petrol hybrid", "Hybrid petrol/electric"),
+    ("330i", "330i", "2019-present", "2.0 petrol", "Petrol"),
+    ("520d", "520d", "2010-2017", "2.0 diesel", "Diesel"),
+    ("530d", "530d", "2010-2017", "3.0 diesel", "Diesel"),
+    ("530e", "530e", "2017-2023", "2.0 petrol hybrid", "Hybrid petrol/electric"),
+    ("730d", "730d", "2015-2022", "3.0 diesel", "Diesel"),
+    ("X1", "X1 sDrive18d", "2015-2022", "2.0 diesel", "Diesel"),
+    ("X3", "X3 xDrive20d", "2010-2017", "2.0 diesel", "Diesel"),
+    ("X5", "X5 xDrive30d", "2013-2018", "3.0 diesel", "Diesel"),
+    ("X5", "X5 xDrive45e", "2019-present", "3.0 petrol hybrid", "Hybrid petrol/electric"),
+    ("i3", "i3", "2013-2022", "electric motor", "Electric"),
+    ("M340i", "M340i", "2019-present", "3.0 petrol", "Petrol"),
+]
+
+ENGINES = {
+    "Petrol": ["1.5 Benzīns", "2.0 Benzīns", "3.0 Benzīns", "2.0 Benzīns/gāze"],
+    "Diesel": ["2.0 Dīzelis", "3.0 Dīzelis"],
+    "Hybrid petrol/electric": ["2.0 Hibrīds", "3.0 Hibrīds"],
+    "Electric": ["Elektriskais"],
+}
+MONTHS = ["janvāris", "februāris", "marts", "aprīlis", "maijs", "jūnijs",
+          "jūlijs", "augusts", "septembris", "oktobris", "novembris", "decembris"]
+COLORS = ["Melna", "Balta", "Pelēka", "Sudrabaina", "Zila", "Sarkana",
+          "Melna metālika", "Pelēka metālika", "Zila metālika", "Brūna"]
+BODY_TYPES = ["Sedans", "Universāls", "Hečbeks", "Apvidus", "Kupeja", "Kabriolets"]
+TRANSMISSIONS = ["Automāts", "Manuāla"]
+OPTIONS = {
+    "Drošība": ["ABS", "ESP", "xDrive", "Aklās zonas kontrole", "Joslu kontrole", "Parkošanās sensori"],
+    "Komforts": ["Panorāmas jumts", "Apsildāmi sēdekļi", "Klimata kontrole", "Ādas salons",
+                 "Elektriski regulējami sēdekļi", "Bezatslēgas piekļuve"],
+    "Multivide": ["Navigācija", "Head-up displejs", "Harman Kardon", "Apple CarPlay", "Atpakaļskata kamera"],
+    "Citi": ["Sakabe", "LED lukturi", "M Sport pakete", "Vasaras un ziemas riepas"],
+}
+DESCRIPTION_PHRASES = [
+    "Auto labā tehniskā stāvoklī.", "Regulāri apkopts oficiālajā dīlerī.",
+    "Servisa vēsture pieejama.", "Nesen nomainīta eļļa un filtri.",
+    "Nav rūsas.", "Viens īpašnieks Latvijā.", "Ievests no Vācijas.",
+    "Jauni bremžu diski un uzlikas.", "Iespējama apmaiņa.", "Cena nav galīgā.",
+    "Ziemas riepas komplektā.", "Salons tīrs un kopts.", "Nesmēķētāja auto.",
+    "Jauna tehniskā apskate.", "Dzinējs strādā klusi, kārba pārslēdz gludi.",
+]
+
+
+def _thousands(value: int) -> str:
+    return f"{value:,}".replace(",", " ")
+
+
+def _listing(rng: random.Random, number: int, current_year: int) -> tuple:
+    model, _, years, _, fuel = rng.choice(MODELS)
+    start = int(years[:4])
+    end = current_year if years.endswith("present") else int(years[-4:])
+    year = rng.randint(start, end)
+    age = current_year - year
+
+    # Older cars are cheaper and have driven further
+    mileage = max(1000, int(rng.gauss(age * 18000 + 15000, 25000)))
+    price = max(1500, int(rng.gauss(60000 * 0.86 ** age, 4000)) // 100 * 100)
+    if rng.random() < 0.005:
+        year_text = ""
+    else:
+        year_text = f"{year} {rng.choice(MONTHS)}"
+
+    options = " | ".join(
+        f"{category}: {', '.join(rng.sample(values, rng.randint(1, len(values))))}"
+        for category, values in OPTIONS.items()
+        if rng.random() < 0.8
+    )
+    return (
+        f"bench{number}",
+        "2024-05-01 12:00:00",
+        f"https://www.ss.com/msg/lv/transport/cars/bmw/bench{number}.html",
+        f"{_thousands(price)} €",
+        f"BMW {model}",
+        year_text,
+        rng.choice(ENGINES[fuel]),
+        rng.choice(TRANSMISSIONS),
+        f"{_thousands(mileage)} km",
+        rng.choice(COLORS),
+        rng.choice(BODY_TYPES),
+        f"{rng.randint(current_year, current_year + 2)}-{rng.randint(1, 12):02d}" if rng.random() < 0.8 else "",
+        " ".join(rng.sample(DESCRIPTION_PHRASES, rng.randint(2, 8))),
+        options,
+        f"https://i.ss.com/gallery/bench{number}.jpg",
+    )
+
+
+def generate_listings_db(path: str, rows: int, seed: int = 42, batch_size: int = 10000):
+    """Write a car_listings.db with ``rows`` synthetic listings and migrate it."""
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+    current_year = 2024
+    started = time.perf_counter()
+
+    conn = sqlite3.connect(path)
+    try:
+        listings_schema.create_listings_table(conn)
+        insert = f"INSERT INTO cars VALUES ({', '.join('?' * len(LISTING_COLUMNS))})"
+        for offset in range(0, rows, batch_size):
+            conn.executemany(insert, (
+                _listing(rng, number, current_year)
+                for number in range(offset, min(rows, offset + batch_size))
+            ))
+            conn.commit()
+    finally:
+        conn.close()
+
+    # Migrate here so the server's startup migration is a no-op during runs
+    listings_schema.migrate(path)
+    logger.info(f"Generated {rows} listings in {path} in {time.perf_counter() - started:.1f}s")
+
+
+def generate_bmw_db(path: str, seed: int = 42):
+    """Write a bmw_cars.db with one ``bmw_models`` row per entry of ``MODELS``."""
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("""
+            CREATE TABLE bmw_models (
+                id INTEGER PRIMARY KEY,
+                model_name TEXT, production_years TEXT, engine_specifications TEXT, engine_code TEXT,
+                fuel_type TEXT, positives TEXT, negatives TEXT, common_problems TEXT,
+                high_mileage_considerations TEXT, original_price_eur TEXT
+            )
+        """)
+        for _, name, years, spec, fuel in MODELS:
+            conn.execute(
+                "INSERT INTO bmw_models (model_name, production_years, engine_specifications, engine_code, "
+                "fuel_type, positives, negatives, common_problems, high_mileage_considerations, "
+                "original_price_eur) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    name, years, spec, rng.choice(["B47", "B48", "B58", "N47", "N57", "IB1"]), fuel,
+                    "Economical engine. Precise handling. Good build quality",
+                    "Expensive parts. Firm ride on run-flat tyres",
+                    "Timing chain stretch on early engines, EGR cooler leaks, oil filter housing gasket "
+                    "leaks and electric water pump failures around 100,000 km.",
+                    "Check the timing chain, turbocharger, DPF condition and transmission oil service "
+                    "history; budget for suspension bushings beyond 200,000 km.",
+                    str(rng.randint(30, 110) * 1000),
+                )
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def generate(out_dir: str, rows: int, seed: int = 42):
+    """Write both fixture databases to ``out_dir``; returns ``out_dir``."""
+    os.makedirs(out_dir, exist_ok=True)
+    generate_bmw_db(os.path.join(out_dir, "bmw_cars.db"), seed)
+    generate_listings_db(os.path.join(out_dir, "car_listings.db"), rows, seed)
+    return out_dir
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Generate synthetic benchmark databases")
+    parser.add_argument("--rows", type=int, default=10000, help="number of listings")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="bench_data", help="output directory")
+    args = parser.parse_args()
+    generate(args.out, args.rows, args.seed)
@@ -0,0 +1,271 @@
+"""Search pipeline benchmarks.
+
+Generates (or reuses) synthetic databases, points the server at them with a
+``FakeOpenAI`` client and measures:
+
+* ``search`` - ``POST /api/search`` end to end through the ASGI app, with
+  the response cache disabled so every request runs the full pipeline;
+* ``stream`` - ``POST /api/search/stream`` until the last event;
+* ``functions`` - ``calculate_match_score``, ``get_model_info`` (memoized
+  and uncached), ``count_tokens`` and ``select_candidates`` in isolation;
+* ``startup`` - importing the server module, the startup warmup and the
+  first search after it (single samples).
+
+Each scenario reports p50/p99/mean latency and throughput.  ``--save``
+writes the results as JSON and ``--baseline`` compares against such a file,
+exiting with status 1 when a p50 regresses by more than ``--tolerance``.
+
+    cd backend
+    python -m benchmarks.run --rows 100000 --latency 0.5 --requests 50 --concurrency 8
+    python -m benchmarks.run --scenarios functions --save baseline.json
+    python -m benchmarks.run --scenarios functions --baseline baseline.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from benchmarks import fixtures
+from benchmarks.fake_openai import FakeOpenAI
+
+# Filter mixes sent by the search scenarios, from broad to narrow
+FILTER_SCENARIOS = [
+    {"price": {"min": None, "max": None}, "mileage": {"min": None, "max": None}},
+    {"price": {"min": 5000, "max": 30000}, "mileage": {"min": None, "max": 250000}, "fuelType": "Dīzelis"},
+    {"price": {"min": 10000, "max": 40000}, "mileage": {"min": None, "max": 150000}, "color": "Melna"},
+    {"price": {"min": None, "max": 15000}, "mileage": {"min": 50000, "max": 300000}, "fuelType": "Benzīns"},
+    {"price": {"min": 20000, "max": None}, "mileage": {"min": None, "max": None}, "fuelType": "Hibrīds",
+     "features": ["Panorāmas jumts"]},
+    {"price": {"min": None, "max": 50000}, "mileage": {"min": None, "max": 200000}, "keywords": "dīleri servisa"},
+]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(name: str, durations: List[float], wall_seconds: float) -> Dict:
+    durations = sorted(durations)
+    return {
+        "name": name,
+        "count": len(durations),
+        "p50_ms": percentile(durations, 50) * 1000,
+        "p99_ms": percentile(durations, 99) * 1000,
+        "mean_ms": sum(durations) / len(durations) * 1000 if durations else 0.0,
+        "throughput": len(durations) / wall_seconds if wall_seconds else 0.0,
+    }
+
+
+def time_calls(name: str, func: Callable, iterations: int, setup: Callable = None) -> Dict:
+    """Time ``iterations`` calls of ``func(i)``, running ``setup(i)`` untimed first."""
+    durations = []
+    wall = 0.0
+    for i in range(iterations):
+        if setup is not None:
+            setup(i)
+        started = time.perf_counter()
+        func(i)
+        elapsed = time.perf_counter() - started
+        durations.append(elapsed)
+        wall += elapsed
+    return summarize(name, durations, wall)
+
+
+async def asgi_request(app, method: str, path: str, body: dict = None) -> int:
+    """Send one HTTP request through the ASGI app, reading the whole response."""
+    payload = json.dumps(body).encode() if body is not None else b""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "path": path, "raw_path": path.encode(), "query_string": b"",
+        "scheme": "http", "server": ("bench", 80), "client": ("127.0.0.1", 0), "root_path": "",
+        "headers": [(b"host", b"bench"), (b"content-type", b"application/json"),
+                    (b"content-length", str(len(payload)).encode())],
+    }
+    request_sent = False
+    response_done = asyncio.Event()
+    status = {}
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        # Only asked again by disconnect polling; the client stays connected
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+        elif message["type"] == "http.response.body" and not message.get("more_body", False):
+            response_done.set()
+
+    await app(scope, receive, send)
+    response_done.set()
+    return status.get("code", 0)
+
+
+async def run_requests(name: str, app, path: str, requests: int, concurrency: int, seed: int) -> Dict:
+    rng = random.Random(seed)
+    bodies = [rng.choice(FILTER_SCENARIOS) for _ in range(requests)]
+    durations = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(body):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            code = await asgi_request(app, "POST", path, body)
+            durations.append(time.perf_counter() - started)
+            if code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(body) for body in bodies))
+    result = summarize(name, durations, time.perf_counter() - started)
+    result["errors"] = errors
+    return result
+
+
+def function_benchmarks(server, iterations: int, seed: int) -> List[Dict]:
+    rng = random.Random(seed)
+    filters = server.SearchFilters(**FILTER_SCENARIOS[1])
+    with server.get_car_listings_db() as conn:
+        sample = [dict(row) for row in conn.execute(
+            "SELECT * FROM cars ORDER BY rowid LIMIT ?", (max(iterations, 1),)
+        ).fetchall()]
+    listings = [rng.choice(sample) for _ in range(iterations)]
+    keys = []
+    for listing in listings:
+        _, model = server.parse_make_model(listing["make_model"])
+        keys.append((model, server.parse_year(listing["year"]), listing["engine"]))
+    texts = [server.prompt_builder.build({}, [server.prepare_listing_data(listing, {})], 10 ** 9).content
+             for listing in listings[:200]]
+
+    results = [
+        time_calls("calculate_match_score",
+                   lambda i: server.calculate_match_score(listings[i], {}, filters), iterations),
+        time_calls("get_model_info (memoized)", lambda i: server.get_model_info(*keys[i]), iterations),
+        time_calls("get_model_info (uncached)", lambda i: server.get_model_info(*keys[i]), iterations,
+                   setup=lambda i: server.model_info_cache.clear()),
+        time_calls("count_tokens", lambda i: server.count_tokens(texts[i % len(texts)]), iterations),
+    ]
+    scenario_filters = [server.SearchFilters(**body) for body in FILTER_SCENARIOS]
+    results.append(time_calls(
+        "select_candidates", lambda i: server.select_candidates(scenario_filters[i % len(scenario_filters)]),
+        max(len(scenario_filters), iterations // 100)
+    ))
+    return results
+
+
+def print_results(results: List[Dict]):
+    print(f"{'scenario':<28} {'count':>7} {'p50 ms':>10} {'p99 ms':>10} {'mean ms':>10} {'ops/s':>10}")
+    for result in results:
+        print(f"{result['name']:<28} {result['count']:>7} {result['p50_ms']:>10.3f} {result['p99_ms']:>10.3f} "
+              f"{result['mean_ms']:>10.3f} {result['throughput']:>10.1f}"
+              + (f"  ({result['errors']} errors)" if result.get("errors") else ""))
+
+
+def compare(results: List[Dict], baseline_path: str, tolerance: float) -> bool:
+    """Print p50 changes against a saved run; returns False on a regression."""
+    with open(baseline_path) as f:
+        baseline = {result["name"]: result for result in json.load(f)["results"]}
+    ok = True
+    for result in results:
+        before = baseline.get(result["name"])
+        if not before or not before["p50_ms"]:
+            continue
+        change = result["p50_ms"] / before["p50_ms"] - 1
+        regressed = change > tolerance
+        ok = ok and not regressed
+        print(f"{result['name']:<28} p50 {before['p50_ms']:.3f} -> {result['p50_ms']:.3f} ms "
+              f"({change:+.0%}){'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+async def run_scenarios(server, args, import_seconds: float) -> List[Dict]:
+    results = []
+    async with server.app.router.lifespan_context(server.app):
+        await server.wait_until_ready()
+        if "startup" in args.scenarios:
+            started = time.perf_counter()
+            await asgi_request(server.app, "POST", "/api/search", FILTER_SCENARIOS[1])
+            first_search = time.perf_counter() - started
+            results.extend(
+                summarize(name, [seconds], seconds) for name, seconds in (
+                    ("startup: import", import_seconds),
+                    ("startup: warmup", server.warmup_seconds),
+                    ("startup: first search", first_search),
+                )
+            )
+        if "functions" in args.scenarios:
+            results.extend(function_benchmarks(server, args.iterations, args.seed))
+        if "search" in args.scenarios:
+            results.append(await run_requests(
+                "search", server.app, "/api/search", args.requests, args.concurrency, args.seed
+            ))
+        if "stream" in args.scenarios:
+            results.append(await run_requests(
+                "stream", server.app, "/api/search/stream", args.requests, args.concurrency, args.seed
+            ))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the search pipeline")
+    parser.add_argument("--rows", type=int, default=10000, help="listings in the generated database")
+    parser.add_argument("--data-dir", help="reuse databases in this directory (generated if missing)")
+    parser.add_argument("--scenarios", default="startup,functions,search,stream",
+                        help="comma-separated: startup, functions, search, stream")
+    parser.add_argument("--requests", type=int, default=50, help="requests per search scenario")
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent search requests")
+    parser.add_argument("--iterations", type=int, default=10000, help="calls per function benchmark")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake OpenAI latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random fake OpenAI latency in seconds")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p50 slowdown against the baseline")
+    args = parser.parse_args()
+    args.scenarios = set(args.scenarios.split(","))
+
+    data_dir = args.data_dir or os.path.join(tempfile.gettempdir(), f"autoadvisor-bench-{args.rows}-{args.seed}")
+    if not os.path.exists(os.path.join(data_dir, "car_listings.db")):
+        print(f"Generating {args.rows} listings in {data_dir}", file=sys.stderr)
+        fixtures.generate(data_dir, args.rows, args.seed)
+
+    # The server reads its configuration at import time
+    os.environ["DATA_DIR"] = data_dir
+    os.environ.setdefault("LOG_DIR", os.path.join(data_dir, "logs"))
+    os.environ.setdefault("SEARCH_CACHE_SIZE", "0")
+    os.environ.setdefault("DEBUG_DUMP_SAMPLE_RATE", "0")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("OPENAI_LOG_LEVEL", "WARNING")
+    started = time.perf_counter()
+    import server
+    import_seconds = time.perf_counter() - started
+    server.client = FakeOpenAI(latency=args.latency, jitter=args.jitter, seed=args.seed)
+
+    results = asyncio.run(run_scenarios(server, args, import_seconds))
+    print_results(results)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"rows": args.rows, "latency": args.latency, "results": results}, f, indent=2)
+    if args.baseline and not compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
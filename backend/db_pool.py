@@ -0,0 +1,322 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def file_signature(db_path: str):
+    """(inode, mtime, size) of a database file and its WAL; None for missing files."""
+    signature = []
+    for path in (db_path, db_path + "-wal"):
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when no pooled connection becomes available in time."""
+
+
+class SQLitePool:
+    """Bounded pool of long-lived SQLite connections for a single database file.
+
+    Connections are opened lazily up to ``size`` and handed out through the
+    ``connection()`` context manager.  Checkout is a queue pop - there is no
+    per-checkout probe query.  A connection is only health-checked when the
+    work done with it raised an ``sqlite3.Error``; if the ``SELECT 1`` probe
+    fails as well the connection is discarded and a fresh one is opened on
+    the next checkout.
+
+    When the database file is replaced (a new inode at ``db_path``, e.g. after
+    ``ingest.py --swap``) the pooled connections, which still read the old
+    file, are closed and new ones are opened on the next checkouts.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        size: int = 8,
+        read_only: bool = True,
+        timeout: float = 10.0,
+        wal: bool = True,
+        configure: Optional[Callable[[sqlite3.Connection], None]] = None,
+    ):
+        self.db_path = db_path
+        self.size = max(1, size)
+        self.read_only = read_only
+        self.timeout = timeout
+        self.wal = wal
+        self.configure = configure
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+        # Inode the current connections were opened on; bumping the generation
+        # retires connections opened on an earlier file
+        self._inode = None
+        self._generation = 0
+        self._generations = {}
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "connections_opened": 0,
+            "connections_discarded": 0,
+            "health_checks": 0,
+            "total_wait_ms": 0.0,
+            "recycles": 0,
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        if not os.path.exists(self.db_path):
+            raise FileNotFoundError(f"Database file not found at: {self.db_path}")
+
+        if self.read_only:
+            uri = f"file:{self.db_path}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, timeout=self.timeout, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+            if self.wal:
+                # journal_mode is persisted in the file, so read-only pools pick
+                # up WAL once any writer (migration or ingestion) has set it.
+                conn.execute("PRAGMA journal_mode=WAL")
+
+        conn.row_factory = sqlite3.Row
+        if self.configure:
+            self.configure(conn)
+
+        with self._lock:
+            self._stats["connections_opened"] += 1
+            self._generations[id(conn)] = self._generation
+        logger.debug(f"Opened pooled connection to {self.db_path} (read_only={self.read_only})")
+        return conn
+
+    def _check_replaced(self):
+        """Retire the pooled connections if the database file was replaced."""
+        try:
+            inode = os.stat(self.db_path).st_ino
+        except FileNotFoundError:
+            return
+        if inode == self._inode:
+            return
+        with self._lock:
+            if inode == self._inode:
+                return
+            replaced = self._inode is not None
+            self._inode = inode
+            if replaced:
+                self._generation += 1
+                self._stats["recycles"] += 1
+        if replaced:
+            logger.info(f"{self.db_path} was replaced, reopening pooled connections")
+            while True:
+                try:
+                    self._discard(self._idle.get_nowait())
+                except queue.Empty:
+                    break
+
+    def _is_current(self, conn: sqlite3.Connection) -> bool:
+        return self._generations.get(id(conn)) == self._generation
+
+    def _checkout(self) -> sqlite3.Connection:
+        if self._closed:
+            raise sqlite3.ProgrammingError(f"Connection pool for {self.db_path} is closed")
+        self._check_replaced()
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+        if conn is not None and not self._is_current(conn):
+            self._discard(conn)
+            conn = None
+
+        if conn is None:
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                started = time.perf_counter()
+                with self._lock:
+                    self._stats["waits"] += 1
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._stats["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"Timed out after {self.timeout}s waiting for a connection to {self.db_path}"
+                    )
+                finally:
+                    with self._lock:
+                        self._stats["total_wait_ms"] += (time.perf_counter() - started) * 1000
+
+        with self._lock:
+            self._stats["checkouts"] += 1
+        return conn
+
+    def _is_healthy(self, conn: sqlite3.Connection) -> bool:
+        with self._lock:
+            self._stats["health_checks"] += 1
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn: sqlite3.Connection):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._opened -= 1
+            self._stats["connections_discarded"] += 1
+            self._generations.pop(id(conn), None)
+
+    def _checkin(self, conn: sqlite3.Connection, failed: bool = False):
+        if not self._is_current(conn):
+            # Opened on a database file that has since been replaced
+            self._discard(conn)
+            return
+        if self._closed or (failed and not self._is_healthy(conn)):
+            logger.warning(f"Discarding pooled connection to {self.db_path}")
+            self._discard(conn)
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of the ``with`` block."""
+        conn = self._checkout()
+        failed = False
+        try:
+            yield conn
+        except sqlite3.Error:
+            failed = True
+            raise
+        finally:
+            self._checkin(conn, failed=failed)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = self.size
+            stats["open"] = self._opened
+        stats["idle"] = self._idle.qsize()
+        stats["in_use"] = stats["open"] - stats["idle"]
+        stats["total_wait_ms"] = round(stats["total_wait_ms"], 2)
+        return stats
+
+    def close(self):
+        """Close every idle connection; borrowed ones are closed on return."""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def after_fork(self):
+        """Start over with no connections in a freshly forked child process.
+
+        SQLite connections must not be used across ``fork()``; closing them in
+        the child could release locks or touch the WAL index the parent still
+        relies on, so the inherited ones are dropped without closing.  The
+        pool reopens even if the parent had closed it.
+        """
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+        self._inode = None
+        self._generations = {}
+
+
+class DatabaseWatcher:
+    """Detects changes to an SQLite database file made by other processes.
+
+    The change signature combines the mtime/size of the database and its WAL
+    file with ``PRAGMA data_version`` read on a private connection, so both
+    file replacements and in-place WAL commits are noticed.  The file is
+    checked at most once per ``check_interval`` seconds.
+    """
+
+    def __init__(self, db_path: str, check_interval: float = 5.0):
+        self.db_path = db_path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._conn = None
+        self._signature = None
+        self._next_check = 0.0
+
+    def _file_signature(self):
+        return file_signature(self.db_path)
+
+    def _data_version(self):
+        try:
+            if self._conn is None:
+                self._conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.Error:
+            self._conn = None
+            return None
+
+    def _current(self):
+        files = self._file_signature()
+        if self._signature is not None and files[0] != self._signature[0][0] and self._conn is not None:
+            # The file may have been replaced; data_version is per-connection, so reopen
+            self._conn.close()
+            self._conn = None
+        return files, self._data_version()
+
+    def changed(self) -> bool:
+        """True once per observed change since the previous call."""
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        with self._lock:
+            if now < self._next_check:
+                return False
+            self._next_check = now + self.check_interval
+            current = self._current()
+            if self._signature is None:
+                self._signature = current
+                return False
+            if current != self._signature:
+                logger.info(f"Detected change to {self.db_path}")
+                self._signature = current
+                return True
+            return False
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def after_fork(self):
+        """Drop the parent's connection in a forked child (see ``SQLitePool.after_fork``)."""
+        self._lock = threading.Lock()
+        self._conn = None
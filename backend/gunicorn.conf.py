@@ -0,0 +1,41 @@
+"""gunicorn settings for running the API with several worker processes.
+
+    cd backend
+    gunicorn server:app
+
+gunicorn reads this file from the working directory.  The app is imported
+and warmed up (migrations, tokenizer, BMW model index, market statistics)
+once in the master process; the workers are forked from it and share that
+data copy-on-write.  Search results are shared through a SQLite cache file.
+On shutdown or a worker restart, in-flight requests get ``GRACEFUL_TIMEOUT``
+seconds to finish their OpenAI calls.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "127.0.0.1:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+# A search makes up to two sequential OpenAI calls of OPENAI_TIMEOUT each
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "300"))
+# Restart workers after this many requests (0 disables), spread by the jitter
+max_requests = int(os.getenv("MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+# Search results computed by one worker are served by all of them
+os.environ.setdefault(
+    "SEARCH_CACHE_PATH",
+    os.path.join(os.getenv("DATA_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"),
+                 "search_cache.db")
+)
+
+
+def when_ready(arbiter):
+    # preload_app has imported server.py in the master; load its data before the first fork
+    import server
+    server.init_logging()
+    server.preload()
+    # Workers open their own connections, and the master must not keep a
+    # database file open after ingest.py --swap replaces it
+    server.close_connections()
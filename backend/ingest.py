@@ -0,0 +1,342 @@
+"""Bulk loading of scraped listings into car_listings.db.
+
+Listings are streamed from a JSONL or CSV file (one listing per line/row,
+keyed by the ``cars`` column names) and upserted by ``id`` in batches, one
+transaction per batch.  Each row's ``content_hash`` is compared first, so
+unchanged listings are skipped without touching the table, its triggers or
+the full-text index.  Every batch that changes rows bumps the listings
+version counter in the same transaction, which keys the server's search
+cache.  Once all batches are in, the ``market_stats`` groups of the changed
+and deleted listings are recomputed in one more transaction.
+
+By default rows are written in place: the database is in WAL mode, so live
+searches keep reading while a batch commits.  With ``--swap`` the new
+contents are built in a copy next to the database and copied into it in a
+single transaction with the SQLite backup API, so searches see either the
+old or the new listings, never a mix.  ``--prune`` deletes listings missing from the input, for full
+refreshes.
+
+    python ingest.py listings.jsonl [--db path] [--prune] [--swap] [--batch-size 5000]
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+import listings_schema
+import market_stats
+from listings_schema import LISTING_COLUMNS, content_hash, features_json
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+# Bound on the ids bound into one "id IN (...)" lookup
+_LOOKUP_CHUNK = 500
+
+_UPSERT_SQL = f"""
+    INSERT INTO cars ({', '.join(LISTING_COLUMNS)}, features_json, content_hash)
+    VALUES ({', '.join('?' * (len(LISTING_COLUMNS) + 2))})
+    ON CONFLICT (id) DO UPDATE SET
+        {', '.join(f'{name} = excluded.{name}' for name in LISTING_COLUMNS if name != 'id')},
+        features_json = excluded.features_json,
+        content_hash = excluded.content_hash
+"""
+
+
+def _text(value):
+    # The scraper stores every column as text
+    if value is None or isinstance(value, str):
+        return value
+    return str(value)
+
+
+def read_listings(path: str, fmt: Optional[str] = None) -> Iterator[Dict]:
+    """Yield listings from a JSONL or CSV file (``-`` reads stdin).
+
+    The format is taken from the file extension unless ``fmt`` is given.
+    Unknown keys are ignored and missing columns are NULL.
+    """
+    if fmt is None:
+        extension = os.path.splitext(path)[1].lower()
+        fmt = "csv" if extension == ".csv" else "jsonl"
+    source = sys.stdin if path == "-" else open(path, encoding="utf-8", newline="")
+    try:
+        if fmt == "csv":
+            records = csv.DictReader(source)
+        else:
+            records = (json.loads(line) for line in source if line.strip())
+        for record in records:
+            yield {name: _text(record.get(name)) for name in LISTING_COLUMNS}
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+
+def _batches(listings: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    iterator = iter(listings)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _open_writer(db_path: str, synchronous: str = "NORMAL") -> sqlite3.Connection:
+    # Autocommit mode; each batch runs in an explicit transaction
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={synchronous}")
+    return conn
+
+
+def _prepare(db_path: str):
+    """Create the database if needed and bring it to the current schema."""
+    if not os.path.exists(db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            listings_schema.create_listings_table(conn)
+            conn.commit()
+        finally:
+            conn.close()
+    listings_schema.migrate(db_path)
+
+
+def _stored_hashes(conn, ids: List[str]) -> Dict[str, str]:
+    hashes = {}
+    for start in range(0, len(ids), _LOOKUP_CHUNK):
+        chunk = ids[start:start + _LOOKUP_CHUNK]
+        hashes.update(conn.execute(
+            f"SELECT id, content_hash FROM cars WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+        ).fetchall())
+    return hashes
+
+
+def _market_groups(conn, ids: List[str]) -> Set:
+    """Market groups of the stored listings among ``ids``."""
+    groups = set()
+    for start in range(0, len(ids), _LOOKUP_CHUNK):
+        chunk = ids[start:start + _LOOKUP_CHUNK]
+        groups.update(market_stats.group_key(*row) for row in conn.execute(
+            f"SELECT make_model, year_num, fuel_category FROM cars WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+        ))
+    return groups
+
+
+def _apply_batch(conn, batch: List[Dict], stats: Dict, groups: Set, track_seen: bool):
+    # Later rows win when the input repeats an id
+    by_id = {}
+    for listing in batch:
+        if listing["id"]:
+            by_id[listing["id"]] = listing
+        else:
+            stats["skipped"] += 1
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        ids = list(by_id)
+        stored = _stored_hashes(conn, ids)
+        if track_seen:
+            conn.executemany("INSERT OR IGNORE INTO temp.ingest_seen (id) VALUES (?)", ((id,) for id in ids))
+
+        rows = []
+        for id, listing in by_id.items():
+            digest = content_hash(listing)
+            if id in stored:
+                if stored[id] == digest:
+                    stats["unchanged"] += 1
+                    continue
+                stats["updated"] += 1
+            else:
+                stats["inserted"] += 1
+            rows.append([listing[name] for name in LISTING_COLUMNS] + [features_json(listing["options"]), digest])
+
+        if rows:
+            written = [row[0] for row in rows]
+            # Market groups the changed listings leave and join; the search
+            # columns they derive from are filled in by triggers
+            groups.update(_market_groups(conn, [id for id in written if id in stored]))
+            conn.executemany(_UPSERT_SQL, rows)
+            groups.update(_market_groups(conn, written))
+            stats["version"] = listings_schema.bump_version(conn)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _delete_unseen(conn, stats: Dict, groups: Set):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        unseen = "id IS NULL OR id NOT IN (SELECT id FROM temp.ingest_seen)"
+        groups.update(
+            market_stats.group_key(*row)
+            for row in conn.execute(f"SELECT DISTINCT make_model, year_num, fuel_category FROM cars WHERE {unseen}")
+        )
+        stats["deleted"] = conn.execute(f"DELETE FROM cars WHERE {unseen}").rowcount
+        if stats["deleted"]:
+            stats["version"] = listings_schema.bump_version(conn)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _refresh_market_stats(conn, groups: Set, stats: Dict):
+    started = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        refreshed = market_stats.refresh(conn, groups)
+        stats["version"] = listings_schema.bump_version(conn)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    logger.debug(f"Refreshed {refreshed} market groups in {time.perf_counter() - started:.2f}s")
+
+
+def _load(conn, listings: Iterable[Dict], batch_size: int, prune: bool) -> Dict:
+    stats = {"read": 0, "inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0, "deleted": 0,
+             "version": listings_schema.read_version(conn)}
+    if prune:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS ingest_seen (id TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM temp.ingest_seen")
+
+    groups = set()
+    for batch in _batches(listings, batch_size):
+        stats["read"] += len(batch)
+        _apply_batch(conn, batch, stats, groups, track_seen=prune)
+        logger.debug(f"Ingested {stats['read']} listings")
+
+    if prune:
+        if not stats["read"]:
+            # An empty or truncated input would otherwise delete every listing
+            raise ValueError("Refusing to prune: the input contained no listings")
+        _delete_unseen(conn, stats, groups)
+
+    if groups:
+        _refresh_market_stats(conn, groups, stats)
+    if stats["inserted"] or stats["deleted"]:
+        listings_schema.analyze(conn)
+    return stats
+
+
+def _remove_database(path: str):
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def _copy_into(tmp_path: str, db_path: str):
+    """Copy the finished database over the live one in a single transaction.
+
+    The SQLite backup API writes through the live database's WAL, so it
+    stays in WAL mode, searches keep reading the old contents until the copy
+    commits, and no stale ``-wal``/``-shm`` files can end up next to
+    different database contents.
+    """
+    source = sqlite3.connect(tmp_path)
+    target = sqlite3.connect(db_path, timeout=30)
+    try:
+        source.backup(target)
+        # The WAL now holds a full copy of the database; fold it back in if readers allow
+        busy, _, _ = target.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        if busy:
+            logger.info("Readers kept the WAL busy; it is checkpointed on a later commit")
+    finally:
+        source.close()
+        target.close()
+
+
+def _swap(listings: Iterable[Dict], db_path: str, batch_size: int, prune: bool) -> Dict:
+    tmp_path = db_path + ".ingest"
+    _remove_database(tmp_path)
+
+    if os.path.exists(db_path):
+        # Consistent snapshot of the live database, taken while it keeps serving
+        source = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        target = sqlite3.connect(tmp_path)
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+            target.close()
+    _prepare(tmp_path)
+
+    try:
+        # The copy is discarded on failure, so it doesn't need durable commits
+        conn = _open_writer(tmp_path, synchronous="OFF")
+        try:
+            stats = _load(conn, listings, batch_size, prune)
+        finally:
+            conn.close()
+
+        if os.path.exists(db_path):
+            _copy_into(tmp_path, db_path)
+        else:
+            # Nobody reads a database that doesn't exist yet; move the copy in place
+            conn = sqlite3.connect(tmp_path)
+            try:
+                conn.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                conn.close()
+            os.replace(tmp_path, db_path)
+            conn = sqlite3.connect(db_path)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+            finally:
+                conn.close()
+    finally:
+        _remove_database(tmp_path)
+    return stats
+
+
+def ingest(source, db_path: str = listings_schema.DEFAULT_DB_PATH, batch_size: int = DEFAULT_BATCH_SIZE,
+           prune: bool = False, swap: bool = False) -> Dict:
+    """Upsert listings into car_listings.db; returns counts and the new version.
+
+    ``source`` is a path (see ``read_listings``) or an iterable of listing dicts.
+    """
+    started = time.perf_counter()
+    listings = read_listings(source) if isinstance(source, str) else source
+
+    if swap:
+        stats = _swap(listings, db_path, batch_size, prune)
+    else:
+        _prepare(db_path)
+        conn = _open_writer(db_path)
+        try:
+            stats = _load(conn, listings, batch_size, prune)
+        finally:
+            conn.close()
+
+    logger.info(
+        f"Ingested {stats['read']} listings into {db_path} in {time.perf_counter() - started:.2f}s: "
+        f"{stats['inserted']} new, {stats['updated']} updated, {stats['unchanged']} unchanged, "
+        f"{stats['deleted']} deleted, {stats['skipped']} without id (version {stats['version']})"
+    )
+    return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Load scraped listings into car_listings.db")
+    parser.add_argument("source", help="JSONL or CSV file of listings, or - for stdin")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Input format (default: from the file extension)")
+    parser.add_argument("--db", default=listings_schema.DEFAULT_DB_PATH, help="Path to car_listings.db")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Listings per transaction")
+    parser.add_argument("--prune", action="store_true", help="Delete listings missing from the input")
+    parser.add_argument("--swap", action="store_true",
+                        help="Build the result in a copy and copy it into the database in one transaction")
+    args = parser.parse_args()
+
+    result = ingest(read_listings(args.source, args.format), args.db, args.batch_size, args.prune, args.swap)
+    print(f"Ingestion: {result}")
@@ -0,0 +1,646 @@
+"""Schema migrations for car_listings.db.
+
+The scraper writes prices, mileage and years as display strings ("12 500 €",
+"185 000 km", "2011 janvāris").  Filtering on those strings means re-parsing
+every row on every search, so this module materializes normalized search
+columns on ``cars``, indexes them and keeps them current with triggers.  It
+also maintains ``cars_fts``, an FTS5 index over the free-text columns used by
+keyword and feature filters, ``features_json``, the parsed feature list
+of each listing, the ``content_hash`` and version counter used by
+ingest.py for incremental loads, and the ``market_stats`` price distributions
+(see market_stats.py).
+
+Run it directly to migrate an existing database:
+
+    python listings_schema.py [--db path/to/car_listings.db] [--rebuild]
+
+Each run also parses feature lists for listings added since the last run.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+
+import market_stats
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(__file__), "data", "car_listings.db")
+
+# Columns written by the scraper, in table order
+LISTING_COLUMNS = ("id", "fetch_time", "url", "price", "make_model", "year", "engine", "transmission",
+                   "mileage", "color", "body_type", "tech_inspection", "description", "options", "image")
+# fetch_time changes on every scrape, so it does not count as a content change
+HASHED_COLUMNS = tuple(name for name in LISTING_COLUMNS if name != "fetch_time")
+
+# Single-row counters; listings_version is bumped by every ingestion that changes rows
+META_TABLE = "meta"
+VERSION_KEY = "listings_version"
+
+# SQL expressions that derive the normalized values from the raw scraped columns.
+# They are shared by the backfill, the triggers and the legacy query fallback so
+# every code path agrees on what e.g. "12 500 €" means.
+PRICE_EUR_SQL = "CAST(REPLACE(REPLACE(price, ' ', ''), '€', '') AS INTEGER)"
+MILEAGE_KM_SQL = "CAST(REPLACE(REPLACE(mileage, ' ', ''), 'km', '') AS INTEGER)"
+YEAR_NUM_SQL = "NULLIF(CAST(TRIM(year) AS INTEGER), 0)"
+COLOR_NORM_SQL = "LOWER(color)"
+
+# Conditions under which a normalized column differs from what the listing
+# scores parse out of the display string (every digit of the price and
+# mileage, the first four-digit run of the year), e.g. "12,500 €" or
+# "janvāris 2011".  Such rows are flagged in score_from_display and scored
+# from their display strings.
+DISPLAY_PARSE_DIFFERS_SQL = {
+    "price": "REPLACE(REPLACE(price, ' ', ''), '€', '') GLOB '*[^0-9]*'",
+    "mileage": "REPLACE(REPLACE(mileage, ' ', ''), 'km', '') GLOB '*[^0-9]*'",
+    "year": "NOT (TRIM(year) GLOB '[0-9][0-9][0-9][0-9]' OR TRIM(year) GLOB '[0-9][0-9][0-9][0-9][^0-9]*')",
+}
+SCORE_FROM_DISPLAY_SQL = "COALESCE({}, 0)".format(
+    " OR ".join(f"({condition})" for condition in DISPLAY_PARSE_DIFFERS_SQL.values())
+)
+# Scoring inputs of a row: the normalized columns, plus the display strings
+# of flagged rows (NULL elsewhere); see scoring.listing_columns
+SCORING_COLUMNS_SQL = "price_eur, mileage_km, year_num, " + ", ".join(
+    f"CASE WHEN score_from_display THEN {name} END AS {name}" for name in DISPLAY_PARSE_DIFFERS_SQL
+)
+
+# Fuels named in engine descriptions and the substrings that name them.  An
+# engine such as "2.0 Benzīns/elektrība" names several fuels; its category
+# lists all of them in this order, joined by "+" ("petrol+electric"), so a
+# fuel filter still finds every listing whose engine mentions that fuel.
+FUEL_TERMS = {
+    "petrol": ("benz", "petrol", "gas"),
+    "diesel": ("dīz", "diz", "diesel"),
+    "hybrid": ("hibr", "hybrid"),
+    "electric": ("elektr", "electric"),
+}
+COMBUSTION_FUELS = ("petrol", "diesel")
+
+FUEL_CATEGORY_SQL = "CASE WHEN engine IS NULL THEN NULL ELSE COALESCE(NULLIF(SUBSTR({}, 2), ''), 'other') END".format(
+    " || ".join(
+        "CASE WHEN {} THEN '+{}' ELSE '' END".format(
+            " OR ".join(f"LOWER(engine) LIKE '%{term}%'" for term in terms), fuel
+        )
+        for fuel, terms in FUEL_TERMS.items()
+    )
+)
+
+# Normalized column -> (type, derivation)
+SEARCH_COLUMNS = {
+    "price_eur": ("INTEGER", PRICE_EUR_SQL),
+    "mileage_km": ("INTEGER", MILEAGE_KM_SQL),
+    "year_num": ("INTEGER", YEAR_NUM_SQL),
+    "fuel_category": ("TEXT", FUEL_CATEGORY_SQL),
+    "color_norm": ("TEXT", COLOR_NORM_SQL),
+    "score_from_display": ("INTEGER", SCORE_FROM_DISPLAY_SQL),
+}
+
+SEARCH_INDEXES = {
+    "idx_cars_price_eur": "price_eur",
+    "idx_cars_mileage_km": "mileage_km",
+    "idx_cars_year_num": "year_num",
+    "idx_cars_fuel_price": "fuel_category, price_eur",
+    "idx_cars_color_price": "color_norm, price_eur",
+}
+
+# Free-text columns indexed by cars_fts.  remove_diacritics folds Latvian
+# letters so "panorāmas" and "panoramas" match each other.
+FTS_TABLE = "cars_fts"
+FTS_COLUMNS = ("description", "options", "engine")
+FTS_TOKENIZER = "unicode61 remove_diacritics 2"
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+def normalize_fuel(value):
+    """Map a free-text fuel description (e.g. "Dīzelis") to a fuel category.
+
+    Mirrors ``FUEL_CATEGORY_SQL`` so search filters and stored rows agree.
+    Returns None when the value does not name a known fuel.
+    """
+    if not value:
+        return None
+    text = value.lower()
+    fuels = [fuel for fuel, terms in FUEL_TERMS.items() if any(term in text for term in terms)]
+    return "+".join(fuels) or None
+
+
+def _fuel_combinations():
+    fuels = list(FUEL_TERMS)
+    for mask in range(1, 2 ** len(fuels)):
+        yield [fuel for bit, fuel in enumerate(fuels) if mask & (1 << bit)]
+
+
+def fuel_filter_categories(value):
+    """Stored fuel categories matching the fuel filter ``value``, or None.
+
+    A listing matches when its engine names every fuel in ``value``, so
+    "Benzīns" finds "2.0 Benzīns/elektrība" as well.  A hybrid filter also
+    finds engines combining a combustion fuel with electricity, and an
+    electric filter only finds engines without a combustion fuel.
+    """
+    category = normalize_fuel(value)
+    if category is None:
+        return None
+    wanted = set(category.split("+"))
+    categories = []
+    for fuels in _fuel_combinations():
+        named = set(fuels)
+        combustion = named.intersection(COMBUSTION_FUELS)
+        if wanted == {"hybrid"}:
+            matches = "hybrid" in named or (bool(combustion) and "electric" in named)
+        elif wanted == {"electric"}:
+            matches = "electric" in named and not combustion
+        else:
+            matches = wanted <= named
+        if matches:
+            categories.append("+".join(fuels))
+    return categories
+
+
+def parse_features(options):
+    """Parse a scraped options string into a canonical feature list.
+
+    The scraper writes ``"Section: item, item | Section: item"``.  Items are
+    whitespace-collapsed, stripped of trailing punctuation and deduplicated
+    case-insensitively, keeping the first spelling and order.
+    """
+    if not options:
+        return []
+    features = []
+    seen = set()
+    for section in str(options).split('|'):
+        if ':' not in section:
+            continue
+        for item in section.split(':', 1)[1].split(','):
+            feature = _WHITESPACE_RE.sub(' ', item).strip(' .;')
+            key = feature.casefold()
+            if feature and key not in seen:
+                seen.add(key)
+                features.append(feature)
+    return features
+
+
+def features_json(options):
+    """Serialized ``parse_features`` result as stored in ``cars.features_json``."""
+    return json.dumps(parse_features(options), ensure_ascii=False, separators=(",", ":"))
+
+
+def content_hash(listing):
+    """Hash of a listing's scraped content as stored in ``cars.content_hash``.
+
+    ``listing`` maps column names to values; missing columns count as NULL.
+    """
+    values = [listing.get(name) for name in HASHED_COLUMNS]
+    return hashlib.sha1(
+        json.dumps(values, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    ).hexdigest()
+
+
+def create_listings_table(conn):
+    """Create an empty ``cars`` table in the scraper's layout."""
+    columns = ", ".join(f"{name} TEXT" for name in LISTING_COLUMNS)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS cars ({columns}, PRIMARY KEY (id))")
+
+
+def has_version_counter(conn):
+    """True when the ``meta`` table with the listings version exists."""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (META_TABLE,)
+    ).fetchone()
+    return row is not None
+
+
+def read_version(conn):
+    """Current listings version counter."""
+    row = conn.execute(f"SELECT value FROM {META_TABLE} WHERE key = ?", (VERSION_KEY,)).fetchone()
+    return row[0] if row else 0
+
+
+def bump_version(conn):
+    """Increment the listings version counter; call inside the writing transaction."""
+    conn.execute(f"UPDATE {META_TABLE} SET value = value + 1 WHERE key = ?", (VERSION_KEY,))
+    return read_version(conn)
+
+
+def _assignments():
+    return ",\n            ".join(f"{name} = {expr}" for name, (_, expr) in SEARCH_COLUMNS.items())
+
+
+def existing_columns(conn, table="cars"):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def has_search_columns(conn):
+    """True when ``cars`` already carries every normalized search column."""
+    return set(SEARCH_COLUMNS).issubset(existing_columns(conn))
+
+
+def has_fulltext_index(conn):
+    """True when the ``cars_fts`` full-text index exists."""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    ).fetchone()
+    return row is not None
+
+
+def _fts_quote(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def fulltext_query(keywords=None, features=None):
+    """Build an FTS5 MATCH expression, or None when there is nothing to match.
+
+    Every keyword must appear as a word prefix ("panor" matches "panorāmas")
+    and every feature must appear as a phrase.  User text is always quoted so
+    FTS5 operators in it are treated as plain words.
+    """
+    terms = [_fts_quote(word) + "*" for word in (keywords or "").split()]
+    terms += [_fts_quote(feature.strip()) for feature in features or [] if feature and feature.strip()]
+    return " AND ".join(terms) or None
+
+
+def rebuild_fulltext_index(conn):
+    """Repopulate ``cars_fts`` from the ``cars`` table."""
+    conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def analyze(conn):
+    """Refresh the query planner statistics of ``cars``.
+
+    The FTS5 shadow tables are left without statistics: figures taken while
+    they were small make SQLite scan them on every later insert.
+    """
+    conn.execute("ANALYZE cars")
+    conn.execute(f"DELETE FROM sqlite_stat1 WHERE tbl LIKE '{FTS_TABLE}%'")
+
+
+def backfill_search_columns(conn):
+    """Recompute the normalized search columns for every row."""
+    conn.execute(f"UPDATE cars SET {_assignments()}")
+
+
+def backfill_feature_lists(conn, only_missing=True, batch_size=1000):
+    """Store parsed feature lists in ``features_json``; returns the rows updated.
+
+    By default only rows without a stored list (new or edited listings) are
+    processed.
+    """
+    where = "AND features_json IS NULL" if only_missing else ""
+    updated = 0
+    last_rowid = 0
+    while True:
+        rows = conn.execute(
+            f"SELECT rowid, options FROM cars WHERE rowid > ? {where} ORDER BY rowid LIMIT ?",
+            (last_rowid, batch_size)
+        ).fetchall()
+        if not rows:
+            return updated
+        conn.executemany(
+            "UPDATE cars SET features_json = ? WHERE rowid = ?",
+            [(features_json(options), rowid) for rowid, options in rows]
+        )
+        updated += len(rows)
+        last_rowid = rows[-1][0]
+
+
+def backfill_content_hashes(conn, batch_size=1000):
+    """Store ``content_hash`` for rows without one; returns the rows updated."""
+    columns = ", ".join(HASHED_COLUMNS)
+    updated = 0
+    last_rowid = 0
+    while True:
+        rows = conn.execute(
+            f"SELECT rowid, {columns} FROM cars WHERE rowid > ? AND content_hash IS NULL ORDER BY rowid LIMIT ?",
+            (last_rowid, batch_size)
+        ).fetchall()
+        if not rows:
+            return updated
+        conn.executemany(
+            "UPDATE cars SET content_hash = ? WHERE rowid = ?",
+            [(content_hash(dict(zip(HASHED_COLUMNS, row[1:]))), row[0]) for row in rows]
+        )
+        updated += len(rows)
+        last_rowid = rows[-1][0]
+
+
+def _changed(columns):
+    return " OR ".join(f"NEW.{name} IS NOT OLD.{name}" for name in columns)
+
+
+def _has_unique_id(conn):
+    for index in conn.execute("PRAGMA index_list(cars)"):
+        # (seq, name, unique, origin, partial)
+        if index[2] and not index[4]:
+            columns = [row[2] for row in conn.execute(f'PRAGMA index_info("{index[1]}")')]
+            if columns == ["id"]:
+                return True
+    return False
+
+
+def _create_search_insert_trigger(conn):
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS cars_search_columns_insert
+        AFTER INSERT ON cars
+        BEGIN
+            UPDATE cars SET
+            {_assignments()}
+            WHERE rowid = NEW.rowid;
+        END
+    """)
+
+
+def _create_search_update_trigger(conn):
+    conn.execute("DROP TRIGGER IF EXISTS cars_search_columns_update")
+    conn.execute(f"""
+        CREATE TRIGGER cars_search_columns_update
+        AFTER UPDATE OF price, mileage, year, engine, color ON cars
+        WHEN {_changed(("price", "mileage", "year", "engine", "color"))}
+        BEGIN
+            UPDATE cars SET
+            {_assignments()}
+            WHERE rowid = NEW.rowid;
+        END
+    """)
+
+
+def _migrate_search_columns(conn):
+    """Version 1: normalized search columns, indexes and sync triggers."""
+    columns = existing_columns(conn)
+    for name, (sql_type, _) in SEARCH_COLUMNS.items():
+        if name not in columns:
+            conn.execute(f"ALTER TABLE cars ADD COLUMN {name} {sql_type}")
+
+    backfill_search_columns(conn)
+
+    for index_name, index_columns in SEARCH_INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON cars ({index_columns})")
+
+    _create_search_insert_trigger(conn)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS cars_search_columns_update
+        AFTER UPDATE OF price, mileage, year, engine, color ON cars
+        BEGIN
+            UPDATE cars SET
+            {_assignments()}
+            WHERE rowid = NEW.rowid;
+        END
+    """)
+
+
+def _migrate_fulltext_index(conn):
+    """Version 2: FTS5 index over the free-text columns with sync triggers."""
+    columns = ", ".join(FTS_COLUMNS)
+    new_values = ", ".join(f"NEW.{name}" for name in FTS_COLUMNS)
+    old_values = ", ".join(f"OLD.{name}" for name in FTS_COLUMNS)
+
+    # External content table: the text stays in cars, the index stores only tokens
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            {columns},
+            content='cars',
+            content_rowid='rowid',
+            tokenize='{FTS_TOKENIZER}'
+        )
+    """)
+    rebuild_fulltext_index(conn)
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS cars_fts_insert
+        AFTER INSERT ON cars
+        BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (NEW.rowid, {new_values});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS cars_fts_delete
+        AFTER DELETE ON cars
+        BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', OLD.rowid, {old_values});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS cars_fts_update
+        AFTER UPDATE OF {columns} ON cars
+        BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', OLD.rowid, {old_values});
+            INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (NEW.rowid, {new_values});
+        END
+    """)
+
+
+def _migrate_feature_lists(conn):
+    """Version 3: pre-parsed feature lists.
+
+    Parsing needs Python, so the column is filled by ``backfill_feature_lists``
+    rather than a trigger; the trigger only clears stale lists when the
+    options text changes without the list being written alongside it.
+    """
+    if "features_json" not in existing_columns(conn):
+        conn.execute("ALTER TABLE cars ADD COLUMN features_json TEXT")
+
+    backfill_feature_lists(conn, only_missing=False)
+
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS cars_features_json_update
+        AFTER UPDATE OF options ON cars
+        WHEN NEW.options IS NOT OLD.options AND NEW.features_json IS OLD.features_json
+        BEGIN
+            UPDATE cars SET features_json = NULL WHERE rowid = NEW.rowid;
+        END
+    """)
+
+
+class DuplicateListingsError(sqlite3.IntegrityError):
+    """Raised when listing ids must be made unique but duplicate rows exist."""
+
+
+def count_duplicates(conn) -> int:
+    """Rows that repeat the id of another row."""
+    return conn.execute(
+        "SELECT COUNT(*) - COUNT(DISTINCT id) FROM cars WHERE id IS NOT NULL"
+    ).fetchone()[0]
+
+
+def remove_duplicates(conn) -> int:
+    """Delete every row with a repeated id except its newest copy; returns the rows deleted."""
+    return conn.execute("""
+        DELETE FROM cars
+        WHERE id IS NOT NULL
+        AND rowid NOT IN (SELECT MAX(rowid) FROM cars WHERE id IS NOT NULL GROUP BY id)
+    """).rowcount
+
+
+def _migrate_ingestion(conn):
+    """Version 4: unique listing ids, content hashes and the version counter.
+
+    Upserts by id need the id to be unique.  Duplicate rows left by earlier
+    full-file loads are not deleted here: the migration fails until they
+    are removed with ``--dedupe``.  An upsert assigns every column, so the
+    update triggers are recreated to re-derive the search columns and
+    re-index the text only when their inputs actually changed.
+    """
+    if not _has_unique_id(conn):
+        duplicates = count_duplicates(conn)
+        if duplicates:
+            logger.error(f"car_listings.db has {duplicates} rows with duplicate listing ids")
+            raise DuplicateListingsError(
+                f"{duplicates} duplicate listing rows prevent the unique id index; "
+                f"run 'python listings_schema.py --dedupe' to keep only the newest copy of each listing"
+            )
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_cars_id ON cars (id)")
+
+    if "content_hash" not in existing_columns(conn):
+        conn.execute("ALTER TABLE cars ADD COLUMN content_hash TEXT")
+
+    backfill_content_hashes(conn)
+
+    _create_search_update_trigger(conn)
+
+    columns = ", ".join(FTS_COLUMNS)
+    conn.execute("DROP TRIGGER IF EXISTS cars_fts_update")
+    conn.execute(f"""
+        CREATE TRIGGER cars_fts_update
+        AFTER UPDATE OF {columns} ON cars
+        WHEN {_changed(FTS_COLUMNS)}
+        BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns})
+            VALUES ('delete', OLD.rowid, {", ".join(f"OLD.{name}" for name in FTS_COLUMNS)});
+            INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (NEW.rowid, {", ".join(f"NEW.{name}" for name in FTS_COLUMNS)});
+        END
+    """)
+
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {META_TABLE} (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    conn.execute(f"INSERT OR IGNORE INTO {META_TABLE} (key, value) VALUES (?, 0)", (VERSION_KEY,))
+
+
+def _migrate_market_stats(conn):
+    """Version 5: per-(model, year, fuel) price and mileage distributions."""
+    market_stats.create_table(conn)
+    groups = market_stats.refresh(conn)
+    logger.info(f"Computed market statistics for {groups} model groups")
+
+
+def _migrate_fuel_combinations(conn):
+    """Version 6: fuel categories naming every fuel of combined engines.
+
+    The triggers hold a copy of ``FUEL_CATEGORY_SQL``, so they are recreated
+    along with the stored categories and the market statistics grouped by them.
+    """
+    conn.execute(f"UPDATE cars SET fuel_category = {FUEL_CATEGORY_SQL}")
+    conn.execute("DROP TRIGGER IF EXISTS cars_search_columns_insert")
+    _create_search_insert_trigger(conn)
+    _create_search_update_trigger(conn)
+    market_stats.refresh(conn)
+
+
+def _migrate_score_inputs(conn):
+    """Version 7: flag rows whose scores must be parsed from the display strings."""
+    if "score_from_display" not in existing_columns(conn):
+        conn.execute("ALTER TABLE cars ADD COLUMN score_from_display INTEGER")
+    conn.execute(f"UPDATE cars SET score_from_display = {SCORE_FROM_DISPLAY_SQL}")
+    conn.execute("DROP TRIGGER IF EXISTS cars_search_columns_insert")
+    _create_search_insert_trigger(conn)
+    _create_search_update_trigger(conn)
+
+
+# Ordered migrations; PRAGMA user_version records how many have been applied
+MIGRATIONS = [
+    _migrate_search_columns,
+    _migrate_fulltext_index,
+    _migrate_feature_lists,
+    _migrate_ingestion,
+    _migrate_market_stats,
+    _migrate_fuel_combinations,
+    _migrate_score_inputs,
+]
+
+
+def dedupe(db_path=DEFAULT_DB_PATH) -> int:
+    """Keep only the newest row of every listing id; returns the rows deleted."""
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"Database file not found at: {db_path}")
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            removed = remove_duplicates(conn)
+        logger.info(f"Removed {removed} duplicate listing rows")
+        return removed
+    finally:
+        conn.close()
+
+
+def migrate(db_path=DEFAULT_DB_PATH, rebuild=False, backfill_features=True):
+    """Bring car_listings.db up to the latest schema version.
+
+    Returns the resulting schema version.  With ``rebuild`` the normalized
+    columns are recomputed even when the schema is already current.  With
+    ``backfill_features`` listings added since the last run get their parsed
+    feature lists.  Raises ``DuplicateListingsError`` while duplicate
+    listing rows block migration 4; earlier migrations stay applied.
+    """
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"Database file not found at: {db_path}")
+
+    # Autocommit mode so each migration step runs in an explicit transaction,
+    # DDL included
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        changed = rebuild or version < len(MIGRATIONS)
+
+        for target, step in enumerate(MIGRATIONS[version:], start=version + 1):
+            started = time.perf_counter()
+            conn.execute("BEGIN")
+            try:
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {target}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            logger.info(f"Applied car_listings migration {target} ({step.__name__}) in {time.perf_counter() - started:.2f}s")
+            version = target
+
+        if rebuild:
+            conn.execute("BEGIN")
+            backfill_search_columns(conn)
+            if has_fulltext_index(conn):
+                rebuild_fulltext_index(conn)
+            if "features_json" in existing_columns(conn):
+                backfill_feature_lists(conn, only_missing=False)
+            if market_stats.has_table(conn):
+                market_stats.refresh(conn)
+            conn.execute("COMMIT")
+            logger.info("Rebuilt normalized search columns, full-text index, feature lists and market statistics")
+        elif backfill_features and "features_json" in existing_columns(conn):
+            conn.execute("BEGIN")
+            updated = backfill_feature_lists(conn)
+            conn.execute("COMMIT")
+            if updated:
+                logger.info(f"Parsed feature lists for {updated} listings")
+
+        if changed:
+            # Refresh planner statistics so the new indexes get picked up
+            analyze(conn)
+        return version
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Migrate car_listings.db to the latest search schema")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="Path to car_listings.db")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute normalized columns, the full-text index, feature lists and market statistics for every row")
+    parser.add_argument("--dedupe", action="store_true", help="Delete duplicate listing rows, keeping the newest copy of each id, before migrating")
+    args = parser.parse_args()
+
+    if args.dedupe:
+        print(f"Removed {dedupe(args.db)} duplicate listing rows")
+    print(f"car_listings.db schema version: {migrate(args.db, rebuild=args.rebuild)}")
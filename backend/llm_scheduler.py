@@ -0,0 +1,338 @@
+"""Outbound scheduling of OpenAI calls.
+
+Every completion passes through an ``LLMScheduler`` before it is sent:
+
+* a bounded priority queue holds calls waiting for capacity; when it is
+  full, or a call has waited ``max_wait`` seconds, ``SchedulerBusy`` is
+  raised instead of adding to the backlog;
+* requests-per-minute and tokens-per-minute token buckets keep the calls
+  sent under the account's rate limits;
+* the number of calls in flight adapts: it is halved when OpenAI answers
+  with a rate limit error and grows back by one per round of successful
+  calls, up to ``max_concurrency``;
+* rate limit, server and connection errors are retried with jittered
+  exponential backoff.  A ``Retry-After`` header from OpenAI is honored,
+  and it also pauses every other queued call for that long;
+* identical non-streamed calls in flight at the same time share a single
+  completion.
+
+The scheduler is used from the event loop only and needs no locks.
+"""
+import asyncio
+import hashlib
+import heapq
+import itertools
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerBusy(Exception):
+    """Raised when a call cannot be queued or waited too long for its turn."""
+
+
+def estimate_tokens(*texts: str, max_tokens: int = 0) -> int:
+    """Rate limit cost of a completion.
+
+    OpenAI counts roughly four characters per prompt token plus the full
+    ``max_tokens`` against the tokens-per-minute limit when a request
+    arrives, so this estimate needs no tokenizer.
+    """
+    return sum(len(text) for text in texts) // 4 + max_tokens
+
+
+def request_key(*parts) -> str:
+    """Coalescing key of a completion request."""
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds to wait given by the ``Retry-After`` headers of an API error."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) * scale)
+        except ValueError:
+            # HTTP dates are not used by the OpenAI API
+            continue
+    return None
+
+
+class TokenBucket:
+    """Refills ``per_minute`` units per minute, holding at most a minute's worth."""
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.clock = clock
+        self._level = self.capacity
+        self._updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` can be taken (0 when it can be taken now)."""
+        self._refill()
+        # Larger requests than a full bucket go through once it is full
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self._level) / self.rate)
+
+    def take(self, amount: float):
+        self._refill()
+        self._level -= min(amount, self.capacity)
+
+    @property
+    def level(self) -> float:
+        self._refill()
+        return self._level
+
+
+class _Waiter:
+    __slots__ = ("future", "tokens", "queued")
+
+    def __init__(self, future, tokens, queued):
+        self.future = future
+        self.tokens = tokens
+        self.queued = queued
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class LLMScheduler:
+    """Rate-limited, priority-ordered and adaptive gate for OpenAI calls.
+
+    Lower ``priority`` values are dispatched first, in arrival order within a
+    priority.  ``rpm`` and ``tpm`` of 0 disable the respective bucket.
+    ``retryable`` decides which exceptions are retried; rate limit errors
+    are recognized by their ``status_code`` of 429.  ``observe_wait`` is
+    called with the queueing time of every dispatched call.  ``clock``
+    should tick like the event loop's clock, which waits are scheduled on.
+    """
+
+    def __init__(self, max_concurrency: int = 8, rpm: int = 0, tpm: int = 0, max_queue: int = 100,
+                 max_wait: float = 60.0, max_retries: int = 3, backoff_base: float = 0.5,
+                 backoff_max: float = 20.0, max_retry_after: float = 30.0,
+                 retryable: Optional[Callable[[BaseException], bool]] = None,
+                 observe_wait: Optional[Callable[[float], None]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_concurrency = max(1, max_concurrency)
+        self.clock = clock
+        self.rpm = TokenBucket(rpm, clock) if rpm > 0 else None
+        self.tpm = TokenBucket(tpm, clock) if tpm > 0 else None
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        self.retryable = retryable or (lambda error: getattr(error, "status_code", None) in (429, 500, 502, 503, 504))
+        self.observe_wait = observe_wait
+
+        self._limit = float(self.max_concurrency)
+        # Bumped on every decrease; a rate limit only lowers the limit it was sent under
+        self._epoch = 0
+        self._active = 0
+        self._queue = []
+        self._sequence = itertools.count()
+        self._waiting = 0
+        self._paused_until = 0.0
+        self._timer = None
+        self._inflight = {}
+        self._stats = {
+            "dispatched": 0,
+            "rejected": 0,
+            "timed_out": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "coalesced": 0,
+        }
+
+    @property
+    def limit(self) -> int:
+        """Current number of calls allowed in flight."""
+        return max(1, int(self._limit))
+
+    def _dispatch(self):
+        """Hand out free slots to the queued calls in priority order."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._queue and self._active < self.limit:
+            _, _, waiter = self._queue[0]
+            if waiter.future.done():
+                # Cancelled or timed out while queued
+                heapq.heappop(self._queue)
+                continue
+            delay = self._paused_until - self.clock()
+            for bucket, amount in ((self.rpm, 1), (self.tpm, waiter.tokens)):
+                if bucket is not None:
+                    delay = max(delay, bucket.wait_time(amount))
+            if delay > 0:
+                # The head of the queue waits for its rate budget; nobody overtakes it
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self._queue)
+            if self.rpm is not None:
+                self.rpm.take(1)
+            if self.tpm is not None:
+                self.tpm.take(waiter.tokens)
+            self._active += 1
+            self._stats["dispatched"] += 1
+            waiter.future.set_result(self._epoch)
+
+    async def _acquire(self, tokens: int, priority: int) -> int:
+        if self._waiting >= self.max_queue:
+            self._stats["rejected"] += 1
+            raise SchedulerBusy(f"OpenAI call queue is full ({self.max_queue} waiting)")
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), tokens, self.clock())
+        heapq.heappush(self._queue, (priority, next(self._sequence), waiter))
+        self._waiting += 1
+        try:
+            self._dispatch()
+            try:
+                epoch = await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait)
+            except asyncio.TimeoutError:
+                self._stats["timed_out"] += 1
+                raise SchedulerBusy(f"Waited more than {self.max_wait}s for an OpenAI call slot")
+        except BaseException:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Dispatched just as the wait ended; give the slot back
+                self._release()
+            else:
+                waiter.future.cancel()
+            raise
+        finally:
+            self._waiting -= 1
+        if self.observe_wait is not None:
+            self.observe_wait(self.clock() - waiter.queued)
+        return epoch
+
+    def _release(self):
+        self._active -= 1
+        self._dispatch()
+
+    def _record(self, error: Optional[BaseException], epoch: int):
+        """Adapt the concurrency limit to the outcome of a call."""
+        if error is None:
+            # Additive increase: about one more slot per round of successful calls
+            self._limit = min(float(self.max_concurrency), self._limit + 1.0 / self._limit)
+        elif getattr(error, "status_code", None) == 429:
+            self._stats["rate_limited"] += 1
+            if epoch == self._epoch:
+                self._epoch += 1
+                self._limit = max(1.0, self._limit / 2)
+                logger.warning(f"OpenAI rate limit hit, lowering concurrency to {self.limit}")
+            wait = retry_after(error)
+            if wait:
+                self._paused_until = max(self._paused_until, self.clock() + min(wait, self.max_retry_after))
+
+    @asynccontextmanager
+    async def slot(self, tokens: int = 0, priority: int = 0):
+        """Hold one in-flight call for the duration of the ``with`` block.
+
+        Waits for its turn in the queue, for the rate budget of ``tokens``
+        (see ``estimate_tokens``) and for a free concurrency slot.  An
+        exception leaving the block adjusts the concurrency limit.
+        """
+        epoch = await self._acquire(tokens, priority)
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._record(error, epoch)
+            self._release()
+
+    def retry_delay(self, error: BaseException, attempt: int) -> Optional[float]:
+        """Seconds to wait before retry number ``attempt + 1`` after ``error``, or None to give up."""
+        if attempt >= self.max_retries or not self.retryable(error):
+            return None
+        wait = retry_after(error)
+        if wait is None:
+            # Full jitter spreads out the retries of calls that failed together
+            wait = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        elif wait > self.max_retry_after:
+            return None
+        else:
+            wait += random.uniform(0, min(1.0, wait / 10))
+        self._stats["retries"] += 1
+        return wait
+
+    async def _run(self, call: Callable[[], Awaitable[Any]], tokens: int, priority: int) -> Any:
+        for attempt in itertools.count():
+            try:
+                async with self.slot(tokens, priority):
+                    return await call()
+            except Exception as e:
+                delay = self.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                logger.warning(f"OpenAI call failed ({type(e).__name__}), retry {attempt + 1} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def run(self, call: Callable[[], Awaitable[Any]], tokens: int = 0, priority: int = 0,
+                  key: Optional[str] = None) -> Any:
+        """Await ``call()`` in a slot, retrying it on retryable errors.
+
+        Calls with the same ``key`` that overlap share one execution, which
+        is cancelled only when all of them have gone away.
+        """
+        if key is None:
+            return await self._run(call, tokens, priority)
+
+        flight = self._inflight.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(self._run(call, tokens, priority)))
+            flight.task.add_done_callback(lambda task: self._forget(key, flight))
+            self._inflight[key] = flight
+        else:
+            self._stats["coalesced"] += 1
+            logger.info("Joining in-flight OpenAI call with an identical request")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+                self._forget(key, flight)
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+
+    def stats(self) -> Dict:
+        stats = dict(self._stats)
+        stats.update({
+            "limit": self.limit,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._active,
+            "queued": self._waiting,
+            "paused_seconds": round(max(0.0, self._paused_until - self.clock()), 3),
+        })
+        if self.rpm is not None:
+            stats["rpm_available"] = round(self.rpm.level)
+        if self.tpm is not None:
+            stats["tpm_available"] = round(self.tpm.level)
+        return stats
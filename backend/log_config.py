@@ -0,0 +1,227 @@
+"""Logging off the request path.
+
+Records are handed to a ``QueueHandler`` and written by a ``QueueListener``
+thread, so file and console I/O never run on the event loop or request
+threads.  Log files rotate by size, and stale ones are deleted on startup.
+OpenAI request/response dumps are sampled, serialized and written by a
+background thread, and the dump directory is pruned to a size and file
+count cap.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Any, Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def _level(name: str, default: str) -> int:
+    value = os.getenv(name, default).upper()
+    level = logging.getLevelName(value)
+    return level if isinstance(level, int) else logging.getLevelName(default)
+
+
+def prune_logs(log_dir: str, max_age_days: float) -> int:
+    """Delete log files in ``log_dir`` last written more than ``max_age_days`` ago.
+
+    Worker processes log to files named after their pid, which no later
+    start reuses; this removes them (and their rotated copies) once they
+    are stale.  Returns the number of files deleted.
+    """
+    if max_age_days <= 0:
+        return 0
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for name in os.listdir(log_dir):
+        path = os.path.join(log_dir, name)
+        if not name.startswith(("app", "openai_data")) or ".log" not in name or not os.path.isfile(path):
+            continue
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            # Another worker pruned it first
+            pass
+    return removed
+
+
+def setup_logging(log_dir: str, suffix: str = "") -> logging.handlers.QueueListener:
+    """Route the root and ``openai_data`` loggers through a background writer.
+
+    Levels come from ``LOG_LEVEL`` (root) and ``OPENAI_LOG_LEVEL``
+    (``openai_data``); ``app.log`` and ``openai_data.log`` rotate at
+    ``LOG_MAX_BYTES`` keeping ``LOG_BACKUP_COUNT`` old files.  ``suffix`` is
+    appended to the file names, so worker processes don't rotate each
+    other's files.  Log files older than ``LOG_RETENTION_DAYS`` are deleted.
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    max_bytes = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    backups = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+    prune_logs(log_dir, float(os.getenv("LOG_RETENTION_DAYS", "14")))
+
+    app_file = logging.handlers.RotatingFileHandler(
+        os.path.join(log_dir, f"app{suffix}.log"), maxBytes=max_bytes, backupCount=backups, encoding="utf-8"
+    )
+    app_file.setFormatter(logging.Formatter(LOG_FORMAT))
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    openai_file = logging.handlers.RotatingFileHandler(
+        os.path.join(log_dir, f"openai_data{suffix}.log"), maxBytes=max_bytes, backupCount=backups, encoding="utf-8"
+    )
+    openai_file.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    # openai_data records only go to their own file
+    openai_file.addFilter(lambda record: record.name == "openai_data")
+    app_file.addFilter(lambda record: record.name != "openai_data")
+    console.addFilter(lambda record: record.name != "openai_data")
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue, app_file, console, openai_file, respect_handler_level=True
+    )
+
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(_level("LOG_LEVEL", "INFO"))
+
+    openai_logger = logging.getLogger("openai_data")
+    openai_logger.handlers[:] = []
+    openai_logger.setLevel(_level("OPENAI_LOG_LEVEL", "INFO"))
+
+    listener.start()
+
+    def stop_at_exit():
+        # The server's shutdown hook normally stops the listener first
+        if listener._thread is not None:
+            listener.stop()
+
+    atexit.register(stop_at_exit)
+    return listener
+
+
+class DebugDumper:
+    """Sampled, size-capped dumps of OpenAI requests and responses.
+
+    ``dump`` only decides whether to sample and enqueues the payload; the
+    writer thread serializes it and prunes the oldest dumps once the
+    directory exceeds ``max_bytes`` or ``max_files``.
+    """
+
+    def __init__(self, directory: str, sample_rate: float = 0.1,
+                 max_bytes: int = 50 * 1024 * 1024, max_files: int = 200):
+        self.directory = directory
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self._queue = queue.Queue(maxsize=100)
+        self._files = []
+        self._total_bytes = 0
+        self._thread = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            # Existing dumps count towards the cap, oldest first
+            paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)]
+            files = sorted((os.path.getmtime(p), p, os.path.getsize(p)) for p in paths if os.path.isfile(p))
+            self._files = [(path, size) for _, path, size in files]
+            self._total_bytes = sum(size for _, size in self._files)
+            self._thread = threading.Thread(target=self._run, name="debug-dumper", daemon=True)
+            self._thread.start()
+
+    def sample(self) -> bool:
+        """Decide whether to dump one unit of work, e.g. a search."""
+        return self.enabled and random.random() < self.sample_rate
+
+    def dump(self, kind: str, payload: Any, sampled: Optional[bool] = None) -> bool:
+        """Queue ``payload`` (str, or anything JSON-serializable) for writing.
+
+        Returns whether it was sampled.  Pass the result of ``sample()`` as
+        ``sampled`` to keep e.g. a response together with its request.
+        """
+        if sampled is None:
+            sampled = self.sample()
+        if not sampled:
+            return False
+        self._start()
+        try:
+            self._queue.put_nowait((kind, datetime.now(), payload))
+        except queue.Full:
+            self.dropped += 1
+        return True
+
+    def _run(self):
+        logger = logging.getLogger(__name__)
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            kind, created, payload = item
+            try:
+                if isinstance(payload, str):
+                    path = os.path.join(self.directory, f"{kind}_{created.strftime('%Y%m%d_%H%M%S_%f')}.txt")
+                    text = payload
+                else:
+                    path = os.path.join(self.directory, f"{kind}_{created.strftime('%Y%m%d_%H%M%S_%f')}.json")
+                    text = json.dumps(payload, indent=2, ensure_ascii=False)
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                size = os.path.getsize(path)
+                self._files.append((path, size))
+                self._total_bytes += size
+                self.written += 1
+                self._prune()
+                logger.debug(f"Saved {kind} dump to {path}")
+            except Exception as e:
+                logger.error(f"Failed to write {kind} dump: {e}")
+
+    def _prune(self):
+        while self._files and (self._total_bytes > self.max_bytes or len(self._files) > self.max_files):
+            path, size = self._files.pop(0)
+            self._total_bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def close(self, timeout: float = 5.0):
+        """Flush queued dumps and stop the writer thread."""
+        if self._thread is not None:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                return
+            self._thread.join(timeout)
+            self._thread = None
+
+    def after_fork(self):
+        """Forget the parent's writer thread and queue in a forked child."""
+        self._queue = queue.Queue(maxsize=100)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def stats(self):
+        return {
+            "sample_rate": self.sample_rate,
+            "written": self.written,
+            "dropped": self.dropped,
+            "files": len(self._files),
+            "bytes": self._total_bytes,
+        }
@@ -0,0 +1,165 @@
+"""Market price and mileage distributions per (model, year, fuel).
+
+``market_stats`` in car_listings.db holds, for every group of comparable
+listings, the listing count and 5%-step quantiles of price and mileage.
+It is rebuilt by the schema migration and refreshed group by group by
+ingest.py for the groups an ingestion touched.  At request time a listing's
+price is placed within its group's quantiles, giving the prompt (and the
+frontend) a deterministic value signal instead of leaving the comparison to
+the LLM.
+"""
+import bisect
+import json
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TABLE = "market_stats"
+QUANTILES = tuple(range(0, 101, 5))
+# Groups with fewer listings get no percentile
+MIN_LISTINGS = 5
+
+
+def model_key(make_model) -> str:
+    """Model part of a "BMW 320d" style make_model, case-folded."""
+    parts = str(make_model or "").split()
+    return " ".join(parts[1:] if len(parts) > 1 else parts).casefold()
+
+
+def group_key(make_model, year_num, fuel_category) -> Optional[Tuple[str, int, str]]:
+    """Market group of a listing, or None when it has no usable year."""
+    if not year_num:
+        return None
+    return model_key(make_model), int(year_num), fuel_category or ""
+
+
+def create_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABLE} (
+            model TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            fuel TEXT NOT NULL,
+            listings INTEGER NOT NULL,
+            price_quantiles TEXT NOT NULL,
+            mileage_quantiles TEXT NOT NULL,
+            PRIMARY KEY (model, year, fuel)
+        ) WITHOUT ROWID
+    """)
+
+
+def has_table(conn) -> bool:
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (TABLE,)).fetchone()
+    return row is not None
+
+
+def _quantiles(values) -> str:
+    return json.dumps([int(round(value)) for value in np.percentile(values, QUANTILES)])
+
+
+def _write(conn, grouped: Dict[Tuple, Tuple[list, list]], groups: Iterable[Tuple]):
+    rows = []
+    for group in groups:
+        prices, mileages = grouped.get(group, ([], []))
+        if prices:
+            rows.append((*group, len(prices), _quantiles(prices), _quantiles(mileages)))
+        else:
+            conn.execute(f"DELETE FROM {TABLE} WHERE model = ? AND year = ? AND fuel = ?", group)
+    conn.executemany(f"INSERT OR REPLACE INTO {TABLE} VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+
+def _collect(rows, grouped, wanted=None):
+    for make_model, year_num, fuel_category, price, mileage in rows:
+        group = group_key(make_model, year_num, fuel_category)
+        if group is None or (wanted is not None and group not in wanted):
+            continue
+        prices, mileages = grouped[group]
+        prices.append(price)
+        mileages.append(mileage or 0)
+
+
+_COLUMNS = "make_model, year_num, fuel_category, price_eur, mileage_km"
+
+
+def refresh(conn, groups: Optional[Set[Tuple]] = None) -> int:
+    """Recompute the given groups, or every group when ``groups`` is None.
+
+    Run inside the caller's transaction; returns the number of groups written.
+    """
+    grouped = defaultdict(lambda: ([], []))
+    if groups is None:
+        conn.execute(f"DELETE FROM {TABLE}")
+        _collect(conn.execute(f"SELECT {_COLUMNS} FROM cars WHERE price_eur > 0"), grouped)
+        groups = set(grouped)
+    else:
+        groups = {group for group in groups if group is not None}
+        # Listings of a group share year and fuel, which are indexed
+        for year, fuel in {(year, fuel) for _, year, fuel in groups}:
+            rows = conn.execute(
+                f"SELECT {_COLUMNS} FROM cars WHERE year_num = ? AND IFNULL(fuel_category, '') = ? AND price_eur > 0",
+                (year, fuel)
+            )
+            _collect(rows, grouped, groups)
+    _write(conn, grouped, groups)
+    return len(groups)
+
+
+def _percentile(quantiles, value) -> int:
+    """Percentile of ``value`` within a distribution given by its quantiles."""
+    if value <= quantiles[0]:
+        return 0
+    if value >= quantiles[-1]:
+        return 100
+    # Middle of the run of equal quantiles, then linear within the step
+    low = bisect.bisect_left(quantiles, value)
+    high = bisect.bisect_right(quantiles, value)
+    if low != high:
+        return round((QUANTILES[low] + QUANTILES[high - 1]) / 2)
+    left, right = quantiles[low - 1], quantiles[low]
+    step = QUANTILES[low] - QUANTILES[low - 1]
+    return round(QUANTILES[low - 1] + step * (value - left) / (right - left))
+
+
+class MarketStats:
+    """In-memory copy of ``market_stats``, reloaded when the database changes."""
+
+    def __init__(self):
+        self._groups = {}
+        self._signature = None
+
+    def load(self, conn, signature=None):
+        groups = {}
+        for model, year, fuel, listings, price_quantiles, mileage_quantiles in conn.execute(
+            f"SELECT model, year, fuel, listings, price_quantiles, mileage_quantiles FROM {TABLE}"
+        ):
+            if listings >= MIN_LISTINGS:
+                groups[(model, year, fuel)] = (listings, json.loads(price_quantiles), json.loads(mileage_quantiles))
+        self._groups = groups
+        self._signature = signature
+        logger.info(f"Loaded market statistics for {len(groups)} model groups")
+
+    def refresh_if_changed(self, conn, signature):
+        """Reload when ``signature`` (the database file signature) has changed."""
+        if signature != self._signature:
+            self.load(conn, signature)
+
+    def lookup(self, listing: Dict) -> Optional[Dict]:
+        """Market position of a listing row, or None without enough comparables."""
+        group = group_key(listing.get("make_model"), listing.get("year_num"), listing.get("fuel_category"))
+        entry = self._groups.get(group)
+        price = listing.get("price_eur")
+        if entry is None or not price:
+            return None
+        listings, price_quantiles, mileage_quantiles = entry
+        return {
+            "price_percentile": _percentile(price_quantiles, price),
+            "median_price": price_quantiles[len(QUANTILES) // 2],
+            "median_mileage": mileage_quantiles[len(QUANTILES) // 2],
+            "listings": listings,
+        }
+
+    def stats(self) -> Dict:
+        return {"groups": len(self._groups)}
@@ -0,0 +1,260 @@
+"""Minimal Prometheus-style metrics.
+
+Counters, gauges and histograms with labels, rendered in the Prometheus text
+exposition format by ``render``.  ``stage`` times a named part of a request:
+it feeds the ``autoadvisor_stage_seconds`` histogram and, when a request
+timing context is active, the request's ``Server-Timing`` header.
+"""
+import asyncio
+import bisect
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class _Value(_Metric):
+    """Single value per label set, updated directly or read from ``function``.
+
+    ``function`` returns a dict of label value tuples to values and is
+    called at scrape time, e.g. to export counts a component keeps itself.
+    """
+
+    def __init__(self, name, help, labelnames=(), function: Optional[Callable[[], Dict[Tuple, float]]] = None):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            try:
+                values = self._function()
+            except Exception:
+                values = {}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Counter(_Value):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Value):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [bucket counts..., sum, count]
+        self._values = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {state[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=(), function=None) -> Counter:
+        return self.register(Counter(name, help, labelnames, function))
+
+    def gauge(self, name, help, labelnames=(), function=None) -> Gauge:
+        return self.register(Gauge(name, help, labelnames, function))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "autoadvisor_stage_seconds", "Time spent in each search stage", ("stage",)
+)
+
+# Stage timings of the current request, for the Server-Timing header
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a search stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def record_stage(name: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+def server_timing_header(timings: Sequence[Tuple[str, float]]) -> str:
+    # Repeated stages (e.g. one OpenAI call per car) are summed
+    totals = {}
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency and, optionally, Server-Timing.
+
+    ``paths`` limits the ``path`` label to known routes so unknown URLs
+    don't create new series.  A request whose handler gave up with
+    ``asyncio.CancelledError`` after the client disconnected ends without a
+    response and is recorded with status ``disconnected``.
+    """
+
+    def __init__(self, app, requests: Histogram, paths: Callable[[], set], server_timing: bool = False):
+        self.app = app
+        self.requests = requests
+        self.paths = paths
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = []
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+        status = {"code": 500}
+        disconnected = False
+
+        async def receive_wrapper():
+            nonlocal disconnected
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected = True
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if self.server_timing and timings:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing_header(timings).encode("latin-1")))
+                    message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except asyncio.CancelledError:
+            if not disconnected:
+                raise
+            status["code"] = "disconnected"
+        finally:
+            _request_timings.reset(token)
+            path = scope["path"] if scope["path"] in self.paths() else "other"
+            self.requests.observe(
+                time.perf_counter() - started,
+                method=scope["method"], path=path, status=status["code"]
+            )
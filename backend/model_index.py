@@ -0,0 +1,237 @@
+"""In-memory index over the ``bmw_models`` table of bmw_cars.db.
+
+The table is small and effectively static, so it is loaded once and matched
+in Python instead of running one or two LIKE-heavy queries per listing.  The
+matcher reproduces the ranking of the original SQL:
+
+1. strict pass - model name match (exact normalized name, name substring or
+   base model number substring), filtered by fuel class and production years,
+   ordered by exact match, then name substring match, then shortest name;
+2. relaxed pass on a miss - base model number substring, shortest name first.
+"""
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MODEL_COLUMNS = """model_name, production_years, engine_specifications, engine_code,
+           fuel_type, positives, negatives, common_problems,
+           high_mileage_considerations, original_price_eur"""
+
+ELECTRIC_TERMS = ['electric', 'elektr', 'ev', 'hybrid', 'hibrid']
+
+_SQL_INT_RE = re.compile(r'\s*([+-]?\d+)')
+
+
+def _sql_int(text):
+    """Emulate SQLite's CAST(text AS INTEGER): leading integer prefix, else 0."""
+    match = _SQL_INT_RE.match(text)
+    return int(match.group(1)) if match else 0
+
+
+def empty_model_info():
+    return {
+        "positives": [],
+        "negatives": [],
+        "common_issues": "",
+        "high_mileage_considerations": ""
+    }
+
+
+def copy_model_info(info):
+    """Copy a model info dict so callers can't mutate shared index data."""
+    info = dict(info)
+    for key in ("positives", "negatives"):
+        if key in info:
+            info[key] = list(info[key])
+    return info
+
+
+def _row_to_model_info(row):
+    # Convert row to dict and ensure all fields are strings
+    return {
+        "model_name": str(row[0] or ""),
+        "production_years": str(row[1] or ""),
+        "engine_specifications": str(row[2] or ""),
+        "engine_code": str(row[3] or ""),
+        "fuel_type": str(row[4] or ""),
+        "positives": str(row[5] or "").split(". ") if row[5] else [],
+        "negatives": str(row[6] or "").split(". ") if row[6] else [],
+        "common_issues": str(row[7] or ""),
+        "high_mileage_considerations": str(row[8] or ""),
+        "original_price_eur": str(row[9] or "")
+    }
+
+
+def load_model_infos(conn):
+    """Model info dicts for every ``bmw_models`` row, in table order."""
+    rows = conn.execute(f"SELECT {MODEL_COLUMNS} FROM bmw_models ORDER BY rowid").fetchall()
+    return [_row_to_model_info(row) for row in rows]
+
+
+class ModelEntry:
+    """One ``bmw_models`` row with its match keys precomputed."""
+
+    __slots__ = ("order", "name", "lower_name", "norm_name", "length", "fuels",
+                 "production_years", "year_start", "year_end", "open_ended", "info")
+
+    def __init__(self, order, row):
+        self.order = order
+        self.name = row[0]
+        self.lower_name = row[0].lower() if row[0] is not None else None
+        self.norm_name = row[0].replace(' ', '').lower() if row[0] is not None else None
+        self.length = len(row[0]) if row[0] is not None else 0
+
+        # Fuel classes the strict pass can filter on
+        fuel_text = f"{(row[4] or '').lower()} {(row[2] or '').lower()}"
+        self.fuels = frozenset(fuel for fuel in ("electric", "diesel", "petrol") if fuel in fuel_text)
+
+        # Parsed production years, e.g. "2010-2015" or "2010-present"
+        self.production_years = row[1]
+        if row[1] is not None:
+            self.year_start = _sql_int(row[1][0:4])
+            self.year_end = _sql_int(row[1][5:9])
+            self.open_ended = "present" in row[1].lower()
+        else:
+            self.year_start = self.year_end = None
+            self.open_ended = False
+
+        self.info = _row_to_model_info(row)
+
+    def covers_year(self, year):
+        if self.production_years is None:
+            return False
+        if str(year) in self.production_years:
+            return True
+        return self.year_start <= year and (self.open_ended or self.year_end >= year)
+
+
+class ModelIndex:
+    """Indexed, reloadable snapshot of ``bmw_models``.
+
+    ``connect`` is a zero-argument callable returning a context manager that
+    yields a bmw_cars.db connection (e.g. ``get_bmw_cars_db``).
+    """
+
+    def __init__(self, connect):
+        self._connect = connect
+        self._lock = threading.Lock()
+        self._entries = []
+        self._by_norm_name = {}
+        self._by_number = {}
+        self.loaded_at = None
+
+    @property
+    def loaded(self):
+        return self.loaded_at is not None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def reload(self):
+        """(Re)load every model from bmw_cars.db and swap the index in."""
+        started = time.perf_counter()
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT {MODEL_COLUMNS} FROM bmw_models ORDER BY rowid").fetchall()
+
+        entries = [ModelEntry(order, row) for order, row in enumerate(rows)]
+        by_norm_name = {}
+        by_number = {}
+        for entry in entries:
+            if entry.lower_name is None:
+                continue
+            by_norm_name.setdefault(entry.norm_name, []).append(entry)
+            # Every 3-digit window, so "m340i" is reachable under "340"
+            numbers = {entry.lower_name[i:i + 3] for i in range(len(entry.lower_name) - 2)
+                       if entry.lower_name[i:i + 3].isdigit()}
+            for number in numbers:
+                by_number.setdefault(number, []).append(entry)
+
+        with self._lock:
+            self._entries = entries
+            self._by_norm_name = by_norm_name
+            self._by_number = by_number
+            self.loaded_at = time.time()
+
+        logger.info(f"Loaded {len(entries)} BMW models into the model index in {(time.perf_counter() - started) * 1000:.1f}ms")
+        return len(entries)
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.reload()
+
+    def _name_candidates(self, clean_model, name_like, base_model):
+        entries = self._entries
+        candidates = {id(e): e for e in self._by_norm_name.get(clean_model, ())}
+        if len(base_model) == 3 and base_model.isdigit():
+            candidates.update((id(e), e) for e in self._by_number.get(base_model, ()))
+            base_scan = False
+        else:
+            base_scan = True
+        for entry in entries:
+            if entry.lower_name is not None and (
+                name_like in entry.lower_name or (base_scan and base_model in entry.lower_name)
+            ):
+                candidates[id(entry)] = entry
+        return candidates.values()
+
+    def _relaxed_candidates(self, base_model):
+        if len(base_model) == 3 and base_model.isdigit():
+            return self._by_number.get(base_model, ())
+        return [e for e in self._entries if e.lower_name is not None and base_model in e.lower_name]
+
+    def match(self, model_name, year=None, engine_type=None):
+        """Return the best matching model info dict, or None when nothing matches."""
+        self.ensure_loaded()
+
+        # Clean and normalize inputs
+        clean_model = re.sub(r'[^a-zA-Z0-9]', '', model_name).lower()
+        name_like = model_name.lower()
+        if engine_type:
+            engine_type = engine_type.lower()
+
+        # Extract base model number (e.g., "320" from "320i")
+        base_model = re.search(r'(\d{3})', clean_model)
+        base_model = base_model.group(1) if base_model else clean_model
+
+        # Fuel class required by the strict pass
+        required_fuel = None
+        if engine_type:
+            if any(term in engine_type for term in ELECTRIC_TERMS):
+                required_fuel = "electric"
+            elif 'diesel' in engine_type or 'd' in engine_type:
+                required_fuel = "diesel"
+            elif 'petrol' in engine_type or 'benzin' in engine_type or 'gasoline' in engine_type:
+                required_fuel = "petrol"
+
+        best = None
+        best_key = None
+        for entry in self._name_candidates(clean_model, name_like, base_model):
+            if required_fuel and required_fuel not in entry.fuels:
+                continue
+            if year and not entry.covers_year(year):
+                continue
+            if entry.norm_name == clean_model:
+                rank = 1
+            elif name_like in entry.lower_name:
+                rank = 2
+            else:
+                rank = 3
+            key = (rank, entry.length, entry.order)
+            if best_key is None or key < best_key:
+                best, best_key = entry, key
+
+        # If no match with all criteria, try more relaxed search
+        if best is None:
+            logger.debug(f"No match found with strict criteria, trying relaxed search for {model_name}")
+            for entry in self._relaxed_candidates(base_model):
+                key = (entry.length, entry.order)
+                if best_key is None or key < best_key:
+                    best, best_key = entry, key
+
+        if best is None:
+            return None
+
+        return copy_model_info(best.info)
@@ -0,0 +1,235 @@
+"""Precomputed model-level analysis sections.
+
+``commonProblems``, ``highMileageConcerns``, ``checklistItems`` and
+``comparison`` depend only on the ``bmw_models`` entry, not on the listing.
+An offline batch job generates them once per entry and stores them in a
+separate local database; at request time the LLM is asked only for the
+listing-specific fields and the stored sections are merged in.
+
+Entries are keyed by a hash of the model info they were generated from, so
+editing a ``bmw_models`` row simply makes its old entry unused.
+
+Run the batch job after bmw_cars.db changes:
+
+    python model_insights.py [--bmw-db path] [--db path] [--force] [--prune]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from analysis_schema import ModelInsights, response_format
+from db_pool import file_signature
+from model_index import load_model_infos
+from prompts import model_insight_prompt
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+DEFAULT_DB_PATH = os.path.join(DATA_DIR, "model_insights.db")
+DEFAULT_BMW_DB_PATH = os.path.join(DATA_DIR, "bmw_cars.db")
+
+
+def model_info_hash(info: Dict) -> str:
+    """Stable key of a model info dict."""
+    payload = json.dumps(info, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ModelInsightStore:
+    """Read side of the insight database, held in memory.
+
+    The file is re-read when its signature changes, checked at most every
+    ``check_interval`` seconds, so a finished batch run is picked up without
+    a restart.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, check_interval: float = 5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._insights = {}
+        self._signature = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._insights)
+
+    def load(self) -> int:
+        """(Re)load every stored entry; a missing database means no entries."""
+        signature = file_signature(self.path)
+        insights = {}
+        if os.path.exists(self.path):
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            try:
+                for source_hash, value in conn.execute("SELECT source_hash, insights FROM model_insights"):
+                    insights[source_hash] = json.loads(value)
+            except sqlite3.OperationalError as e:
+                logger.error(f"Could not read model insights from {self.path}: {e}")
+            finally:
+                conn.close()
+        with self._lock:
+            self._insights = insights
+            self._signature = signature
+            self._checked_at = time.monotonic()
+        logger.info(f"Loaded {len(insights)} precomputed model insights")
+        return len(insights)
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        # Only one of the concurrent callers checks the file per interval
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+        if file_signature(self.path) != self._signature:
+            self.load()
+
+    def get(self, model_info: Dict) -> Optional[Dict]:
+        """Stored sections for ``model_info``, or None when not generated yet.
+
+        May stat and reload the database, so async callers run it in the
+        threadpool.
+        """
+        if not model_info or not model_info.get("model_name"):
+            return None
+        self._maybe_reload()
+        insights = self._insights.get(model_info_hash(model_info))
+        # Called from several threadpool workers at once
+        with self._lock:
+            if insights is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if insights is None:
+            return None
+        return {key: list(value) if isinstance(value, list) else value for key, value in insights.items()}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"size": len(self._insights), "hits": self.hits, "misses": self.misses}
+
+
+def open_insight_db(path: str = DEFAULT_DB_PATH):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS model_insights (
+            source_hash TEXT PRIMARY KEY,
+            model_name TEXT NOT NULL,
+            insights TEXT NOT NULL,
+            llm_model TEXT NOT NULL,
+            generated_at REAL NOT NULL
+        )
+    """)
+    conn.commit()
+    return conn
+
+
+async def generate_insights(client, model_info: Dict, llm_model: str = "gpt-4o-mini") -> Dict:
+    """Ask the LLM for the model-level sections of one ``bmw_models`` entry."""
+    response = await client.chat.completions.create(
+        model=llm_model,
+        messages=[
+            {"role": "system", "content": model_insight_prompt},
+            {"role": "user", "content": json.dumps({"model_info": model_info}, ensure_ascii=False)}
+        ],
+        temperature=0.2,
+        max_tokens=4000,
+        response_format=response_format(ModelInsights)
+    )
+    return ModelInsights.model_validate_json(response.choices[0].message.content).model_dump()
+
+
+async def build_insights(client, bmw_db_path: str = DEFAULT_BMW_DB_PATH, db_path: str = DEFAULT_DB_PATH,
+                         force: bool = False, prune: bool = False, concurrency: int = 4,
+                         llm_model: str = "gpt-4o-mini") -> Dict:
+    """Generate insights for every model that has none yet (all models with ``force``)."""
+    bmw_conn = sqlite3.connect(f"file:{bmw_db_path}?mode=ro", uri=True)
+    try:
+        infos = load_model_infos(bmw_conn)
+    finally:
+        bmw_conn.close()
+
+    conn = open_insight_db(db_path)
+    try:
+        existing = {row[0] for row in conn.execute("SELECT source_hash FROM model_insights")}
+        models = {}
+        for info in infos:
+            if info["model_name"]:
+                models.setdefault(model_info_hash(info), info)
+        todo = {h: info for h, info in models.items() if force or h not in existing}
+        logger.info(f"{len(models)} BMW models, generating insights for {len(todo)}")
+
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        failed = 0
+
+        async def generate(source_hash, info):
+            nonlocal failed
+            async with semaphore:
+                try:
+                    insights = await generate_insights(client, info, llm_model)
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"Failed to generate insights for {info['model_name']}: {e}")
+                    return
+            conn.execute(
+                "INSERT OR REPLACE INTO model_insights (source_hash, model_name, insights, llm_model, generated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (source_hash, info["model_name"], json.dumps(insights, ensure_ascii=False), llm_model, time.time())
+            )
+            conn.commit()
+            logger.info(f"Generated insights for {info['model_name']}")
+
+        await asyncio.gather(*(generate(h, info) for h, info in todo.items()))
+
+        pruned = 0
+        if prune:
+            stale = existing - set(models)
+            conn.executemany("DELETE FROM model_insights WHERE source_hash = ?", [(h,) for h in stale])
+            conn.commit()
+            pruned = len(stale)
+
+        return {"models": len(models), "generated": len(todo) - failed, "failed": failed, "pruned": pruned}
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from openai import AsyncOpenAI
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Generate per-model analysis sections for the BMW model database")
+    parser.add_argument("--bmw-db", default=DEFAULT_BMW_DB_PATH, help="Path to bmw_cars.db")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="Path to the model insights database")
+    parser.add_argument("--force", action="store_true", help="Regenerate insights for every model")
+    parser.add_argument("--prune", action="store_true", help="Delete insights of models no longer in bmw_cars.db")
+    parser.add_argument("--concurrency", type=int, default=4, help="Parallel OpenAI requests")
+    parser.add_argument("--model", default="gpt-4o-mini", help="OpenAI model to use")
+    args = parser.parse_args()
+
+    if not os.getenv("OPENAI_API_KEY"):
+        raise SystemExit("OPENAI_API_KEY is not set")
+
+    result = asyncio.run(build_insights(
+        AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY")),
+        bmw_db_path=args.bmw_db,
+        db_path=args.db,
+        force=args.force,
+        prune=args.prune,
+        concurrency=args.concurrency,
+        llm_model=args.model
+    ))
+    print(f"Model insights: {result}")
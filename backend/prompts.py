@@ -0,0 +1,214 @@
+"""Prompts for the analysis completions.
+
+The analysis object is described field by field so the single-call, per-car
+and model insight prompts can each ask for exactly the fields they need with
+the same wording.
+"""
+
+# Example value of each analysis field, in response order
+FIELD_EXAMPLES = {
+    "matchScore": """<score 0-100>""",
+    "strengths": """[
+        "Detalizēts pozitīvs aspekts 1 ar tehniskām vai funkciju priekšrocībām",
+        "Detalizēts pozitīvs aspekts 2 ar tehniskām vai funkciju priekšrocībām",
+        "Detalizēts pozitīvs aspekts 3 ar tehniskām vai funkciju priekšrocībām"
+    ]""",
+    "considerations": """[
+        "Konkrēts apsvērums 1 ar tehniskām detaļām",
+        "Konkrēts apsvērums 2 ar tehniskām detaļām",
+        "Konkrēts apsvērums 3 ar tehniskām detaļām"
+    ]""",
+    "commonProblems": '"Detalizēta, modelim specifiska analīze par zināmajām problēmām no BMW datubāzes."',
+    "highMileageConcerns": '"Visaptveroša analīze par vecuma problēmām un apkopes prasībām no BMW datubāzes."',
+    "valueAssessment": '"Detalizēta tirgus analīze, ieskaitot cenu salīdzinājumu ar līdzīgiem sludinājumiem."',
+    "recommendation": '"Pamatots skaidrojums, kāpēc šis auto tika izvēlēts."',
+    "checklistItems": """[
+        "DETALIZĒTI aprakstīt konkrētas problēmas, kas raksturīgas šim modelim:",
+        "1. Aprakstīt specifiskas dzinēja problēmas un to pazīmes",
+        "2. Aprakstīt transmisijas problēmas un to pazīmes",
+        "3. Aprakstīt elektronikas problēmas un to pazīmes",
+        "4. Aprakstīt piekares problēmas un to pazīmes",
+        "5. Detalizēta, modelim specifiska analīze par zināmajām problēmām no BMW datubāzes"
+    ]""",
+    "comparison": '''"DETALIZĒTI aprakstīt šī modeļa problēmas pie liela nobraukuma:\n
+    1. Dzinēja problēmas pie liela nobraukuma\n
+    2. Transmisijas problēmas pie liela nobraukuma\n
+    3. Piekares problēmas pie liela nobraukuma\n
+    4. Elektronikas problēmas pie liela nobraukuma\n
+    5. Visaptveroša analīze par vecuma problēmām un apkopes prasībām no BMW datubāzes."''',
+    "summary": '''"DETALIZĒTS kopsavilkums, kas OBLIGĀTI ietver:\n
+    1. Pozitīvie aspekti: [detalizēts uzskaitījums ar tehniskām detaļām]\n
+    2. Negatīvie aspekti: [detalizēts uzskaitījums ar tehniskām detaļām]\n
+    3. Match Score pamatojums: [detalizēts skaidrojums, kā tika aprēķināts rezultāts]\n
+    4. Rekomendācija: [detalizēts skaidrojums, kāpēc šis auto ir Top 3]\n
+    5. Galvenie riski: [detalizēts uzskaitījums ar tehniskām detaļām]\n
+    6. OBLIGĀTI: Norādīt, ka auto jāapskata klātienē un jāpārbauda profesionālā autoservisā pirms pirkšanas."''',
+}
+
+# Extra instructions for fields that need them
+FIELD_GUIDELINES = {
+    "valueAssessment": """For valueAssessment:
+- OBLIGĀTI izmantot market datus, ja tie ir pieejami
+- market.price_percentile is the listing's price percentile among market.listings comparable listings (same model, year and fuel type): 20 means cheaper than 80% of them
+- Compare the price with market.median_price and the mileage with market.median_mileage
+- A price well below the median together with high mileage or a short technical inspection is not automatically a good deal
+- Without market data, base the assessment on model_info.original_price_eur, age and mileage""",
+    "checklistItems": """For checklistItems:
+- OBLIGĀTI izmantot model_info.common_issues datus no BMW datubāzes
+- Focus on model-specific problems from the BMW database
+- Describe specific symptoms and signs of each problem
+- Include estimated repair costs where relevant
+- Mention specific components that commonly fail
+- Provide detailed inspection points for each issue""",
+    "comparison": """For comparison:
+- OBLIGĀTI izmantot model_info.high_mileage_considerations datus no BMW datubāzes
+- Focus on high mileage problems specific to this model
+- Detail what typically fails at different mileage points
+- Include maintenance requirements at high mileage
+- Describe specific symptoms of age-related issues
+- Provide cost estimates for major repairs""",
+    "summary": """For summary:
+- Provide a detailed technical analysis of pros and cons
+- Explain exactly how the match score was calculated
+- Detail why this car made it to the top 3
+- Include specific risks and potential issues
+- Give clear recommendations based on technical facts
+- OBLIGĀTI: Norādīt, ka auto jāapskata klātienē un jāpārbauda profesionālā autoservisā pirms pirkšanas.""",
+}
+
+ANALYSIS_FIELDS = tuple(FIELD_EXAMPLES)
+# Fields that depend only on the BMW model, not on the individual listing
+MODEL_INSIGHT_FIELDS = ("commonProblems", "highMileageConcerns", "checklistItems", "comparison")
+LISTING_FIELDS = tuple(field for field in ANALYSIS_FIELDS if field not in MODEL_INSIGHT_FIELDS)
+
+
+def object_format(fields) -> str:
+    return "{\n    " + ",\n    ".join(f'"{field}": {FIELD_EXAMPLES[field]}' for field in fields) + "\n}"
+
+
+def analysis_format(fields=ANALYSIS_FIELDS, car_id: str = "<car id>") -> str:
+    return '{"id": "' + car_id + '", "analysis": ' + object_format(fields) + "}"
+
+
+def guidelines(fields) -> str:
+    return "\n\n".join(FIELD_GUIDELINES[field] for field in fields if field in FIELD_GUIDELINES)
+
+
+def model_info_rule(compact: bool) -> str:
+    """Where the listings' BMW database information is, for the prompt encoding in use."""
+    if compact:
+        return ('The BMW database information for each listing is in the "models" object; a listing\'s "model" '
+                'field is its key there. Listings without a "model" field have no database entry.')
+    return 'The BMW database information for each listing is in its "model_info" field.'
+
+
+# Single call: select the top 3 listings and analyze them
+def system_prompt(compact: bool = True) -> str:
+    return """You are a BMW expert. Analyze the provided car listings and their model information to select and analyze the top 3 best matches.
+IMPORTANT: 
+1. You MUST ONLY select car IDs from the "valid_ids" list provided in the data. DO NOT make up or use any IDs that are not in this list.
+2. You MUST select EXACTLY 3 cars from the valid IDs.
+3. Provide ALL responses in Latvian language.
+4. """ + model_info_rule(compact) + """
+
+Your analysis should be thorough and specific to each car, considering:
+1. Technical specifications and their implications
+2. Known model-specific issues and maintenance requirements from the BMW model database
+3. Value proposition and market position
+4. Real-world ownership experience and costs
+5. Specific features and benefits
+
+IMPORTANT: 
+- Use ONLY factual information from the provided listing and BMW database
+- DO NOT make assumptions or add information that isn't in the data
+- ALL responses must be in Latvian language
+- Include the recommendation in the summary field
+- Be VERY specific about model-specific problems and high mileage issues
+- Provide detailed explanations for match scores
+
+Your response MUST be a JSON object in this EXACT format (do not deviate):
+
+{"selected_ids": ["id1", "id2", "id3"], "analyses": [<analysis of id1>, <analysis of id2>, <analysis of id3>]}
+
+where each analysis has this structure:
+
+""" + analysis_format(car_id="id1") + """
+
+Important:
+1. ALWAYS include exactly 3 cars
+2. ALWAYS follow the exact format above
+3. NEVER skip any fields
+4. Make ALL analyses specific to the exact model, year, and configuration
+5. Include technical details and specific features in your analysis
+6. ALL text must be in Latvian language
+7. Use ONLY factual information from the provided listing and BMW database
+8. Be EXTREMELY detailed about model-specific problems and high mileage issues
+9. Provide DETAILED explanations for match scores and recommendations
+
+""" + guidelines(ANALYSIS_FIELDS)
+
+# Two-stage pipeline, stage one: pick the shortlist from compact listing summaries
+def shortlist_prompt(compact: bool = True) -> str:
+    return """You are a BMW expert. Select the 3 car listings that best match the search criteria.
+IMPORTANT: 
+1. You MUST ONLY select car IDs from the "valid_ids" list provided in the data. DO NOT make up or use any IDs that are not in this list.
+2. You MUST select EXACTLY 3 cars from the valid IDs.
+3. Weigh price, mileage, age, equipment and the match_score against the known strengths and weaknesses of each model. Where a listing has "market" data, its price_percentile places the price among comparable listings (same model, year and fuel type).
+4. """ + model_info_rule(compact) + """
+
+Respond with ONLY a JSON object in this format:
+
+{"selected_ids": ["id1", "id2", "id3"]}"""
+
+# Two-stage pipeline, stage two: detailed analysis of one shortlisted car
+car_analysis_prompt = """You are a BMW expert. A buyer shortlisted the provided car listing as one of the top 3 matches for their search criteria. Analyze it together with its model information from the BMW database.
+
+IMPORTANT: 
+- Use ONLY factual information from the provided listing and BMW database
+- DO NOT make assumptions or add information that isn't in the data
+- ALL responses must be in Latvian language
+- Include the recommendation in the summary field
+- Be VERY specific about model-specific problems and high mileage issues
+- Provide detailed explanations for match scores
+- NEVER skip any fields
+
+Your response MUST be a JSON object in this EXACT format (do not deviate), with "id" set to the listing's id:
+
+""" + analysis_format() + """
+
+""" + guidelines(ANALYSIS_FIELDS)
+
+# Two-stage pipeline, stage two when the model-level sections are cached:
+# only the listing-specific fields are generated
+car_listing_prompt = """You are a BMW expert. A buyer shortlisted the provided car listing as one of the top 3 matches for their search criteria. Analyze it together with its model information from the BMW database.
+Model-level sections (common problems, high mileage concerns, inspection checklist) are prepared separately; focus on what is specific to THIS listing: its price, mileage, age, equipment and condition.
+
+IMPORTANT: 
+- Use ONLY factual information from the provided listing and BMW database
+- DO NOT make assumptions or add information that isn't in the data
+- ALL responses must be in Latvian language
+- Include the recommendation in the summary field
+- Provide detailed explanations for match scores
+- NEVER skip any fields
+
+Your response MUST be a JSON object in this EXACT format (do not deviate), with "id" set to the listing's id:
+
+""" + analysis_format(LISTING_FIELDS) + """
+
+""" + guidelines(LISTING_FIELDS)
+
+# Offline batch job: model-level sections generated once per BMW database entry
+model_insight_prompt = """You are a BMW expert. Using the provided entry from the BMW model database, write the model-level sections of a used car analysis. They are shown for every listing of this model, so DO NOT mention any particular listing, price or mileage reading.
+
+IMPORTANT: 
+- Use ONLY factual information from the BMW database entry
+- DO NOT make assumptions or add information that isn't in the data
+- ALL responses must be in Latvian language
+- Be VERY specific about model-specific problems and high mileage issues
+- NEVER skip any fields
+
+Your response MUST be a JSON object in this EXACT format (do not deviate):
+
+""" + object_format(MODEL_INSIGHT_FIELDS) + """
+
+""" + guidelines(MODEL_INSIGHT_FIELDS)
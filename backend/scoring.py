@@ -0,0 +1,144 @@
+"""Vectorized listing scores.
+
+Both scores are computed for a whole result set at once from columnar NumPy
+arrays.  The formulas are the ones the per-listing scoring used:
+
+* priority score - 50% age (linear from 1950), 50% log-scale mileage;
+* match score - 40% price, 35% mileage, 25% age, each relative to the
+  user's filter ranges where given, clamped to 30-100.
+
+Missing years are passed as 0.
+"""
+import re
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+_YEAR_RE = re.compile(r'(\d{4})')
+
+MATCH_WEIGHTS = {
+    'price': 0.40,
+    'mileage': 0.35,
+    'age': 0.25
+}
+
+
+def _digits(value) -> int:
+    return int(''.join(filter(str.isdigit, str(value))) or 0)
+
+
+def _year(value) -> int:
+    match = _YEAR_RE.search(str(value)) if value else None
+    return int(match.group(1)) if match else 0
+
+
+def _value(listing: Dict, display: str, normalized: str, parse) -> int:
+    text = listing.get(display)
+    if text is not None:
+        return parse(text)
+    value = listing.get(normalized)
+    return value if value is not None else 0
+
+
+def listing_columns(listings: Iterable[Dict]) -> Dict[str, np.ndarray]:
+    """Columnar price / mileage / year arrays for a list of listing dicts.
+
+    Parses the ``price``, ``mileage`` and ``year`` display strings when the
+    row has them and otherwise uses the normalized ``price_eur``,
+    ``mileage_km`` and ``year_num`` columns (see
+    ``listings_schema.SCORING_COLUMNS_SQL``); missing values are 0.
+    """
+    prices, mileages, years = [], [], []
+    for listing in listings:
+        prices.append(_value(listing, "price", "price_eur", _digits))
+        mileages.append(_value(listing, "mileage", "mileage_km", _digits))
+        years.append(_value(listing, "year", "year_num", _year))
+    return {
+        "price": np.asarray(prices, dtype=np.float64),
+        "mileage": np.asarray(mileages, dtype=np.float64),
+        "year": np.asarray(years, dtype=np.float64),
+    }
+
+
+def priority_scores(mileage: np.ndarray, year: np.ndarray, current_year: int) -> np.ndarray:
+    """Priority scores (0-100) from mileage and year arrays."""
+    year_score = np.where(year > 0, (year - 1950) / (current_year - 1950), 0.0)
+
+    # Logarithmic scale for mileage: 50,000km -> 0.80, 150,000km -> 0.60,
+    # 300,000km -> 0.40, 500,000km -> 0.20, never below 0.1
+    safe_mileage = np.where(mileage > 0, mileage, 1.0)
+    mileage_score = np.where(mileage > 0, np.maximum(0.1, 1 - (np.log10(safe_mileage) - 4) / 3), 1.0)
+
+    return (year_score * 0.5 + mileage_score * 0.5) * 100
+
+
+def _range_scores(values: np.ndarray, low: Optional[int], high: Optional[int]) -> np.ndarray:
+    """Score values against a user range; lower values score better."""
+    if low is not None and high is not None:
+        span = high - low
+        if span <= 0:
+            return np.zeros_like(values)
+        inside = 0.7 + 0.3 * (1 - ((values - low) / span))
+        distance = np.minimum(np.abs(values - low), np.abs(values - high))
+        outside = np.maximum(0, 0.7 - (distance / span))
+        return np.where((values >= low) & (values <= high), inside, outside)
+    if low is not None:
+        # Only min provided - anything above it scores well
+        if low == 0:
+            return np.full_like(values, 0.8)
+        return np.where(values >= low, 0.8, np.maximum(0.3, 0.8 * (values / low)))
+    # Only max provided - lower is better (callers exclude high == 0)
+    return np.where(
+        values <= high,
+        0.7 + 0.3 * (1 - (values / high)),
+        np.maximum(0, 0.7 - 0.5 * ((values - high) / high))
+    )
+
+
+def match_scores(price: np.ndarray, mileage: np.ndarray, year: np.ndarray, filters, current_year: int) -> np.ndarray:
+    """Match scores (30-100) for every listing against the search filters."""
+    price_min = filters.price.min if filters.price else None
+    price_max = filters.price.max if filters.price else None
+    mileage_min = filters.mileage.min if filters.mileage else None
+    mileage_max = filters.mileage.max if filters.mileage else None
+
+    # A max-only range of 0 would divide by zero; such searches get a neutral score
+    if (price_min is None and price_max == 0) or (mileage_min is None and mileage_max == 0):
+        return np.full(price.shape, 50.0)
+
+    # Price score - better score for lower price within range
+    if price_min is not None or price_max is not None:
+        price_score = _range_scores(price, price_min, price_max)
+    else:
+        # No price filter: €5,000 -> 1.0, €10,000 -> 0.9, €20,000 -> 0.8, never below 0.5
+        price_score = np.maximum(0.5, 1 - (np.log10(np.maximum(5000, price)) - np.log10(5000)) / 3)
+
+    # Mileage score - lower is better
+    if mileage_min is not None or mileage_max is not None:
+        mileage_score = _range_scores(mileage, mileage_min, mileage_max)
+    else:
+        # No mileage filter: 0km -> 1.0, 100,000km -> 0.6, never below 0.4
+        mileage_score = np.maximum(0.4, 1 - (np.log10(np.maximum(1, mileage)) - 3) / 5)
+
+    # Age score - newer is better
+    age = current_year - year
+    if price_max is not None:
+        # More expensive cars are expected to be newer
+        expected_max_age = 5 + (15 * (1 - min(price_max, 50000) / 50000))
+        dated = np.maximum(0.3, 1 - (age / expected_max_age))
+    else:
+        # 0-3 years: 1.0-0.9, 4-7 years: 0.9-0.7, 8-15 years: 0.7-0.4, 16+ years: 0.4-0.3
+        dated = np.select(
+            [age <= 3, age <= 7, age <= 15],
+            [1.0 - (age / 30), 0.9 - ((age - 3) / 40), 0.7 - ((age - 7) / 40)],
+            np.maximum(0.3, 0.4 - ((age - 15) / 100))
+        )
+    # No year information - below average score
+    age_score = np.where(year > 0, dated, 0.4)
+
+    score = (
+        price_score * MATCH_WEIGHTS['price']
+        + mileage_score * MATCH_WEIGHTS['mileage']
+        + age_score * MATCH_WEIGHTS['age']
+    )
+    return np.clip(score * 100, 30, 100)
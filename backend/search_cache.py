@@ -0,0 +1,293 @@
+"""Result cache for /api/search keyed by canonicalized filters.
+
+Entries live in an in-memory LRU and, optionally, in a local SQLite file so
+they survive restarts and can be shared by several worker processes.
+Concurrent identical searches are coalesced into a single computation; with
+the SQLite file that also holds across processes, through a lease row taken
+by the process that computes a key while the others poll for its result.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from cache import LRUCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+
+def canonicalize_filters(filters: Dict) -> str:
+    """Stable JSON for a filters payload: sorted keys, trimmed and casefolded
+    strings, empty strings treated as unset."""
+    def normalize(value):
+        if isinstance(value, dict):
+            return {k: normalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [normalize(v) for v in value]
+        if isinstance(value, str):
+            value = value.strip().casefold()
+            return value or None
+        return value
+
+    return json.dumps(normalize(filters), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SearchResultCache:
+    """TTL + LRU cache of search responses with single-flight deduplication.
+
+    ``lease_ttl`` bounds how long other processes wait on a computation whose
+    process died without releasing its lease; it should exceed the slowest
+    search.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 1800, path: Optional[str] = None,
+                 lease_ttl: float = 300, poll_interval: float = 0.25):
+        self.enabled = maxsize > 0
+        self.ttl = ttl
+        self.path = path
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self._memory = LRUCache(maxsize=max(1, maxsize), ttl=ttl)
+        self._inflight = {}
+        self._disk_lock = threading.Lock()
+        self._disk = None
+        self._owner = uuid.uuid4().hex
+        self.coalesced = 0
+        self.coalesced_remote = 0
+        self.disk_hits = 0
+        if self.enabled and path:
+            self._open_disk()
+
+    def _open_disk(self):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS search_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS search_cache_leases (
+                    key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("DELETE FROM search_cache WHERE expires_at <= ?", (time.time(),))
+            conn.execute("DELETE FROM search_cache_leases WHERE expires_at <= ?", (time.time(),))
+            self._disk = conn
+        except sqlite3.Error as e:
+            logger.error(f"Could not open search cache at {self.path}, using memory only: {e}")
+            self._disk = None
+
+    @staticmethod
+    def make_key(filters: Dict, version: str) -> str:
+        payload = f"{version}|{canonicalize_filters(filters)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _disk_get(self, key: str) -> Any:
+        with self._disk_lock:
+            row = self._disk.execute(
+                "SELECT value, expires_at FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return MISSING
+        return json.loads(row[0]), row[1]
+
+    def _disk_set(self, key: str, value: Any):
+        with self._disk_lock:
+            self._disk.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time() + self.ttl)
+            )
+
+    def _disk_claim(self, key: str) -> bool:
+        """Take the lease on computing ``key`` unless another process holds a live one."""
+        now = time.time()
+        with self._disk_lock:
+            cursor = self._disk.execute(
+                """
+                INSERT INTO search_cache_leases (key, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE search_cache_leases.expires_at <= ? OR search_cache_leases.owner = excluded.owner
+                """,
+                (key, self._owner, now + self.lease_ttl, now)
+            )
+            return cursor.rowcount > 0
+
+    def _disk_release(self, key: str):
+        try:
+            with self._disk_lock:
+                if self._disk is not None:
+                    self._disk.execute(
+                        "DELETE FROM search_cache_leases WHERE key = ? AND owner = ?", (key, self._owner)
+                    )
+        except sqlite3.Error as e:
+            logger.error(f"Search cache lease release failed: {e}")
+
+    async def _await_other_process(self, key: str) -> Any:
+        """Wait while another process computes ``key``.
+
+        Returns its result, or ``MISSING`` once this process holds the lease
+        and should compute the value itself.
+        """
+        waited = False
+        while True:
+            try:
+                claimed = await asyncio.to_thread(self._disk_claim, key)
+                # Read after claiming: the previous holder stores its result before releasing
+                found = await asyncio.to_thread(self._disk_get, key)
+            except (sqlite3.Error, ValueError) as e:
+                logger.error(f"Search cache lease failed, computing locally: {e}")
+                return MISSING
+            if found is not MISSING:
+                value, expires_at = found
+                self._memory.set(key, value, ttl=max(0.001, expires_at - time.time()))
+                return value
+            if claimed:
+                return MISSING
+            if not waited:
+                waited = True
+                self.coalesced_remote += 1
+                logger.info("Waiting for another worker running a search with identical filters")
+            await asyncio.sleep(self.poll_interval)
+
+    async def get(self, key: str) -> Any:
+        if not self.enabled:
+            return MISSING
+        value = self._memory.get(key)
+        if value is not MISSING or self._disk is None:
+            return value
+        try:
+            found = await asyncio.to_thread(self._disk_get, key)
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Search cache read failed: {e}")
+            return MISSING
+        if found is MISSING:
+            return MISSING
+        value, expires_at = found
+        self.disk_hits += 1
+        self._memory.set(key, value, ttl=max(0.001, expires_at - time.time()))
+        return value
+
+    async def set(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        self._memory.set(key, value)
+        if self._disk is not None:
+            try:
+                await asyncio.to_thread(self._disk_set, key, value)
+            except sqlite3.Error as e:
+                logger.error(f"Search cache write failed: {e}")
+
+    async def _run(self, key: str, compute: Callable[[], Awaitable[Any]]):
+        try:
+            if self._disk is not None:
+                value = await self._await_other_process(key)
+                if value is not MISSING:
+                    return value
+            value = await compute()
+            await self.set(key, value)
+            return value
+        finally:
+            flight = self._inflight.get(key)
+            if flight is not None and flight.task is asyncio.current_task():
+                del self._inflight[key]
+            if self._disk is not None:
+                # Not awaited, so a cancelled computation still releases its lease
+                asyncio.get_running_loop().run_in_executor(None, self._disk_release, key)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for ``key`` or compute it once.
+
+        Callers asking for a key that is already being computed wait for that
+        computation instead of starting their own.  The computation is
+        cancelled only when every waiting caller has gone away.
+        """
+        if not self.enabled:
+            return await compute()
+
+        value = await self.get(key)
+        if value is not MISSING:
+            return value
+
+        flight = self._inflight.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(self._run(key, compute)))
+            self._inflight[key] = flight
+        else:
+            self.coalesced += 1
+            logger.info("Joining in-flight search with identical filters")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+
+    def clear(self):
+        self._memory.clear()
+        if self._disk is not None:
+            with self._disk_lock:
+                self._disk.execute("DELETE FROM search_cache")
+
+    async def drain(self, timeout: float):
+        """Wait up to ``timeout`` seconds for in-flight computations to finish."""
+        tasks = [flight.task for flight in self._inflight.values()]
+        if not tasks:
+            return
+        logger.info(f"Waiting for {len(tasks)} in-flight searches to finish")
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"Cancelled {len(pending)} searches still running after {timeout}s")
+
+    def close(self):
+        if self._disk is not None:
+            with self._disk_lock:
+                self._disk.close()
+            self._disk = None
+
+    def after_fork(self):
+        """Reopen the SQLite tier in a forked child instead of sharing the parent's connection."""
+        self._disk_lock = threading.Lock()
+        self._disk = None
+        self._inflight = {}
+        self._owner = uuid.uuid4().hex
+        if self.enabled and self.path:
+            self._open_disk()
+
+    def stats(self) -> Dict:
+        stats = self._memory.stats()
+        stats.update({
+            "enabled": self.enabled,
+            "persistent": self._disk is not None,
+            "disk_hits": self.disk_hits,
+            "coalesced": self.coalesced,
+            "coalesced_remote": self.coalesced_remote,
+            "in_flight": len(self._inflight),
+        })
+        return stats
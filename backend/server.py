@@ -1,172 +1,180 @@
-from fastapi import FastAPI, HTTPException
+import time
+# Start of the import, for the import time reported by /api/ready
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse, Response, JSONResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
 from typing import Optional, List, Dict, Union
 import sqlite3
 import os
 import json
-from openai import OpenAI
+import sys
+import importlib.util
+import threading
 from dotenv import load_dotenv
 import re
 from datetime import datetime
 import traceback
 import logging
-import time
-import tiktoken
-import openai
 import random
 import math
+import asyncio
+import numpy as np
+import heapq
+import hmac
+import itertools
+from contextlib import contextmanager, asynccontextmanager, aclosing
+from db_pool import SQLitePool, DatabaseWatcher, file_signature
+from cache import LRUCache, MISSING
+import listings_schema
+import market_stats
+from token_budget import TokenBudget
+from prompt_builder import PromptBuilder, compact_dumps
+from search_cache import SearchResultCache
+from stream_parser import AnalysisStreamParser
+from prompts import system_prompt, shortlist_prompt, car_analysis_prompt, car_listing_prompt
+from analysis_schema import (
+    AnalysisBlock, AnalysisResponse, ListingAnalysisBlock, ShortlistResponse, response_format
+)
+from model_insights import ModelInsightStore
+from scoring import listing_columns, priority_scores, match_scores
+from model_index import ModelIndex, empty_model_info, copy_model_info
+from log_config import setup_logging, DebugDumper
+from llm_scheduler import LLMScheduler, SchedulerBusy, estimate_tokens, request_key
+from metrics import registry, stage, record_stage, MetricsMiddleware, CONTENT_TYPE
 
-# Set up logging
-import os
-from datetime import datetime
+def lazy_module(name: str):
+    """Import module ``name`` on first attribute access instead of now."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
 
-# Create logs directory if it doesn't exist
-log_dir = os.path.join(os.path.dirname(__file__), "logs")
-os.makedirs(log_dir, exist_ok=True)
-
-# Create log filename with timestamp
-log_filename = os.path.join(log_dir, f"app_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
-
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_filename),
-        logging.StreamHandler()  # Keep console output
-    ]
-)
+# The OpenAI SDK is about half of this module's import time; it is loaded by
+# the startup warmup (or the first error check that needs it)
+openai = lazy_module("openai")
+
+# Logging: records are written by a background listener thread, started by
+# init_logging() on startup so importing the module creates no log files
+log_dir = os.getenv("LOG_DIR") or os.path.join(os.path.dirname(__file__), "logs")
+log_listener = None
 logger = logging.getLogger(__name__)
 
-# Create a separate logger for OpenAI data
+def init_logging():
+    """Start the background log writer unless it is already running."""
+    global log_listener
+    if log_listener is None:
+        log_listener = setup_logging(log_dir)
+
+def flush_logs():
+    """Write out queued debug dumps and log records and stop the writer threads."""
+    global log_listener
+    debug_dumper.close()
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
+# Separate logger for the data sent to and received from OpenAI
 openai_logger = logging.getLogger('openai_data')
-openai_log_filename = os.path.join(log_dir, f"openai_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
-openai_handler = logging.FileHandler(openai_log_filename)
-openai_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
-openai_logger.addHandler(openai_handler)
-openai_logger.setLevel(logging.INFO)
+
+# Sampled, size-capped dumps of full OpenAI requests and responses
+debug_dumper = DebugDumper(
+    os.path.join(log_dir, "debug"),
+    sample_rate=float(os.getenv("DEBUG_DUMP_SAMPLE_RATE", "0.1")),
+    max_bytes=int(float(os.getenv("DEBUG_DUMP_MAX_MB", "50")) * 1024 * 1024),
+    max_files=int(os.getenv("DEBUG_DUMP_MAX_FILES", "200"))
+)
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Get OpenAI API key from environment variables
+# Get OpenAI API key from environment variables; checked on startup
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OpenAI API key not found. Please set OPENAI_API_KEY in your environment variables.")
-
-# Initialize OpenAI client
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-# Define system prompt for OpenAI
-system_prompt = """You are a BMW expert. Analyze the provided car listings and their model information to select and analyze the top 3 best matches.
-IMPORTANT: 
-1. You MUST ONLY select car IDs from the "valid_ids" list provided in the data. DO NOT make up or use any IDs that are not in this list.
-2. You MUST select EXACTLY 3 cars from the valid IDs.
-3. Provide ALL responses in Latvian language.
-
-Your analysis should be thorough and specific to each car, considering:
-1. Technical specifications and their implications
-2. Known model-specific issues and maintenance requirements from the BMW model database
-3. Value proposition and market position
-4. Real-world ownership experience and costs
-5. Specific features and benefits
-
-IMPORTANT: 
-- Use ONLY factual information from the provided listing and BMW database
-- DO NOT make assumptions or add information that isn't in the data
-- ALL responses must be in Latvian language
-- Include the recommendation in the summary field
-- Be VERY specific about model-specific problems and high mileage issues
-- Provide detailed explanations for match scores
-
-Your response MUST follow this EXACT format (do not deviate):
-
-SELECTED_IDS: [id1, id2, id3]
-
-{"id": "id1", "analysis": {
-    "matchScore": <score 0-100>,
-    "strengths": [
-        "Detalizēts pozitīvs aspekts 1 ar tehniskām vai funkciju priekšrocībām",
-        "Detalizēts pozitīvs aspekts 2 ar tehniskām vai funkciju priekšrocībām",
-        "Detalizēts pozitīvs aspekts 3 ar tehniskām vai funkciju priekšrocībām"
-    ],
-    "considerations": [
-        "Konkrēts apsvērums 1 ar tehniskām detaļām",
-        "Konkrēts apsvērums 2 ar tehniskām detaļām",
-        "Konkrēts apsvērums 3 ar tehniskām detaļām"
-    ],
-    "commonProblems": "Detalizēta, modelim specifiska analīze par zināmajām problēmām no BMW datubāzes.",
-    "highMileageConcerns": "Visaptveroša analīze par vecuma problēmām un apkopes prasībām no BMW datubāzes.",
-    "valueAssessment": "Detalizēta tirgus analīze, ieskaitot cenu salīdzinājumu.",
-    "recommendation": "Pamatots skaidrojums, kāpēc šis auto tika izvēlēts.",
-    "checklistItems": [
-        "DETALIZĒTI aprakstīt konkrētas problēmas, kas raksturīgas šim modelim:",
-        "1. Aprakstīt specifiskas dzinēja problēmas un to pazīmes",
-        "2. Aprakstīt transmisijas problēmas un to pazīmes",
-        "3. Aprakstīt elektronikas problēmas un to pazīmes",
-        "4. Aprakstīt piekares problēmas un to pazīmes",
-        "5. Detalizēta, modelim specifiska analīze par zināmajām problēmām no BMW datubāzes"
-    ],
-    "comparison": "DETALIZĒTI aprakstīt šī modeļa problēmas pie liela nobraukuma:\n
-    1. Dzinēja problēmas pie liela nobraukuma\n
-    2. Transmisijas problēmas pie liela nobraukuma\n
-    3. Piekares problēmas pie liela nobraukuma\n
-    4. Elektronikas problēmas pie liela nobraukuma\n
-    5. Visaptveroša analīze par vecuma problēmām un apkopes prasībām no BMW datubāzes.",
-    "summary": "DETALIZĒTS kopsavilkums, kas OBLIGĀTI ietver:\n
-    1. Pozitīvie aspekti: [detalizēts uzskaitījums ar tehniskām detaļām]\n
-    2. Negatīvie aspekti: [detalizēts uzskaitījums ar tehniskām detaļām]\n
-    3. Match Score pamatojums: [detalizēts skaidrojums, kā tika aprēķināts rezultāts]\n
-    4. Rekomendācija: [detalizēts skaidrojums, kāpēc šis auto ir Top 3]\n
-    5. Galvenie riski: [detalizēts uzskaitījums ar tehniskām detaļām]\n
-    6. OBLIGĀTI: Norādīt, ka auto jāapskata klātienē un jāpārbauda profesionālā autoservisā pirms pirkšanas."
-}}
-
-{"id": "id2", "analysis": {
-    // Same detailed structure as above
-}}
-
-{"id": "id3", "analysis": {
-    // Same detailed structure as above
-}}
-
-Important:
-1. ALWAYS include exactly 3 cars
-2. ALWAYS follow the exact format above
-3. NEVER skip any fields
-4. Make ALL analyses specific to the exact model, year, and configuration
-5. Include technical details and specific features in your analysis
-6. ALL text must be in Latvian language
-7. Use ONLY factual information from the provided listing and BMW database
-8. Be EXTREMELY detailed about model-specific problems and high mileage issues
-9. Provide DETAILED explanations for match scores and recommendations
-
-For checklistItems:
-- OBLIGĀTI izmantot model_info.common_issues datus no BMW datubāzes
-- Focus on model-specific problems from the BMW database
-- Describe specific symptoms and signs of each problem
-- Include estimated repair costs where relevant
-- Mention specific components that commonly fail
-- Provide detailed inspection points for each issue
-
-For comparison:
-- OBLIGĀTI izmantot model_info.high_mileage_considerations datus no BMW datubāzes
-- Focus on high mileage problems specific to this model
-- Detail what typically fails at different mileage points
-- Include maintenance requirements at high mileage
-- Describe specific symptoms of age-related issues
-- Provide cost estimates for major repairs
-
-For summary:
-- Provide a detailed technical analysis of pros and cons
-- Explain exactly how the match score was calculated
-- Detail why this car made it to the top 3
-- Include specific risks and potential issues
-- Give clear recommendations based on technical facts
-- OBLIGĀTI: Norādīt, ka auto jāapskata klātienē un jāpārbauda profesionālā autoservisā pirms pirkšanas."""
-
-app = FastAPI()
+
+# OpenAI call limits
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "0"))  # Requests per minute, 0 disables
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "0"))  # Tokens per minute, 0 disables
+OPENAI_MAX_QUEUE = int(os.getenv("OPENAI_MAX_QUEUE", "100"))
+OPENAI_QUEUE_TIMEOUT = float(os.getenv("OPENAI_QUEUE_TIMEOUT", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_MAX_RETRY_AFTER = float(os.getenv("OPENAI_MAX_RETRY_AFTER", "30"))
+DISCONNECT_POLL_INTERVAL = 1.0
+
+# OpenAI client, created by the warmup or on first use (tests and benchmarks
+# assign their own)
+client = None
+_client_lock = threading.Lock()
+
+def openai_client():
+    """The shared OpenAI client, created on first use."""
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                if not OPENAI_API_KEY:
+                    raise ValueError("OpenAI API key not found. Please set OPENAI_API_KEY in your environment variables.")
+                # Retries go through llm_scheduler, which frees the call slot while backing off
+                client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY, timeout=OPENAI_TIMEOUT, max_retries=0)
+    return client
+
+def retryable_openai_error(error: BaseException) -> bool:
+    """Errors worth retrying: rate limits (but not an exhausted quota), 5xx and connection failures."""
+    if isinstance(error, openai.RateLimitError):
+        return getattr(error, "code", None) != "insufficient_quota"
+    if isinstance(error, openai.APITimeoutError):
+        # A timed out call already took OPENAI_TIMEOUT
+        return False
+    return isinstance(error, (openai.InternalServerError, openai.APIConnectionError))
+
+# All OpenAI calls are queued, rate limited and retried by the scheduler
+llm_scheduler = LLMScheduler(
+    max_concurrency=OPENAI_MAX_CONCURRENCY,
+    rpm=OPENAI_RPM_LIMIT,
+    tpm=OPENAI_TPM_LIMIT,
+    max_queue=OPENAI_MAX_QUEUE,
+    max_wait=OPENAI_QUEUE_TIMEOUT,
+    max_retries=OPENAI_MAX_RETRIES,
+    max_retry_after=OPENAI_MAX_RETRY_AFTER,
+    retryable=retryable_openai_error,
+    observe_wait=lambda seconds: record_stage("openai_queue", seconds)
+)
+# Per-car analyses finish searches that already have a shortlist, so they go first
+OPENAI_PRIORITY = {"car_analysis": 0, "car_listing": 0}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup and shutdown of the API.
+
+    Startup only starts logging and checks the configuration, so the server
+    accepts connections right away.  The warmup (see warmup()) runs in the
+    background and /api/ready answers 503 until it has finished.
+    """
+    global warmup_task
+    init_logging()
+    if client is None and not OPENAI_API_KEY:
+        raise ValueError("OpenAI API key not found. Please set OPENAI_API_KEY in your environment variables.")
+    warmup_task = asyncio.create_task(asyncio.to_thread(warmup))
+    try:
+        yield
+    finally:
+        # A migration may be running; let it finish before the pools close
+        await warmup_task
+        # Results still being computed are stored in the shared cache for the other workers
+        await search_cache.drain(SHUTDOWN_DRAIN_TIMEOUT)
+        close_connections()
+        # Last, so the shutdown messages above are still written
+        flush_logs()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware to allow requests from your React frontend
 app.add_middleware(
@@ -177,6 +185,84 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Metrics exposed on /metrics in Prometheus text format
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"  # Add per-stage Server-Timing response headers
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "autoadvisor_http_request_seconds", "HTTP request latency", ("method", "path", "status")
+)
+LISTINGS_MATCHED = registry.counter(
+    "autoadvisor_listings_matched_total", "Listings matching the search filters"
+)
+LISTINGS_SENT = registry.counter(
+    "autoadvisor_listings_sent_total", "Listings sent to OpenAI", ("call",)
+)
+OPENAI_REQUESTS = registry.counter(
+    "autoadvisor_openai_requests_total", "OpenAI completions by outcome", ("call", "outcome")
+)
+OPENAI_TOKENS = registry.counter(
+    "autoadvisor_openai_tokens_total", "OpenAI tokens used, as reported by the API", ("call", "direction")
+)
+PARSE_FAILURES = registry.counter(
+    "autoadvisor_parse_failures_total", "Completions that did not validate against their schema", ("call",)
+)
+
+# Cache and pool counters are kept by the components themselves and read at scrape time
+def cache_stats() -> dict:
+    return {
+        "model_info": model_info_cache.stats(),
+        "model_insights": model_insights.stats(),
+        "token_counts": token_budget.stats()["listing_counts"],
+        "search_results": search_cache.stats()
+    }
+
+registry.counter(
+    "autoadvisor_cache_hits_total", "Cache hits", ("cache",),
+    function=lambda: {(name, ): stats["hits"] for name, stats in cache_stats().items()}
+)
+registry.counter(
+    "autoadvisor_cache_misses_total", "Cache misses", ("cache",),
+    function=lambda: {(name, ): stats["misses"] for name, stats in cache_stats().items()}
+)
+registry.counter(
+    "autoadvisor_prompt_tokens_saved_total", "Prompt tokens saved by compact encoding (estimated from sampled requests)",
+    function=lambda: {(): prompt_builder.stats()["tokens_saved"]}
+)
+registry.gauge(
+    "autoadvisor_db_pool_connections", "SQLite pool connections", ("pool", "state"),
+    function=lambda: {
+        (name, state): stats[state]
+        for name, stats in (("car_listings", car_listings_pool.stats()), ("bmw_cars", bmw_cars_pool.stats()))
+        for state in ("in_use", "idle")
+    }
+)
+registry.gauge(
+    "autoadvisor_openai_queue_depth", "OpenAI calls waiting for a slot",
+    function=lambda: {(): llm_scheduler.stats()["queued"]}
+)
+registry.gauge(
+    "autoadvisor_openai_in_flight", "OpenAI calls in flight",
+    function=lambda: {(): llm_scheduler.stats()["in_flight"]}
+)
+registry.gauge(
+    "autoadvisor_openai_concurrency_limit", "Current adaptive limit of OpenAI calls in flight",
+    function=lambda: {(): llm_scheduler.stats()["limit"]}
+)
+registry.counter(
+    "autoadvisor_openai_scheduler_total", "OpenAI scheduler events", ("event",),
+    function=lambda: {
+        (event, ): llm_scheduler.stats()[event]
+        for event in ("dispatched", "rejected", "timed_out", "retries", "rate_limited", "coalesced")
+    }
+)
+
+app.add_middleware(
+    MetricsMiddleware,
+    requests=HTTP_REQUEST_SECONDS,
+    paths=lambda: {route.path for route in app.routes},
+    server_timing=SERVER_TIMING
+)
+
 # Define the search filter model
 class PriceRange(BaseModel):
     min: Optional[int] = None
@@ -191,67 +277,181 @@ class SearchFilters(BaseModel):
     fuelType: Optional[str] = None
     mileage: MileageRange
     color: Optional[str] = None
+    # Free-text words matched (as prefixes) against description, options and engine
+    keywords: Optional[str] = None
+    # Features that must all appear, e.g. ["xDrive", "panorāmas jumts"]
+    features: Optional[List[str]] = None
+
+# Search response cache, optionally persisted to a local SQLite file that
+# worker processes share
+search_cache = SearchResultCache(
+    maxsize=int(os.getenv("SEARCH_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("SEARCH_CACHE_TTL", "1800")),
+    path=os.getenv("SEARCH_CACHE_PATH") or None,
+    lease_ttl=float(os.getenv("SEARCH_CACHE_LEASE_TTL", "300"))
+)
 
 # Add at the top with other constants
 MAX_INPUT_TOKENS = 110000  # Maximum tokens for input
 MAX_COMPLETION_TOKENS = 16000  # Maximum tokens for completion
+SEARCH_TOP_K = max(1, int(os.getenv("SEARCH_TOP_K", "50")))  # Listings shortlisted by priority score
+SEARCH_FETCH_CHUNK = int(os.getenv("SEARCH_FETCH_CHUNK", "2000"))  # Rows fetched and scored per batch
+LLM_TWO_STAGE = os.getenv("LLM_TWO_STAGE", "1") != "0"  # Shortlist pass, then one analysis call per car
+SHORTLIST_MAX_TOKENS = int(os.getenv("SHORTLIST_MAX_TOKENS", "200"))  # Completion tokens for the shortlist pass
+CAR_ANALYSIS_MAX_TOKENS = int(os.getenv("CAR_ANALYSIS_MAX_TOKENS", "4000"))  # Completion tokens per car analysis
 
 # Database connections
-def get_car_listings_db():
+DATA_DIR = os.getenv("DATA_DIR") or os.path.join(os.path.dirname(__file__), "data")
+CAR_LISTINGS_DB_PATH = os.path.join(DATA_DIR, "car_listings.db")
+BMW_CARS_DB_PATH = os.path.join(DATA_DIR, "bmw_cars.db")
+MODEL_INSIGHTS_DB_PATH = os.getenv("MODEL_INSIGHTS_DB_PATH") or os.path.join(DATA_DIR, "model_insights.db")
+
+# Pool sizing - connections are opened lazily, so this is an upper bound
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+def _configure_car_listings_connection(conn):
+    # Set text factory to handle UTF-8
+    conn.text_factory = lambda x: str(x, 'utf-8', 'ignore')
+
+car_listings_pool = SQLitePool(
+    CAR_LISTINGS_DB_PATH,
+    size=DB_POOL_SIZE,
+    timeout=DB_POOL_TIMEOUT,
+    configure=_configure_car_listings_connection
+)
+bmw_cars_pool = SQLitePool(BMW_CARS_DB_PATH, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT)
+
+@contextmanager
+def _borrow_connection(pool, name):
+    """Borrow a pooled connection, turning checkout failures into HTTP 500s.
+
+    Errors raised by the caller's own queries are propagated unchanged.
+    """
+    checked_out = False
     try:
-        db_path = os.path.join(os.path.dirname(__file__), "data", "car_listings.db")
-        logger.debug(f"Attempting to connect to car_listings database at: {db_path}")
-        
-        if not os.path.exists(db_path):
-            raise FileNotFoundError(f"Database file not found at: {db_path}")
-        
-        conn = sqlite3.connect(db_path)
-        # Set text factory to handle UTF-8
-        conn.text_factory = lambda x: str(x, 'utf-8', 'ignore')
-        # Set row factory to get column names
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # Test the connection with correct table name
-        cursor.execute("SELECT COUNT(*) FROM cars")
-        count = cursor.fetchone()[0]
-        logger.info(f"Successfully connected to car_listings database. Found {count} records.")
-        
-        return conn
-    except sqlite3.Error as e:
-        logger.error(f"SQLite error connecting to car_listings database: {e}")
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
+        with pool.connection() as conn:
+            checked_out = True
+            yield conn
     except Exception as e:
-        logger.error(f"Error connecting to car_listings database: {e}")
+        if checked_out:
+            raise
+        logger.error(f"Error connecting to {name} database: {e}")
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
 
+def get_car_listings_db():
+    """Borrow a read-only connection to car_listings.db from the pool."""
+    return _borrow_connection(car_listings_pool, "car_listings")
+
 def get_bmw_cars_db():
+    """Borrow a read-only connection to bmw_cars.db from the pool."""
+    return _borrow_connection(bmw_cars_pool, "bmw_cars")
+
+# Column expressions used by the search query. Until the car_listings.db
+# migration has run these are the raw-string parsing expressions; afterwards
+# they point at the indexed normalized columns.
+search_columns = {name: expr for name, (_, expr) in listings_schema.SEARCH_COLUMNS.items()}
+# Whether the cars_fts full-text index is available for keyword filters
+fulltext_enabled = False
+# Whether car_listings.db carries the ingestion version counter
+listings_versioned = False
+# Whether car_listings.db has the market_stats table (see market_stats.py)
+market_stats_enabled = False
+# Price distributions used to place each candidate's price among comparable listings
+listing_market = market_stats.MarketStats()
+
+def migrate_car_listings_db():
+    """Apply car_listings.db migrations and switch search to the indexed columns."""
+    global search_columns, fulltext_enabled, listings_versioned, market_stats_enabled
     try:
-        db_path = os.path.join(os.path.dirname(__file__), "data", "bmw_cars.db")
-        logger.debug(f"Attempting to connect to bmw_cars database at: {db_path}")
-        
-        if not os.path.exists(db_path):
-            raise FileNotFoundError(f"Database file not found at: {db_path}")
-        
-        conn = sqlite3.connect(db_path)
-        # Set row factory to get column names
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # Test the connection
-        cursor.execute("SELECT COUNT(*) FROM bmw_models")
-        count = cursor.fetchone()[0]
-        logger.info(f"Successfully connected to bmw_cars database. Found {count} records.")
-        
-        return conn
-    except sqlite3.Error as e:
-        logger.error(f"SQLite error connecting to bmw_cars database: {e}")
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
+        version = listings_schema.migrate(CAR_LISTINGS_DB_PATH)
+        logger.info(f"car_listings.db schema is at version {version}")
     except Exception as e:
-        logger.error(f"Error connecting to bmw_cars database: {e}")
-        logger.error(traceback.format_exc())
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
+        # Earlier migrations may still have been applied, so check what exists
+        logger.error(f"Could not fully migrate car_listings database: {e}")
+
+    try:
+        with car_listings_pool.connection() as conn:
+            if listings_schema.has_search_columns(conn):
+                search_columns = {name: name for name in listings_schema.SEARCH_COLUMNS}
+            else:
+                logger.warning("Normalized search columns missing, using unindexed search")
+            fulltext_enabled = listings_schema.has_fulltext_index(conn)
+            if not fulltext_enabled:
+                logger.warning("Full-text index missing, keyword filters use substring matching")
+            listings_versioned = listings_schema.has_version_counter(conn)
+            market_stats_enabled = market_stats.has_table(conn)
+            if not market_stats_enabled:
+                logger.warning("Market statistics missing, listings get no price percentile")
+    except sqlite3.Error as e:
+        logger.error(f"Could not inspect car_listings database schema: {e}")
+
+def ranking_projection():
+    """Narrow column list needed to rank listings: rowid plus the numeric fields."""
+    if search_columns["price_eur"] == "price_eur":
+        return f"rowid AS listing_rowid, {listings_schema.SCORING_COLUMNS_SQL}"
+    return "rowid AS listing_rowid, price, mileage, year"
+
+def build_search_query(filters: SearchFilters, projection: str = "*"):
+    """Build the listings filter query and its parameters."""
+    cols = search_columns
+    query = f"""
+        SELECT {projection} FROM cars 
+        WHERE 1=1
+    """
+    params = []
+    
+    # Price range handling
+    if filters.price and filters.price.min is not None and filters.price.max is not None:
+        query += f" AND {cols['price_eur']} BETWEEN ? AND ?"
+        params.extend([filters.price.min, filters.price.max])
+    elif filters.price and filters.price.min is not None:
+        query += f" AND {cols['price_eur']} >= ?"
+        params.append(filters.price.min)
+    elif filters.price and filters.price.max is not None:
+        query += f" AND {cols['price_eur']} <= ?"
+        params.append(filters.price.max)
+    
+    # Mileage range handling
+    if filters.mileage and filters.mileage.min is not None and filters.mileage.max is not None:
+        query += f" AND {cols['mileage_km']} BETWEEN ? AND ?"
+        params.extend([filters.mileage.min, filters.mileage.max])
+    elif filters.mileage and filters.mileage.min is not None:
+        query += f" AND {cols['mileage_km']} >= ?"
+        params.append(filters.mileage.min)
+    elif filters.mileage and filters.mileage.max is not None:
+        query += f" AND {cols['mileage_km']} <= ?"
+        params.append(filters.mileage.max)
+    
+    # Fuel type handling - by normalized category, substring match for unknown fuels
+    if filters.fuelType:
+        fuel_categories = listings_schema.fuel_filter_categories(filters.fuelType)
+        if fuel_categories:
+            query += f" AND {cols['fuel_category']} IN ({', '.join('?' * len(fuel_categories))})"
+            params.extend(fuel_categories)
+        else:
+            query += " AND LOWER(engine) LIKE LOWER(?)"
+            params.append(f"%{filters.fuelType}%")
+    
+    # Color handling - case insensitive
+    if filters.color:
+        query += f" AND {cols['color_norm']} = LOWER(?)"
+        params.append(filters.color)
+    
+    # Keyword and feature handling - full-text index lookup
+    if fulltext_enabled:
+        match = listings_schema.fulltext_query(filters.keywords, filters.features)
+        if match:
+            query += f" AND rowid IN (SELECT rowid FROM {listings_schema.FTS_TABLE} WHERE {listings_schema.FTS_TABLE} MATCH ?)"
+            params.append(match)
+    else:
+        terms = (filters.keywords or "").split() + [f.strip() for f in filters.features or [] if f and f.strip()]
+        for term in terms:
+            query += " AND (IFNULL(description, '') || ' ' || IFNULL(options, '') || ' ' || IFNULL(engine, '')) LIKE ?"
+            params.append(f"%{term}%")
+    
+    return query, params
 
 # Helper function to parse year from Latvian date format
 def parse_year(year_str):
@@ -278,357 +478,112 @@ def parse_make_model(make_model_str):
 
 # Helper function to extract features from options string
 def extract_features(options_str):
-    if not options_str:
-        return []
-    
-    # Split by pipe and remove any leading/trailing whitespace
-    sections = [s.strip() for s in options_str.split('|')]
-    features = []
-    
-    for section in sections:
-        # Extract items after colon
-        if ':' in section:
-            items = section.split(':', 1)[1].strip()
-            # Split by commas
-            feature_items = [item.strip() for item in items.split(',')]
-            features.extend(feature_items)
-    
+    return listings_schema.parse_features(options_str)
+
+# Helper function to get a listing's feature list, preferring the list stored at ingestion
+def listing_features(listing):
+    features = listing.get("feature_list")
+    if features is None:
+        stored = listing.get("features_json")
+        try:
+            features = json.loads(stored) if stored else None
+        except ValueError:
+            logger.warning(f"Invalid stored features for listing {listing.get('id')}")
+            features = None
+        if features is None:
+            features = extract_features(str(listing.get("options", "")))
+        # Parsed once per request, shared by the prompt and the response
+        listing["feature_list"] = features
     return features
 
 def calculate_priority_score(listing):
     """Calculate priority score based on year and mileage, without hard limits."""
     try:
-        # Year score calculation
-        year = parse_year(str(listing.get("year")))
-        current_year = datetime.now().year
-        
-        year_score = 0
-        if year:
-            # Linear score based on age, but no maximum age limit
-            # Newer cars get higher scores, but older cars still get considered
-            year_score = (year - 1950) / (current_year - 1950)  # 1950 as a reasonable baseline
-        
-        # Mileage score calculation
-        mileage_str = str(listing.get("mileage", "0"))
-        mileage = int(''.join(filter(str.isdigit, mileage_str)) or 0)
-        
-        # Logarithmic scale for mileage to better handle high mileage vehicles
-        # This gives a more gradual decrease in score as mileage increases
-        mileage_score = 1.0
-        if mileage > 0:
-            # Log scale transformation: 1.0 -> 0.0 over a wide range
-            # 50,000km -> 0.80 score
-            # 150,000km -> 0.60 score
-            # 300,000km -> 0.40 score
-            # 500,000km -> 0.20 score
-            # But never quite reaches 0
-            mileage_score = max(0.1, 1 - (math.log10(mileage) - 4) / 3)
-        
-        # Combined score (50% year, 50% mileage)
-        priority_score = (year_score * 0.5 + mileage_score * 0.5) * 100
-        
-        return priority_score
+        columns = listing_columns([listing])
+        return float(priority_scores(columns["mileage"], columns["year"], datetime.now().year)[0])
     except Exception as e:
         logger.error(f"Error calculating priority score: {e}")
         return 0
 
 def calculate_match_score(listing, model_info, filters):
     """Calculate match score based on how well the listing matches user criteria"""
-    score = 0
-    weights = {
-        'price': 0.40,  # Increased weight
-        'mileage': 0.35,  # Increased weight
-        'age': 0.25     # Kept the same
-    }
-    
     try:
-        # Log the inputs for debugging
-        logger.debug(f"Calculating match score for listing ID {listing.get('id')}")
-        logger.debug(f"Filters: {json.dumps(filters.dict(), default=str)}")
-        
-        # Price score - better score for lower price within range
-        price = int(''.join(filter(str.isdigit, str(listing.get("price", "0")))) or 0)
-        price_score = 0
-        
-        if filters.price and (filters.price.min is not None or filters.price.max is not None):
-            # Specific price range provided
-            if filters.price.min is not None and filters.price.max is not None:
-                # Both min and max provided
-                price_range = filters.price.max - filters.price.min
-                if price_range > 0:
-                    # Within range - lower is better
-                    if filters.price.min <= price <= filters.price.max:
-                        # Linear score: min price = 1.0, max price = 0.7
-                        price_score = 0.7 + 0.3 * (1 - ((price - filters.price.min) / price_range))
-                    else:
-                        # Outside range gets partial score based on distance
-                        distance = min(abs(price - filters.price.min), abs(price - filters.price.max))
-                        price_score = max(0, 0.7 - (distance / price_range))
-            elif filters.price.min is not None:
-                # Only min provided - higher is better (unusual case)
-                if price >= filters.price.min:
-                    price_score = 0.8  # Above minimum gets good score
-                else:
-                    # Below min gets partial score
-                    price_score = max(0.3, 0.8 * (price / filters.price.min))
-            elif filters.price.max is not None:
-                # Only max provided - lower is better
-                if price <= filters.price.max:
-                    # Linear score: 0 = 1.0, max = 0.7
-                    price_score = 0.7 + 0.3 * (1 - (price / filters.price.max))
-                else:
-                    # Above max gets lower score
-                    price_score = max(0, 0.7 - 0.5 * ((price - filters.price.max) / filters.price.max))
-        else:
-            # No price filter - lower is generally better
-            # Use a logarithmic scale: €5,000 -> 0.9, €10,000 -> 0.8, €20,000 -> 0.7
-            price_score = max(0.5, 1 - (math.log10(max(5000, price)) - math.log10(5000)) / 3)
-        
-        score += price_score * weights['price']
-        logger.debug(f"Price score: {price_score:.2f} (weight: {weights['price']:.2f})")
-        
-        # Mileage score - lower is better
-        mileage = int(''.join(filter(str.isdigit, str(listing.get("mileage", "0")))) or 0)
-        mileage_score = 0
-        
-        if filters.mileage and (filters.mileage.min is not None or filters.mileage.max is not None):
-            # Specific mileage range provided
-            if filters.mileage.min is not None and filters.mileage.max is not None:
-                # Both min and max provided
-                mileage_range = filters.mileage.max - filters.mileage.min
-                if mileage_range > 0:
-                    # Within range - lower is better
-                    if filters.mileage.min <= mileage <= filters.mileage.max:
-                        # Linear score: min mileage = 1.0, max mileage = 0.7
-                        mileage_score = 0.7 + 0.3 * (1 - ((mileage - filters.mileage.min) / mileage_range))
-                    else:
-                        # Outside range gets partial score based on distance
-                        distance = min(abs(mileage - filters.mileage.min), abs(mileage - filters.mileage.max))
-                        mileage_score = max(0, 0.7 - (distance / mileage_range))
-            elif filters.mileage.min is not None:
-                # Only min provided - higher is better (unusual case)
-                if mileage >= filters.mileage.min:
-                    mileage_score = 0.8  # Above minimum gets good score
-                else:
-                    # Below min gets partial score
-                    mileage_score = max(0.3, 0.8 * (mileage / filters.mileage.min))
-            elif filters.mileage.max is not None:
-                # Only max provided - lower is better
-                if mileage <= filters.mileage.max:
-                    # Linear score: 0 = 1.0, max = 0.7
-                    mileage_score = 0.7 + 0.3 * (1 - (mileage / filters.mileage.max))
-                else:
-                    # Above max gets lower score
-                    mileage_score = max(0, 0.7 - 0.5 * ((mileage - filters.mileage.max) / filters.mileage.max))
-        else:
-            # No mileage filter - lower is better (general preference)
-            # Use a logarithmic scale: 0km -> 1.0, 100,000km -> 0.8, 200,000km -> 0.6
-            mileage_score = max(0.4, 1 - (math.log10(max(1, mileage)) - 3) / 5)
-        
-        score += mileage_score * weights['mileage']
-        logger.debug(f"Mileage score: {mileage_score:.2f} (weight: {weights['mileage']:.2f})")
-        
-        # Age score - newer is better
-        year = parse_year(listing.get("year"))
-        age_score = 0
-        
-        if year:
-            current_year = datetime.now().year
-            
-            # Newer cars score higher
-            if filters.price and filters.price.max is not None:
-                # Consider price range when scoring age
-                # More expensive cars should be newer
-                expected_max_age = 5 + (15 * (1 - min(filters.price.max, 50000) / 50000))
-                age = current_year - year
-                age_score = max(0.3, 1 - (age / expected_max_age))
-            else:
-                # Without price context, use standard scale
-                # 0-3 years: 1.0-0.9, 4-7 years: 0.9-0.7, 8-15 years: 0.7-0.4, 16+ years: 0.4-0.3
-                age = current_year - year
-                if age <= 3:
-                    age_score = 1.0 - (age / 30)
-                elif age <= 7:
-                    age_score = 0.9 - ((age - 3) / 40)
-                elif age <= 15:
-                    age_score = 0.7 - ((age - 7) / 40)
-                else:
-                    age_score = max(0.3, 0.4 - ((age - 15) / 100))
-        else:
-            # No year information - below average score
-            age_score = 0.4
-        
-        score += age_score * weights['age']
-        logger.debug(f"Age score: {age_score:.2f} (weight: {weights['age']:.2f})")
-        
-        # Calculate final percentage score
-        final_score = min(max(score * 100, 30), 100)  # Minimum 30%, maximum 100%
-        logger.debug(f"Final match score: {final_score:.2f}%")
-        
-        return final_score
+        columns = listing_columns([listing])
+        return float(match_scores(
+            columns["price"], columns["mileage"], columns["year"], filters, datetime.now().year
+        )[0])
     except Exception as e:
         logger.error(f"Error calculating match score: {e}")
         logger.error(traceback.format_exc())
         return 50  # Return a neutral score on error
 
+# In-memory BMW model index, loaded on startup and reloadable at runtime
+model_index = ModelIndex(get_bmw_cars_db)
+
+# Memoized model resolutions keyed by (model, year, engine)
+MODEL_INFO_CACHE_SIZE = int(os.getenv("MODEL_INFO_CACHE_SIZE", "4096"))
+MODEL_INFO_CACHE_TTL = float(os.getenv("MODEL_INFO_CACHE_TTL", "3600"))
+model_info_cache = LRUCache(maxsize=MODEL_INFO_CACHE_SIZE, ttl=MODEL_INFO_CACHE_TTL)
+
+# Reload the index and drop memoized results when bmw_cars.db changes on disk
+bmw_cars_watcher = DatabaseWatcher(BMW_CARS_DB_PATH, check_interval=float(os.getenv("BMW_DB_CHECK_INTERVAL", "5")))
+
+# Precomputed model-level analysis sections (see model_insights.py)
+MODEL_INSIGHTS_ENABLED = os.getenv("MODEL_INSIGHTS_ENABLED", "1") != "0"
+model_insights = ModelInsightStore(MODEL_INSIGHTS_DB_PATH, check_interval=bmw_cars_watcher.check_interval)
+
+def reload_model_data():
+    """Reload the BMW model index and invalidate memoized model info."""
+    count = model_index.reload()
+    model_info_cache.clear()
+    if MODEL_INSIGHTS_ENABLED:
+        model_insights.load()
+    return count
+
 # Function to get model specific information with detailed data
 def get_model_info(model_name, year=None, engine_type=None):
-    """Fetch model information from the BMW database with improved matching."""
+    """Resolve model information from the in-memory BMW model index."""
     try:
-        conn = get_bmw_cars_db()
-        cursor = conn.cursor()
-        
-        # Clean and normalize inputs
-        clean_model = re.sub(r'[^a-zA-Z0-9]', '', model_name).lower()
-        if engine_type:
-            engine_type = engine_type.lower()
-        
-        # Extract base model number (e.g., "320" from "320i")
-        base_model = re.search(r'(\d{3})', clean_model)
-        base_model = base_model.group(1) if base_model else clean_model
-        
-        # Check if it's an electric model
-        is_electric = False
-        if engine_type:
-            is_electric = any(term in engine_type.lower() for term in ['electric', 'elektr', 'ev', 'hybrid', 'hibrid'])
-        
-        # Log search parameters
-        logger.info(f"Searching for model: {model_name}, base: {base_model}, year: {year}, engine: {engine_type}, electric: {is_electric}")
-        
-        # Build query with multiple matching criteria
-        query = """
-            SELECT model_name, production_years, engine_specifications, engine_code,
-                   fuel_type, positives, negatives, common_problems,
-                   high_mileage_considerations, original_price_eur
-            FROM bmw_models 
-            WHERE 1=1
-        """
-        params = []
-        
-        # Model name matching
-        model_condition = """
-            AND (
-                LOWER(REPLACE(model_name, ' ', '')) = ? 
-                OR LOWER(model_name) LIKE ? 
-                OR LOWER(model_name) LIKE ?
-            )
-        """
-        params.extend([clean_model, f"%{model_name.lower()}%", f"%{base_model}%"])
-        query += model_condition
-        
-        # Add fuel type filtering if available
-        if engine_type:
-            if is_electric:
-                query += " AND (LOWER(fuel_type) LIKE ? OR LOWER(engine_specifications) LIKE ?)"
-                params.extend(["%electric%", "%electric%"])
-            else:
-                # Check for diesel/petrol/etc
-                if 'diesel' in engine_type.lower() or 'd' in engine_type.lower():
-                    query += " AND (LOWER(fuel_type) LIKE ? OR LOWER(engine_specifications) LIKE ?)"
-                    params.extend(["%diesel%", "%diesel%"])
-                elif 'petrol' in engine_type.lower() or 'benzin' in engine_type.lower() or 'gasoline' in engine_type.lower():
-                    query += " AND (LOWER(fuel_type) LIKE ? OR LOWER(engine_specifications) LIKE ?)"
-                    params.extend(["%petrol%", "%petrol%"])
-        
-        # Add year filtering if available
-        if year:
-            # Try to match production years that include this year
-            # Format could be "2010-2015" or "2010-present" or just "2010"
-            year_condition = """
-                AND (
-                    production_years LIKE ? OR
-                    (
-                        CAST(SUBSTR(production_years, 1, 4) AS INTEGER) <= ? AND
-                        (
-                            production_years LIKE '%present%' OR
-                            CAST(SUBSTR(production_years, 6, 4) AS INTEGER) >= ?
-                        )
-                    )
-                )
-            """
-            params.extend([f"%{year}%", year, year])
-            query += year_condition
-        
-        # Order by relevance
-        query += """
-            ORDER BY 
-                CASE 
-                    WHEN LOWER(REPLACE(model_name, ' ', '')) = ? THEN 1
-                    WHEN LOWER(model_name) LIKE ? THEN 2
-                    ELSE 3
-                END,
-                LENGTH(model_name) ASC
-            LIMIT 1
-        """
-        params.extend([clean_model, f"%{model_name.lower()}%"])
-        
-        logger.debug(f"Model search query: {query}")
-        logger.debug(f"Model search params: {params}")
+        if bmw_cars_watcher.changed():
+            reload_model_data()
         
-        cursor.execute(query, params)
-        row = cursor.fetchone()
-        
-        # If no match with all criteria, try more relaxed search
-        if not row:
-            logger.info(f"No match found with strict criteria, trying relaxed search for {model_name}")
-            
-            # Try just with model name
-            query = """
-                SELECT model_name, production_years, engine_specifications, engine_code,
-                       fuel_type, positives, negatives, common_problems,
-                       high_mileage_considerations, original_price_eur
-                FROM bmw_models 
-                WHERE LOWER(model_name) LIKE ?
-                ORDER BY LENGTH(model_name) ASC
-                LIMIT 1
-            """
-            cursor.execute(query, [f"%{base_model}%"])
-            row = cursor.fetchone()
+        key = (model_name, year, engine_type)
+        model_info = model_info_cache.get(key)
+        if model_info is MISSING:
+            model_info = model_index.match(model_name, year, engine_type)
+            model_info_cache.set(key, model_info)
         
-        if row:
-            # Convert row to dict and ensure all fields are strings
-            model_info = {
-                "model_name": str(row[0] or ""),
-                "production_years": str(row[1] or ""),
-                "engine_specifications": str(row[2] or ""),
-                "engine_code": str(row[3] or ""),
-                "fuel_type": str(row[4] or ""),
-                "positives": str(row[5] or "").split(". ") if row[5] else [],
-                "negatives": str(row[6] or "").split(". ") if row[6] else [],
-                "common_issues": str(row[7] or ""),
-                "high_mileage_considerations": str(row[8] or ""),
-                "original_price_eur": str(row[9] or "")
-            }
-            
-            logger.info(f"Found model info for {model_name}: {model_info['model_name']}")
-            return model_info
-        else:
-            logger.warning(f"No model info found for {model_name}, year: {year}, engine: {engine_type}")
-            return {
-                "positives": [],
-                "negatives": [],
-                "common_issues": "",
-                "high_mileage_considerations": ""
-            }
+        if model_info:
+            logger.debug(f"Found model info for {model_name}: {model_info['model_name']}")
+            return copy_model_info(model_info)
+        logger.warning(f"No model info found for {model_name}, year: {year}, engine: {engine_type}")
+        return empty_model_info()
     except Exception as e:
         logger.error(f"Error fetching model info: {e}")
         logger.error(traceback.format_exc())
-        return {
-            "positives": [],
-            "negatives": [],
-            "common_issues": "",
-            "high_mileage_considerations": ""
-        }
+        return empty_model_info()
+
+# Shared tiktoken encoder with cached per-listing token counts
+token_budget = TokenBudget(
+    model="gpt-4",
+    cache_size=int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "20000")),
+    threads=int(os.getenv("TOKEN_COUNT_THREADS", "4"))
+)
+
+# Prompt encoding: shared model entries, compact JSON, optional description cut
+prompt_builder = PromptBuilder(
+    token_budget,
+    compact=os.getenv("PROMPT_COMPACT", "1") != "0",
+    description_tokens=int(os.getenv("PROMPT_DESCRIPTION_TOKENS", "0")),
+    savings_sample_rate=float(os.getenv("PROMPT_SAVINGS_SAMPLE_RATE", "0.05"))
+)
+# The prompts describe where model info is in the encoding prompt_builder uses
+SYSTEM_PROMPT = system_prompt(prompt_builder.compact)
+SHORTLIST_PROMPT = shortlist_prompt(prompt_builder.compact)
 
 def count_tokens(text: str) -> int:
     """Count tokens in a text string using tiktoken"""
-    try:
-        encoding = tiktoken.encoding_for_model("gpt-4")
-        return len(encoding.encode(text))
-    except Exception as e:
-        logger.error(f"Error counting tokens: {e}")
-        # Fallback to approximate count (4 characters per token)
-        return len(text) // 4
+    return token_budget.count(text)
 
 def prepare_listing_data(listing: dict, model_info: dict) -> dict:
     """Prepare listing data for OpenAI with model-specific information"""
@@ -640,8 +595,8 @@ def prepare_listing_data(listing: dict, model_info: dict) -> dict:
         # Ensure clean ID format
         listing_id = str(listing.get("id", "")).strip()
         
-        # Extract features without truncation
-        features = extract_features(str(listing.get("options", "")))
+        # Features without truncation
+        features = listing_features(listing)
         
         # Include full description without truncation
         description = str(listing.get("description", ""))
@@ -660,7 +615,7 @@ def prepare_listing_data(listing: dict, model_info: dict) -> dict:
             "original_price_eur": model_info.get("original_price_eur", "")
         }
         
-        return {
+        prepared = {
             "id": listing_id,
             "make_model": str(listing.get("make_model", "")),
             "year": parse_year(str(listing.get("year", ""))),
@@ -679,6 +634,10 @@ def prepare_listing_data(listing: dict, model_info: dict) -> dict:
             "priority_score": listing.get("priority_score", 0),
             "match_score": listing.get("score", 0)
         }
+        # Price position among comparable listings, when there are enough of them
+        if listing.get("market"):
+            prepared["market"] = listing["market"]
+        return prepared
     except Exception as e:
         logger.error(f"Error preparing listing data: {e}")
         return {
@@ -698,364 +657,952 @@ def prepare_listing_data(listing: dict, model_info: dict) -> dict:
             }
         }
 
+def select_candidates(filters: SearchFilters):
+    """Filter listings, rank them by priority and attach model info and match scores.
+
+    Returns the number of matching listings and the top listings by priority.
+    Runs blocking SQLite work, so call it from a worker thread.
+    """
+    # Phase one ranks on a narrow projection; the wide text columns are only
+    # read for the shortlist in phase two
+    query, params = build_search_query(filters, ranking_projection())
+    current_year = datetime.now().year
+    
+    # Stream the matches in chunks, keeping only the best SEARCH_TOP_K in a
+    # min-heap keyed by (priority, -row number) so ties keep query order
+    heap = []
+    total_found = 0
+    # Fetching and scoring are interleaved per chunk, so time them separately
+    filter_seconds = scoring_seconds = 0.0
+    with get_car_listings_db() as conn:
+        cursor = conn.cursor()
+        started = time.perf_counter()
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(SEARCH_FETCH_CHUNK)
+            fetched = time.perf_counter()
+            filter_seconds += fetched - started
+            if not rows:
+                break
+            chunk = [dict(row) for row in rows]
+            columns = listing_columns(chunk)
+            priorities = priority_scores(columns["mileage"], columns["year"], current_year)
+            
+            # Only rows that beat the current K-th best can enter the heap
+            threshold = heap[0][0] if len(heap) >= SEARCH_TOP_K else -math.inf
+            for i in np.flatnonzero(priorities > threshold):
+                entry = (float(priorities[i]), -(total_found + i), chunk[i]["listing_rowid"])
+                if len(heap) < SEARCH_TOP_K:
+                    heapq.heappush(heap, entry)
+                elif entry[:2] > heap[0][:2]:
+                    heapq.heapreplace(heap, entry)
+            total_found += len(chunk)
+            started = time.perf_counter()
+            scoring_seconds += started - fetched
+        record_stage("db_filter", filter_seconds)
+        record_stage("priority_scoring", scoring_seconds)
+        LISTINGS_MATCHED.inc(total_found)
+        logger.info(f"Found {total_found} matching listings")
+        
+        if not heap:
+            return 0, []
+        
+        # Phase two: fetch full rows for the shortlisted listings only
+        ranked = sorted(heap, reverse=True)
+        rowids = [rowid for _, _, rowid in ranked]
+        placeholders = ", ".join("?" * len(rowids))
+        with stage("db_fetch_rows"):
+            cursor.execute(f"SELECT rowid AS listing_rowid, * FROM cars WHERE rowid IN ({placeholders})", rowids)
+            rows_by_id = {row["listing_rowid"]: dict(row) for row in cursor.fetchall()}
+        if market_stats_enabled:
+            # Reuses the borrowed connection; ingestion changes the file signature
+            listing_market.refresh_if_changed(conn, file_signature(CAR_LISTINGS_DB_PATH))
+    
+    # Best priority first
+    top_listings = []
+    for priority, _, rowid in ranked:
+        listing = rows_by_id.get(rowid)
+        if listing is None:
+            # Deleted between the two phases
+            continue
+        listing["priority_score"] = priority
+        top_listings.append(listing)
+
+    # Get model info for each listing with improved matching
+    with stage("model_lookup"):
+        for listing in top_listings:
+            make, model = parse_make_model(str(listing["make_model"]))
+            year = parse_year(str(listing.get("year")))
+            engine = str(listing.get("engine", ""))
+
+            # Get model info with year and engine type
+            model_info = get_model_info(model, year, engine)
+
+            # Store model info directly with the listing
+            listing["model_info"] = model_info
+            listing["market"] = listing_market.lookup(listing) if market_stats_enabled else None
+
+    # Calculate match scores for the shortlist
+    with stage("match_scoring"):
+        top_columns = listing_columns(top_listings)
+        scores = match_scores(top_columns["price"], top_columns["mileage"], top_columns["year"], filters, current_year)
+        for listing, score in zip(top_listings, scores):
+            listing["score"] = float(score)
+
+    return total_found, top_listings
+
+def search_criteria(filters: SearchFilters) -> dict:
+    """Search criteria as described to the model."""
+    criteria = {
+        "price_range": f"€{filters.price.min or 0}-{filters.price.max or 'unlimited'}",
+        "mileage_range": f"{filters.mileage.min or 0}-{filters.mileage.max or 'unlimited'} km",
+        "fuel_type": filters.fuelType or "any",
+        "color": filters.color or "any"
+    }
+    if filters.keywords:
+        criteria["keywords"] = filters.keywords
+    if filters.features:
+        criteria["required_features"] = filters.features
+    return criteria
+
+# Listing and model fields the shortlist pass needs to compare candidates
+SUMMARY_FIELDS = (
+    "id", "make_model", "year", "price", "mileage", "engine", "transmission",
+    "body_type", "features", "priority_score", "match_score", "market"
+)
+SUMMARY_MODEL_FIELDS = ("model_name", "engine_specifications", "positives", "negatives")
+
+def summarize_listing(listing: dict, model_info: dict) -> dict:
+    """Compact listing summary for the shortlist pass: no description, short model info."""
+    prepared = prepare_listing_data(listing, model_info)
+    summary = {key: prepared[key] for key in SUMMARY_FIELDS if key in prepared}
+    summary["model_info"] = {key: prepared["model_info"].get(key, "") for key in SUMMARY_MODEL_FIELDS}
+    return summary
+
+def build_openai_request(filters: SearchFilters, total_found: int, top_listings: list, summaries: bool = False,
+                         sampled: bool = False):
+    """Pack the top listings into the OpenAI request body within MAX_INPUT_TOKENS.
+
+    With ``summaries`` the listings are sent as compact summaries for the
+    shortlist pass.  ``sampled`` dumps the request (see ``debug_dumper``).
+    Returns the structured request data and its serialized form.
+    """
+    # Prepare the data structure for OpenAI
+    envelope = {
+        "search_criteria": search_criteria(filters),
+        "valid_ids": [str(listing["id"]).strip() for listing in top_listings]
+    }
+
+    # Add listings with their model info, packed into the token budget
+    with stage("prompt_build"):
+        prompt = prompt_builder.build(
+            envelope,
+            [
+                (summarize_listing if summaries else prepare_listing_data)(listing, listing["model_info"])
+                for listing in top_listings
+            ],
+            MAX_INPUT_TOKENS
+        )
+    openai_data = prompt.data
+    total_tokens = prompt.tokens
+    user_content = prompt.content
+    LISTINGS_SENT.inc(len(openai_data["listings"]), call="shortlist" if summaries else "analysis")
+
+    logger.info(f"Prepared {len(openai_data['listings'])} listings for OpenAI analysis")
+
+    # Log detailed information about the data being sent to OpenAI
+    openai_logger.info("=== NEW SEARCH REQUEST ===")
+    openai_logger.info(f"Search Criteria: {json.dumps(openai_data['search_criteria'], ensure_ascii=False)}")
+    openai_logger.info(f"Total listings found: {total_found}")
+    openai_logger.info(f"Top listings by priority score: {len(top_listings)}")
+    openai_logger.info(f"Listings being sent to OpenAI: {len(openai_data['listings'])}")
+    openai_logger.info(f"Distinct models sent to OpenAI: {len(openai_data.get('models', {}))}")
+
+    # Per-listing details are only formatted when OPENAI_LOG_LEVEL=DEBUG
+    if openai_logger.isEnabledFor(logging.DEBUG):
+        for i, listing in enumerate(openai_data["listings"]):
+            model_info = listing.get("model_info") or openai_data.get("models", {}).get(listing.get("model"), {})
+            openai_logger.debug(
+                f"\nListing {i+1}: {listing.get('make_model', '')} ({listing.get('year', '')}) - {listing.get('engine', '')}\n"
+                f"ID: {listing.get('id')}\n"
+                f"Price: {listing.get('price')}\n"
+                f"Mileage: {listing.get('mileage')}\n"
+                f"Priority Score: {listing.get('priority_score')}\n"
+                f"Match Score: {listing.get('match_score')}\n"
+                f"Model Info:\n"
+                f"  Model Name: {model_info.get('model_name', 'N/A')}\n"
+                f"  Production Years: {model_info.get('production_years', 'N/A')}\n"
+                f"  Fuel Type: {model_info.get('fuel_type', 'N/A')}\n"
+                f"  Engine Specs: {model_info.get('engine_specifications', 'N/A')}\n"
+                f"Critical Fields for Analysis:\n"
+                f"  Common Issues: {model_info.get('common_issues', 'N/A')[:200]}...\n"
+                f"  High Mileage Considerations: {model_info.get('high_mileage_considerations', 'N/A')[:200]}...\n"
+                f"  Positives: {model_info.get('positives', [])}\n"
+                f"  Negatives: {model_info.get('negatives', [])}"
+            )
+
+    if prompt.tokens_saved is not None:
+        openai_logger.info(f"Total tokens in request: {total_tokens} ({prompt.tokens_saved} saved by compact encoding)")
+    else:
+        openai_logger.info(f"Total tokens in request: {total_tokens}")
+    openai_logger.info("=== END SEARCH REQUEST ===\n")
+
+    # Copy of the full OpenAI request for sampled searches, written in the background
+    debug_dumper.dump("openai_request", openai_data, sampled=sampled)
+
+    return openai_data, user_content
+
+def openai_outcome(error: Optional[BaseException]) -> str:
+    """Outcome label of an OpenAI call for the request counter."""
+    if error is None:
+        return "ok"
+    if isinstance(error, openai.RateLimitError):
+        return "rate_limited"
+    if isinstance(error, (asyncio.TimeoutError, openai.APITimeoutError)):
+        return "timeout"
+    if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+        return "cancelled"
+    return "error"
+
+def record_usage(call: str, usage):
+    """Count the prompt and completion tokens OpenAI reports for a call."""
+    if usage is None:
+        return
+    OPENAI_TOKENS.inc(usage.prompt_tokens or 0, call=call, direction="in")
+    OPENAI_TOKENS.inc(usage.completion_tokens or 0, call=call, direction="out")
+
+def validate_completion(schema, content: str, call: str):
+    """Validate a completion against its schema, counting failures."""
+    with stage("response_parse"):
+        try:
+            return schema.model_validate_json(content)
+        except ValidationError:
+            PARSE_FAILURES.inc(call=call)
+            raise
+
+async def request_ai_analysis(user_content: str, prompt: str = SYSTEM_PROMPT,
+                              max_tokens: int = MAX_COMPLETION_TOKENS, schema=AnalysisResponse,
+                              call: str = "analysis", sampled: bool = False) -> str:
+    """Run the analysis completion through the OpenAI scheduler, bounded by the timeout.
+
+    The completion is constrained to JSON matching the ``schema`` model.
+    ``call`` labels the completion in the metrics; ``sampled`` dumps the
+    response.  Identical requests in flight at the same time share one
+    completion.
+    """
+    async def attempt():
+        error = None
+        try:
+            with stage(f"openai_{call}"):
+                response = await asyncio.wait_for(
+                    openai_client().chat.completions.create(
+                        model="gpt-4o-mini",
+                        messages=[
+                            {"role": "system", "content": prompt},
+                            {"role": "user", "content": user_content}
+                        ],
+                        temperature=0.2,
+                        max_tokens=max_tokens,
+                        presence_penalty=0.0,
+                        frequency_penalty=0.0,
+                        response_format=response_format(schema)
+                    ),
+                    timeout=OPENAI_TIMEOUT
+                )
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            OPENAI_REQUESTS.inc(call=call, outcome=openai_outcome(error))
+        # Counted here, once per completion, rather than by every coalesced caller
+        record_usage(call, getattr(response, "usage", None))
+        return response
+
+    response = await llm_scheduler.run(
+        attempt,
+        tokens=estimate_tokens(prompt, user_content, max_tokens=max_tokens),
+        priority=OPENAI_PRIORITY.get(call, 1),
+        key=request_key(call, prompt, user_content, max_tokens, schema.__name__)
+    )
+    content = response.choices[0].message.content
+
+    # Log the raw response for debugging
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"OpenAI raw response: {content}")
+    openai_logger.info(f"OpenAI response received: {len(content)} characters")
+
+    # Copy of the full OpenAI response for sampled searches, written in the background
+    debug_dumper.dump("openai_response", content, sampled=sampled)
+
+    return content
+
+def parse_ai_response(content: str, top_listings: list) -> list:
+    """Turn the completion JSON into recommendation dicts for the frontend."""
+    response = validate_completion(AnalysisResponse, content, "analysis")
+    logger.info(f"Found selected IDs: {response.selected_ids}")
+
+    # Log selected IDs to openai_logger
+    openai_logger.info(f"Selected IDs: {response.selected_ids}")
+
+    listings_by_id = {str(listing["id"]).strip(): listing for listing in top_listings}
+    recommendations = []
+    for block in response.analyses:
+        car_id = block.id.strip()
+        listing = listings_by_id.get(car_id)
+        if not listing:
+            logger.warning(f"No listing found for car ID {car_id}")
+            continue
+        recommendations.append(build_recommendation(listing, block.analysis.model_dump()))
+        logger.info(f"Successfully processed recommendation for car {car_id}")
+
+    if not recommendations:
+        raise ValueError("No valid recommendations could be created")
+
+    return recommendations
+
+def build_car_details(listing: dict) -> dict:
+    """Frontend carDetails for a listing."""
+    make, model = parse_make_model(str(listing["make_model"]))
+    year = parse_year(str(listing["year"]))
+    market = listing.get("market")
+    return {
+        "id": str(listing["id"]),
+        "make": make,
+        "model": model,
+        "title": f"{make} {model} ({year})",
+        "price": str(listing["price"]),
+        "year": year,
+        "mileage": str(listing["mileage"]),
+        "fuelType": str(listing["engine"]),
+        "transmission": str(listing["transmission"]),
+        "color": str(listing["color"]),
+        "condition": "Used",
+        "location": "Latvia",
+        "sellerType": "Private",
+        "imageUrl": str(listing.get("image", "")),
+        "url": str(listing.get("url", "")),
+        "features": listing_features(listing),
+        "engineDetails": str(listing["engine"]),
+        "bodyType": str(listing["body_type"]),
+        "technicalInspection": str(listing.get("tech_inspection", "")),
+        "description": str(listing.get("description", "")),
+        "market": {
+            "pricePercentile": market["price_percentile"],
+            "medianPrice": market["median_price"],
+            "medianMileage": market["median_mileage"],
+            "listings": market["listings"]
+        } if market else None
+    }
+
+def build_recommendation(listing: dict, analysis: dict) -> dict:
+    """Combine a listing and its parsed AI analysis into a recommendation."""
+    # Get model info directly from the listing
+    model_info = listing.get("model_info", {})
+
+    # Ensure strengths is a list
+    strengths = analysis.get("strengths", [])
+    if not isinstance(strengths, list):
+        strengths = [s.strip() for s in str(strengths).split(".") if s.strip()]
+    if not strengths and model_info.get("positives"):
+        strengths = model_info["positives"]
+
+    # Ensure considerations is a list
+    considerations = analysis.get("considerations", [])
+    if not isinstance(considerations, list):
+        considerations = [c.strip() for c in str(considerations).split(".") if c.strip()]
+    if not considerations and model_info.get("negatives"):
+        considerations = model_info["negatives"]
+
+    # Format checklist items
+    checklist_items = analysis.get("checklistItems", [])
+    if isinstance(checklist_items, str):
+        checklist_items = [item.strip() for item in checklist_items.split("\n") if item.strip()]
+
+    # Create recommendation
+    return {
+        "carDetails": build_car_details(listing),
+        "aiAnalysis": {
+            "matchScore": int(analysis.get("matchScore", 70)),
+            "strengths": strengths,
+            "considerations": considerations,
+            "commonProblems": str(analysis.get("commonProblems", model_info.get("common_issues", ""))),
+            "highMileageConcerns": str(analysis.get("highMileageConcerns", model_info.get("high_mileage_considerations", ""))),
+            "valueAssessment": str(analysis.get("valueAssessment", "")),
+            "recommendation": str(analysis.get("recommendation", "")),
+            "summary": str(analysis.get("summary", "")) + "\n\n" + str(analysis.get("recommendation", "")),
+            "pros": strengths,
+            "cons": considerations
+        },
+        "checklistItems": "\n".join(checklist_items) if checklist_items else str(model_info.get("common_issues", "")),
+        "comparison": str(analysis.get("comparison", "")) or str(model_info.get("high_mileage_considerations", "")),
+        "summary": str(analysis.get("summary", "")) + "\n\n" + str(analysis.get("recommendation", ""))
+    }
+
+async def shortlist_listings(filters: SearchFilters, total_found: int, top_listings: list,
+                             sampled: bool = False) -> list:
+    """Two-stage pipeline, stage one: pick 3 listings from compact summaries."""
+    openai_data, user_content = await run_in_threadpool(
+        build_openai_request, filters, total_found, top_listings, True, sampled
+    )
+    sent_ids = {listing["id"] for listing in openai_data["listings"]}
+    candidates = [listing for listing in top_listings if str(listing["id"]).strip() in sent_ids]
+    listings_by_id = {str(listing["id"]).strip(): listing for listing in candidates}
+
+    content = await request_ai_analysis(
+        user_content, SHORTLIST_PROMPT, SHORTLIST_MAX_TOKENS, ShortlistResponse, call="shortlist", sampled=sampled
+    )
+
+    selected = []
+    for car_id in validate_completion(ShortlistResponse, content, "shortlist").selected_ids:
+        listing = listings_by_id.pop(car_id.strip(), None)
+        if listing is not None:
+            selected.append(listing)
+
+    if len(selected) < 3:
+        # Fill up with the best remaining match scores rather than analyzing fewer cars
+        logger.warning(f"Shortlist returned {len(selected)} valid IDs, filling up by match score")
+        remaining = sorted(listings_by_id.values(), key=lambda l: l.get("score", 0), reverse=True)
+        selected.extend(remaining[:3 - len(selected)])
+
+    selected = selected[:3]
+    logger.info(f"Found selected IDs: {[listing['id'] for listing in selected]}")
+    openai_logger.info(f"Selected IDs: {[listing['id'] for listing in selected]}")
+    return selected
+
+def parse_car_analysis(content: str, listing: dict) -> dict:
+    """Turn a per-car analysis completion into a recommendation."""
+    block = validate_completion(AnalysisBlock, content, "car_analysis")
+    return build_recommendation(listing, block.analysis.model_dump())
+
+async def analyze_listing(filters: SearchFilters, listing: dict, sampled: bool = False) -> dict:
+    """Two-stage pipeline, stage two: detailed analysis of one shortlisted car.
+
+    When the model-level sections of the car's model are precomputed, only
+    the listing-specific fields are requested and the stored sections merged in.
+    """
+    user_content = compact_dumps({
+        "search_criteria": search_criteria(filters),
+        "listing": prepare_listing_data(listing, listing["model_info"])
+    })
+    insights = None
+    if MODEL_INSIGHTS_ENABLED:
+        # A changed insight database is reloaded synchronously inside get()
+        insights = await run_in_threadpool(model_insights.get, listing["model_info"])
+    if insights is None:
+        content = await request_ai_analysis(
+            user_content, car_analysis_prompt, CAR_ANALYSIS_MAX_TOKENS, AnalysisBlock, call="car_analysis",
+            sampled=sampled
+        )
+        recommendation = parse_car_analysis(content, listing)
+    else:
+        content = await request_ai_analysis(
+            user_content, car_listing_prompt, CAR_ANALYSIS_MAX_TOKENS, ListingAnalysisBlock, call="car_listing",
+            sampled=sampled
+        )
+        block = validate_completion(ListingAnalysisBlock, content, "car_listing")
+        recommendation = build_recommendation(listing, {**block.analysis.model_dump(), **insights})
+    logger.info(f"Successfully processed recommendation for car {listing['id']}")
+    return recommendation
+
+async def run_two_stage_analysis(filters: SearchFilters, total_found: int, top_listings: list,
+                                 sampled: bool = False) -> list:
+    """Shortlist 3 cars, then analyze them with concurrent per-car calls."""
+    selected = await shortlist_listings(filters, total_found, top_listings, sampled)
+    results = await asyncio.gather(
+        *(analyze_listing(filters, listing, sampled) for listing in selected),
+        return_exceptions=True
+    )
+
+    recommendations = []
+    errors = []
+    for listing, result in zip(selected, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Error analyzing car {listing['id']}: {result}")
+            errors.append(result)
+        else:
+            recommendations.append(result)
+
+    if not recommendations:
+        # Surface e.g. rate limits and timeouts to the error handling in search_cars
+        if errors:
+            raise errors[0]
+        raise ValueError("No valid recommendations could be created")
+    return recommendations
+
+async def cancel_on_disconnect(request: Request, awaitable):
+    """Await ``awaitable``, cancelling it if the HTTP client goes away first."""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info("Client disconnected, cancelling search")
+                # Nobody is left to send a response to; MetricsMiddleware ends the request
+                raise asyncio.CancelledError("Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+
+async def run_search(filters: SearchFilters) -> dict:
+    """Full search pipeline: DB filtering and scoring, then AI analysis."""
+    # SQLite filtering, scoring and token counting block, so keep them off the event loop
+    total_found, top_listings = await run_in_threadpool(select_candidates, filters)
+    
+    if not top_listings:
+        return {"ok": True, "data": []}
+    
+    # One sampling decision per search keeps its dumped requests and responses together
+    sampled = debug_dumper.sample()
+    if LLM_TWO_STAGE:
+        recommendations = await run_two_stage_analysis(filters, total_found, top_listings, sampled)
+        return {"ok": True, "data": recommendations}
+    
+    openai_data, user_content = await run_in_threadpool(
+        build_openai_request, filters, total_found, top_listings, False, sampled
+    )
+    
+    # Step 5: Get AI analysis
+    content = await request_ai_analysis(user_content, sampled=sampled)
+    recommendations = parse_ai_response(content, top_listings)
+    return {"ok": True, "data": recommendations}
+
+# (file signature, version stamp) of the last listings_version() lookup
+_listings_version = (None, None)
+
+def listings_version() -> str:
+    """Version stamp of car_listings.db used to invalidate cached search results.
+
+    The file's inode plus the version counter bumped by ingest.py.  Every
+    commit changes the file signature, so the counter is only read again
+    after the signature has changed.  Before migration the signature itself
+    is the stamp.
+    """
+    global _listings_version
+    signature = file_signature(CAR_LISTINGS_DB_PATH)
+    if not listings_versioned or signature[0] is None:
+        return repr(signature)
+    cached_signature, stamp = _listings_version
+    if signature != cached_signature:
+        with get_car_listings_db() as conn:
+            stamp = f"{signature[0][0]}:{listings_schema.read_version(conn)}"
+        _listings_version = (signature, stamp)
+    return stamp
+
 # API endpoint to search car listings
 @app.post("/api/search")
-async def search_cars(filters: SearchFilters):
+async def search_cars(filters: SearchFilters, request: Request):
+    logger.info(f"Starting search with filters: {filters}")
+    
     try:
-        logger.info(f"Starting search with filters: {filters}")
+        # Identical searches against the same listings data share one result
+        cache_key = search_cache.make_key(filters.dict(), listings_version())
+        return await cancel_on_disconnect(
+            request,
+            search_cache.get_or_compute(cache_key, lambda: run_search(filters))
+        )
         
+    except HTTPException:
+        raise
+    except openai.BadRequestError as e:
+        logger.error(f"OpenAI BadRequestError: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="Error analyzing car listings. Please try with fewer filters or a smaller price range."
+        )
+    except openai.RateLimitError as e:
+        logger.error(f"OpenAI RateLimitError: {e}")
+        raise HTTPException(
+            status_code=429,
+            detail="Service is currently busy. Please try again in a few minutes."
+        )
+    except SchedulerBusy as e:
+        logger.error(f"OpenAI scheduler busy: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Service is currently busy. Please try again in a few minutes.",
+            headers={"Retry-After": str(int(OPENAI_QUEUE_TIMEOUT))}
+        )
+    except (asyncio.TimeoutError, openai.APITimeoutError) as e:
+        logger.error(f"OpenAI request timed out: {e}")
+        raise HTTPException(
+            status_code=504,
+            detail="Analyzing car listings took too long. Please try again."
+        )
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        raise HTTPException(status_code=500, detail="Database error occurred")
+    except Exception as e:
+        logger.error(f"Error in search_cars: {e}")
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail="Error analyzing car listings. Please try again.")
+
+async def stream_ai_analysis(user_content: str):
+    """Yield completion text chunks as they arrive from OpenAI.
+
+    The call holds a scheduler slot until the stream ends.  Opening the
+    stream is retried like other calls; once text has been yielded an error
+    ends the stream.
+    """
+    tokens = estimate_tokens(SYSTEM_PROMPT, user_content, max_tokens=MAX_COMPLETION_TOKENS)
+    for attempt in itertools.count():
+        received = False
         try:
-            conn = get_car_listings_db()
-            cursor = conn.cursor()
-            
-            # Build the SQL query with filters - using BETWEEN for ranges
-            query = """
-                SELECT * FROM cars 
-                WHERE 1=1
-            """
-            params = []
-            
-            # Price range handling
-            if filters.price and filters.price.min is not None and filters.price.max is not None:
-                query += " AND CAST(REPLACE(REPLACE(price, ' ', ''), '€', '') AS INTEGER) BETWEEN ? AND ?"
-                params.extend([filters.price.min, filters.price.max])
-            elif filters.price and filters.price.min is not None:
-                query += " AND CAST(REPLACE(REPLACE(price, ' ', ''), '€', '') AS INTEGER) >= ?"
-                params.append(filters.price.min)
-            elif filters.price and filters.price.max is not None:
-                query += " AND CAST(REPLACE(REPLACE(price, ' ', ''), '€', '') AS INTEGER) <= ?"
-                params.append(filters.price.max)
-            
-            # Mileage range handling
-            if filters.mileage and filters.mileage.min is not None and filters.mileage.max is not None:
-                query += " AND CAST(REPLACE(REPLACE(mileage, ' ', ''), 'km', '') AS INTEGER) BETWEEN ? AND ?"
-                params.extend([filters.mileage.min, filters.mileage.max])
-            elif filters.mileage and filters.mileage.min is not None:
-                query += " AND CAST(REPLACE(REPLACE(mileage, ' ', ''), 'km', '') AS INTEGER) >= ?"
-                params.append(filters.mileage.min)
-            elif filters.mileage and filters.mileage.max is not None:
-                query += " AND CAST(REPLACE(REPLACE(mileage, ' ', ''), 'km', '') AS INTEGER) <= ?"
-                params.append(filters.mileage.max)
-            
-            # Fuel type handling - case insensitive
-            if filters.fuelType:
-                query += " AND LOWER(engine) LIKE LOWER(?)"
-                params.append(f"%{filters.fuelType}%")
-            
-            # Color handling - case insensitive
-            if filters.color:
-                query += " AND LOWER(color) = LOWER(?)"
-                params.append(filters.color)
-            
-            cursor.execute(query, params)
-            listings = [dict(row) for row in cursor.fetchall()]
-            logger.info(f"Found {len(listings)} matching listings")
-            
-            if not listings:
-                return {"ok": True, "data": []}
-            
-            # Calculate priority scores for all listings
-            for listing in listings:
-                listing["priority_score"] = calculate_priority_score(listing)
-            
-            # Sort by priority score and take top 50
-            listings.sort(key=lambda x: x["priority_score"], reverse=True)
-            top_listings = listings[:50] if len(listings) > 50 else listings
-            
-            # Get model info for each listing with improved matching
-            for listing in top_listings:
-                make, model = parse_make_model(str(listing["make_model"]))
-                year = parse_year(str(listing.get("year")))
-                engine = str(listing.get("engine", ""))
-                
-                # Get model info with year and engine type
-                model_info = get_model_info(model, year, engine)
-                
-                # Store model info directly with the listing
-                listing["model_info"] = model_info
-                
-                # Calculate match score
-                listing["score"] = calculate_match_score(listing, model_info, filters)
-            
-            # Prepare data for OpenAI
-            MAX_LISTINGS = 50  # Limit number of listings to analyze
-            
-            # Prepare the data structure for OpenAI
-            openai_data = {
-                "search_criteria": {
-                    "price_range": f"€{filters.price.min or 0}-{filters.price.max or 'unlimited'}",
-                    "mileage_range": f"{filters.mileage.min or 0}-{filters.mileage.max or 'unlimited'} km",
-                    "fuel_type": filters.fuelType or "any",
-                    "color": filters.color or "any"
-                },
-                "valid_ids": [str(listing["id"]).strip() for listing in top_listings],
-                "listings": []
-            }
-            
-            # Add listings with their model info
-            total_tokens = count_tokens(json.dumps(openai_data))
-            for listing in top_listings:
-                # Prepare listing data with its specific model info
-                listing_data = prepare_listing_data(listing, listing["model_info"])
-                listing_tokens = count_tokens(json.dumps(listing_data))
-                
-                if total_tokens + listing_tokens > MAX_INPUT_TOKENS:
-                    break
-                    
-                openai_data["listings"].append(listing_data)
-                total_tokens += listing_tokens
-            
-            logger.info(f"Prepared {len(openai_data['listings'])} listings for OpenAI analysis")
-            
-            # Log detailed information about the data being sent to OpenAI
-            openai_logger.info("=== NEW SEARCH REQUEST ===")
-            openai_logger.info(f"Search Criteria: {json.dumps(openai_data['search_criteria'], indent=2)}")
-            openai_logger.info(f"Total listings found: {len(listings)}")
-            openai_logger.info(f"Top listings by priority score: {len(top_listings)}")
-            openai_logger.info(f"Listings being sent to OpenAI: {len(openai_data['listings'])}")
-            
-            # Log each listing with its model info
-            for i, listing in enumerate(openai_data["listings"]):
-                make_model = listing.get("make_model", "")
-                year = listing.get("year", "")
-                engine = listing.get("engine", "")
-                model_info = listing.get("model_info", {})
-                
-                openai_logger.info(f"\nListing {i+1}: {make_model} ({year}) - {engine}")
-                openai_logger.info(f"ID: {listing.get('id')}")
-                openai_logger.info(f"Price: {listing.get('price')}")
-                openai_logger.info(f"Mileage: {listing.get('mileage')}")
-                openai_logger.info(f"Priority Score: {listing.get('priority_score')}")
-                openai_logger.info(f"Match Score: {listing.get('match_score')}")
-                
-                # Log model info details
-                openai_logger.info("Model Info:")
-                openai_logger.info(f"  Model Name: {model_info.get('model_name', 'N/A')}")
-                openai_logger.info(f"  Production Years: {model_info.get('production_years', 'N/A')}")
-                openai_logger.info(f"  Fuel Type: {model_info.get('fuel_type', 'N/A')}")
-                openai_logger.info(f"  Engine Specs: {model_info.get('engine_specifications', 'N/A')}")
+            async with llm_scheduler.slot(tokens, OPENAI_PRIORITY.get("analysis_stream", 1)):
+                # aclosing: a client disconnect closes the OpenAI stream before the slot is freed
+                async with aclosing(stream_completion(user_content)) as chunks:
+                    async for text in chunks:
+                        received = True
+                        yield text
+            return
+        except Exception as e:
+            delay = None if received else llm_scheduler.retry_delay(e, attempt)
+            if delay is None:
+                raise
+            logger.warning(f"Opening the OpenAI stream failed ({type(e).__name__}), retry {attempt + 1} in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+async def stream_completion(user_content: str):
+    """One streamed analysis completion, yielding its text chunks."""
+    deadline = asyncio.get_running_loop().time() + OPENAI_TIMEOUT
+    started = time.perf_counter()
+    error = None
+    try:
+        stream = await openai_client().chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": user_content}
+            ],
+            temperature=0.2,
+            max_tokens=MAX_COMPLETION_TOKENS,
+            presence_penalty=0.0,
+            frequency_penalty=0.0,
+            response_format=response_format(AnalysisResponse),
+            # The last chunk carries the token usage and no choices
+            stream_options={"include_usage": True},
+            stream=True
+        )
+        try:
+            async for chunk in stream:
+                if asyncio.get_running_loop().time() > deadline:
+                    raise asyncio.TimeoutError("OpenAI stream exceeded OPENAI_TIMEOUT")
+                record_usage("analysis_stream", getattr(chunk, "usage", None))
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        record_stage("openai_analysis_stream", time.perf_counter() - started)
+        OPENAI_REQUESTS.inc(call="analysis_stream", outcome=openai_outcome(error))
+
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def single_call_events(filters: SearchFilters, total_found: int, top_listings: list, sampled: bool = False):
+    """Stream one combined completion, yielding ("selected", ids) and
+    ("recommendation", recommendation) as soon as each part is parsed."""
+    openai_data, user_content = await run_in_threadpool(
+        build_openai_request, filters, total_found, top_listings, False, sampled
+    )
+    listings_by_id = {str(listing["id"]).strip(): listing for listing in top_listings}
+    
+    parser = AnalysisStreamParser()
+    content = []
+    try:
+        async for chunk in stream_ai_analysis(user_content):
+            content.append(chunk)
+            for event in parser.feed(chunk):
+                if event[0] == "selected_ids":
+                    logger.info(f"Found selected IDs: {event[1]}")
+                    yield "selected", event[1]
+                    continue
                 
-                # Log the critical fields for OpenAI analysis
-                openai_logger.info("Critical Fields for Analysis:")
-                openai_logger.info(f"  Common Issues: {model_info.get('common_issues', 'N/A')[:200]}...")
-                openai_logger.info(f"  High Mileage Considerations: {model_info.get('high_mileage_considerations', 'N/A')[:200]}...")
-                openai_logger.info(f"  Positives: {model_info.get('positives', [])}")
-                openai_logger.info(f"  Negatives: {model_info.get('negatives', [])}")
-            
-            openai_logger.info(f"Total tokens in request: {total_tokens}")
-            openai_logger.info("=== END SEARCH REQUEST ===\n")
-            
-            # Save the full OpenAI request to a separate file for debugging
-            try:
-                debug_dir = os.path.join(os.path.dirname(__file__), "logs", "debug")
-                os.makedirs(debug_dir, exist_ok=True)
-                debug_file = os.path.join(debug_dir, f"openai_request_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
-                with open(debug_file, 'w', encoding='utf-8') as f:
-                    json.dump(openai_data, f, indent=2, ensure_ascii=False)
-                logger.info(f"Saved full OpenAI request to {debug_file}")
-            except Exception as e:
-                logger.error(f"Failed to save debug file: {e}")
-            
-            # Step 5: Get AI analysis
+                block = event[1]
+                car_id = block.id.strip()
+                listing = listings_by_id.get(car_id)
+                if not listing:
+                    logger.warning(f"Skipping analysis block for unknown car ID {car_id}")
+                    continue
+                logger.info(f"Streamed recommendation for car {car_id}")
+                yield "recommendation", build_recommendation(listing, block.analysis.model_dump())
+        
+        # A truncated or malformed completion fails here rather than ending the stream quietly
+        parser.close()
+    except ValidationError:
+        PARSE_FAILURES.inc(call="analysis_stream")
+        raise
+    finally:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"OpenAI raw response: {''.join(content)}")
+        debug_dumper.dump("openai_response", "".join(content), sampled=sampled)
+
+async def two_stage_events(filters: SearchFilters, total_found: int, top_listings: list, sampled: bool = False):
+    """Run the two-stage pipeline, yielding each per-car analysis as it finishes."""
+    selected = await shortlist_listings(filters, total_found, top_listings, sampled)
+    yield "selected", [str(listing["id"]).strip() for listing in selected]
+    
+    tasks = [asyncio.ensure_future(analyze_listing(filters, listing, sampled)) for listing in selected]
+    errors = []
+    produced = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
             try:
-                response = client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": json.dumps(openai_data)}
-                    ],
-                    temperature=0.2,
-                    max_tokens=MAX_COMPLETION_TOKENS,
-                    presence_penalty=0.0,
-                    frequency_penalty=0.0
-                )
-                
-                # Log the raw response for debugging
-                logger.debug(f"OpenAI raw response: {response.choices[0].message.content}")
-                
-                # Save the full OpenAI response to a separate file for debugging
-                try:
-                    debug_dir = os.path.join(os.path.dirname(__file__), "logs", "debug")
-                    os.makedirs(debug_dir, exist_ok=True)
-                    debug_file = os.path.join(debug_dir, f"openai_response_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
-                    with open(debug_file, 'w', encoding='utf-8') as f:
-                        f.write(response.choices[0].message.content)
-                    logger.info(f"Saved full OpenAI response to {debug_file}")
-                    
-                    # Also log to the openai_logger
-                    openai_logger.info("\n=== OPENAI RESPONSE ===")
-                    openai_logger.info(f"Response received at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-                    openai_logger.info("Selected IDs:")
-                except Exception as e:
-                    logger.error(f"Failed to save response debug file: {e}")
-                
-                # Extract car IDs and analyses
-                content = response.choices[0].message.content
-                id_match = re.search(r'SELECTED_IDS:\s*\[(.*?)\]', content)
-                if not id_match:
-                    logger.error("No SELECTED_IDS found in response")
-                    raise ValueError("No SELECTED_IDS found in response")
-                
-                selected_ids = [id.strip(' "\'') for id in id_match.group(1).split(',')]
-                logger.info(f"Found selected IDs: {selected_ids}")
-                
-                # Log selected IDs to openai_logger
-                openai_logger.info(f"Selected IDs: {selected_ids}")
-                
-                # Extract analysis blocks
-                analysis_blocks = []
-                for car_id in selected_ids:
-                    analysis_match = re.search(rf'{{"id":\s*"{car_id}",\s*"analysis":\s*({{.*?}})\s*}}', content, re.DOTALL)
-                    if analysis_match:
-                        analysis_blocks.append((car_id, analysis_match.group(1)))
-                    else:
-                        logger.warning(f"Could not find analysis block for car ID {car_id}")
-                
-                if not analysis_blocks:
-                    logger.error("No valid analysis blocks found in response")
-                    raise ValueError("No valid analysis blocks found in response")
-                
-                logger.info(f"Successfully extracted {len(analysis_blocks)} analysis blocks")
-                
-                # Process each analysis block
-                recommendations = []
-                for car_id, analysis_json in analysis_blocks:
-                    try:
-                        # Clean up the JSON
-                        analysis_json = re.sub(r'//.*', '', analysis_json)
-                        analysis_json = re.sub(r',\s*}', '}', analysis_json)
-                        analysis_json = re.sub(r',\s*]', ']', analysis_json)
-                        
-                        analysis = json.loads(analysis_json)
-                        
-                        # Find the corresponding listing
-                        listing = next((l for l in top_listings if str(l["id"]).strip() == str(car_id).strip()), None)
-                        
-                        if not listing:
-                            logger.warning(f"No listing found for car ID {car_id}")
-                            continue
-                        
-                        make, model = parse_make_model(str(listing["make_model"]))
-                        year = parse_year(str(listing["year"]))
-                        
-                        # Get model info directly from the listing
-                        model_info = listing.get("model_info", {})
-                        
-                        # Ensure strengths is a list
-                        strengths = analysis.get("strengths", [])
-                        if not isinstance(strengths, list):
-                            strengths = [s.strip() for s in str(strengths).split(".") if s.strip()]
-                        if not strengths and model_info.get("positives"):
-                            strengths = model_info["positives"]
-                        
-                        # Ensure considerations is a list
-                        considerations = analysis.get("considerations", [])
-                        if not isinstance(considerations, list):
-                            considerations = [c.strip() for c in str(considerations).split(".") if c.strip()]
-                        if not considerations and model_info.get("negatives"):
-                            considerations = model_info["negatives"]
-                        
-                        # Format checklist items
-                        checklist_items = analysis.get("checklistItems", [])
-                        if isinstance(checklist_items, str):
-                            checklist_items = [item.strip() for item in checklist_items.split("\n") if item.strip()]
-                        
-                        # Create recommendation
-                        recommendation = {
-                            "carDetails": {
-                                "id": str(listing["id"]),
-                                "make": make,
-                                "model": model,
-                                "title": f"{make} {model} ({year})",
-                                "price": str(listing["price"]),
-                                "year": year,
-                                "mileage": str(listing["mileage"]),
-                                "fuelType": str(listing["engine"]),
-                                "transmission": str(listing["transmission"]),
-                                "color": str(listing["color"]),
-                                "condition": "Used",
-                                "location": "Latvia",
-                                "sellerType": "Private",
-                                "imageUrl": str(listing.get("image", "")),
-                                "url": str(listing.get("url", "")),
-                                "features": extract_features(str(listing.get("options", ""))),
-                                "engineDetails": str(listing["engine"]),
-                                "bodyType": str(listing["body_type"]),
-                                "technicalInspection": str(listing.get("tech_inspection", "")),
-                                "description": str(listing.get("description", ""))
-                            },
-                            "aiAnalysis": {
-                                "matchScore": int(analysis.get("matchScore", 70)),
-                                "strengths": strengths,
-                                "considerations": considerations,
-                                "commonProblems": str(analysis.get("commonProblems", model_info.get("common_issues", ""))),
-                                "highMileageConcerns": str(analysis.get("highMileageConcerns", model_info.get("high_mileage_considerations", ""))),
-                                "valueAssessment": str(analysis.get("valueAssessment", "")),
-                                "recommendation": str(analysis.get("recommendation", "")),
-                                "summary": str(analysis.get("summary", "")) + "\n\n" + str(analysis.get("recommendation", "")),
-                                "pros": strengths,
-                                "cons": considerations
-                            },
-                            "checklistItems": "\n".join(checklist_items) if checklist_items else str(model_info.get("common_issues", "")),
-                            "comparison": str(analysis.get("comparison", "")) or str(model_info.get("high_mileage_considerations", "")),
-                            "summary": str(analysis.get("summary", "")) + "\n\n" + str(analysis.get("recommendation", ""))
-                        }
-                        
-                        recommendations.append(recommendation)
-                        logger.info(f"Successfully processed recommendation for car {car_id}")
-                        
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Error parsing analysis JSON for car {car_id}: {e}")
-                        logger.error(f"Problematic JSON: {analysis_json}")
-                        continue
-                    except Exception as e:
-                        logger.error(f"Error processing car {car_id}: {e}")
-                        logger.error(traceback.format_exc())
-                        continue
-                
-                if not recommendations:
-                    raise ValueError("No valid recommendations could be created")
-                
-                return {"ok": True, "data": recommendations}
-                
-            except openai.BadRequestError as e:
-                logger.error(f"OpenAI BadRequestError: {e}")
-                raise HTTPException(
-                    status_code=500,
-                    detail="Error analyzing car listings. Please try with fewer filters or a smaller price range."
-                )
-            except openai.RateLimitError as e:
-                logger.error(f"OpenAI RateLimitError: {e}")
-                raise HTTPException(
-                    status_code=429,
-                    detail="Service is currently busy. Please try again in a few minutes."
-                )
+                recommendation = await next_done
             except Exception as e:
-                logger.error(f"Error getting AI analysis: {e}")
-                logger.error(traceback.format_exc())
-                raise HTTPException(
-                    status_code=500,
-                    detail="Error analyzing car listings. Please try again."
-                )
-            
-        except sqlite3.Error as e:
-            logger.error(f"Database error: {e}")
-            raise HTTPException(status_code=500, detail="Database error occurred")
-        except Exception as e:
-            logger.error(f"Error: {e}")
-            logger.error(traceback.format_exc())
-            raise HTTPException(status_code=500, detail="An error occurred while processing your request")
-            
+                logger.error(f"Error analyzing shortlisted car: {e}")
+                errors.append(e)
+                continue
+            produced += 1
+            yield "recommendation", recommendation
+    finally:
+        for task in tasks:
+            task.cancel()
+    
+    if not produced and errors:
+        raise errors[0]
+
+async def stream_search_events(filters: SearchFilters):
+    """Search pipeline emitting SSE events as results become available."""
+    cache_key = search_cache.make_key(filters.dict(), listings_version())
+    try:
+        cached = await search_cache.get(cache_key)
+        if cached is not MISSING:
+            yield sse_event("candidates", {"total": None, "carDetails": [r["carDetails"] for r in cached["data"]]})
+            for recommendation in cached["data"]:
+                yield sse_event("recommendation", recommendation)
+            yield sse_event("done", {"count": len(cached["data"]), "cached": True})
+            return
+        
+        total_found, top_listings = await run_in_threadpool(select_candidates, filters)
+        yield sse_event("candidates", {
+            "total": total_found,
+            "carDetails": [build_car_details(listing) for listing in top_listings]
+        })
+        
+        if not top_listings:
+            await search_cache.set(cache_key, {"ok": True, "data": []})
+            yield sse_event("done", {"count": 0, "cached": False})
+            return
+        
+        analysis_events = two_stage_events if LLM_TWO_STAGE else single_call_events
+        recommendations = []
+        async for kind, payload in analysis_events(filters, total_found, top_listings, debug_dumper.sample()):
+            if kind == "selected":
+                yield sse_event("selected", {"ids": payload})
+            else:
+                recommendations.append(payload)
+                yield sse_event("recommendation", payload)
+        
+        if not recommendations:
+            yield sse_event("error", {"detail": "Error analyzing car listings. Please try again."})
+            return
+        
+        await search_cache.set(cache_key, {"ok": True, "data": recommendations})
+        yield sse_event("done", {"count": len(recommendations), "cached": False})
+    
+    except asyncio.CancelledError:
+        logger.info("Client disconnected, cancelling streamed search")
+        raise
+    except openai.RateLimitError as e:
+        logger.error(f"OpenAI RateLimitError: {e}")
+        yield sse_event("error", {"status": 429, "detail": "Service is currently busy. Please try again in a few minutes."})
+    except SchedulerBusy as e:
+        logger.error(f"OpenAI scheduler busy: {e}")
+        yield sse_event("error", {"status": 503, "detail": "Service is currently busy. Please try again in a few minutes."})
+    except (asyncio.TimeoutError, openai.APITimeoutError) as e:
+        logger.error(f"OpenAI request timed out: {e}")
+        yield sse_event("error", {"status": 504, "detail": "Analyzing car listings took too long. Please try again."})
     except Exception as e:
-        logger.error(f"Error in search_cars: {e}")
+        logger.error(f"Error in streamed search: {e}")
         logger.error(traceback.format_exc())
-        raise HTTPException(status_code=500, detail="Error analyzing car listings. Please try again.")
+        yield sse_event("error", {"status": 500, "detail": "Error analyzing car listings. Please try again."})
+
+# Streaming variant of /api/search using Server-Sent Events
+@app.post("/api/search/stream")
+async def search_cars_stream(filters: SearchFilters):
+    logger.info(f"Starting streamed search with filters: {filters}")
+    return StreamingResponse(
+        stream_search_events(filters),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # Root endpoint
 @app.get("/")
 def read_root():
     return {"message": "AutoAdvisor API is running!"}
 
+# OpenAI scheduler statistics
+@app.get("/api/openai-stats")
+def read_openai_stats():
+    return llm_scheduler.stats()
+
+# Cache statistics
+@app.get("/api/cache-stats")
+def read_cache_stats():
+    return {
+        "model_info": model_info_cache.stats(),
+        "model_insights": model_insights.stats(),
+        "token_counts": token_budget.stats(),
+        "prompt": prompt_builder.stats(),
+        "search_results": search_cache.stats(),
+        "market_stats": listing_market.stats()
+    }
+
+# Prometheus metrics
+@app.get("/metrics")
+def read_metrics():
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+# Connection pool statistics
+@app.get("/api/pool-stats")
+def read_pool_stats():
+    return {
+        "car_listings": car_listings_pool.stats(),
+        "bmw_cars": bmw_cars_pool.stats()
+    }
+
+# Whether preload() has run in this process or in the parent it was forked from
+preloaded = False
+
+def preload():
+    """Migrate the listings database and load the data every search needs.
+
+    Runs in the startup warmup, or once in the gunicorn master before the
+    workers are forked (see gunicorn.conf.py) so they share the tokenizer,
+    model index and market statistics copy-on-write instead of loading
+    their own.
+    """
+    global preloaded
+    if preloaded:
+        return
+    migrate_car_listings_db()
+    token_budget.preload()
+    try:
+        # Record the current bmw_cars.db signature before loading from it
+        bmw_cars_watcher.changed()
+        model_index.reload()
+    except Exception as e:
+        # Retried lazily on the first model lookup
+        logger.error(f"Could not load BMW model index: {e}")
+    if MODEL_INSIGHTS_ENABLED:
+        model_insights.load()
+    if market_stats_enabled:
+        try:
+            with get_car_listings_db() as conn:
+                listing_market.refresh_if_changed(conn, file_signature(CAR_LISTINGS_DB_PATH))
+        except sqlite3.Error as e:
+            logger.error(f"Could not load market statistics: {e}")
+    # Attribute access loads the lazily imported OpenAI SDK
+    openai.AsyncOpenAI
+    preloaded = True
+
+# Startup timings, reported by /api/ready and /metrics
+import_seconds = 0.0
+warmup_seconds = None
+warmup_error = None
+warmup_task = None
+
+def warmup():
+    """Load everything the first search would otherwise wait for.
+
+    Runs in a worker thread after startup: preload(), opening one pooled
+    connection per database and creating the OpenAI client.
+    """
+    global warmup_seconds, warmup_error
+    started = time.perf_counter()
+    try:
+        preload()
+        with get_car_listings_db(), get_bmw_cars_db():
+            pass
+        openai_client()
+    except Exception as e:
+        warmup_error = str(e)
+        logger.error(f"Warmup failed: {e}")
+    warmup_seconds = time.perf_counter() - started
+    logger.info(f"Warmed up in {warmup_seconds:.2f}s (module import took {import_seconds:.2f}s)")
+
+async def wait_until_ready():
+    """Wait for the startup warmup to finish."""
+    if warmup_task is not None:
+        await asyncio.shield(warmup_task)
+
+registry.gauge(
+    "autoadvisor_startup_seconds", "Time spent importing the server module and warming up", ("phase",),
+    function=lambda: {("import", ): import_seconds, ("warmup", ): warmup_seconds or 0.0}
+)
+
+def after_fork():
+    """Give a forked worker its own connections, locks and writer threads.
+
+    SQLite connections and running threads don't survive ``fork()``; the
+    loaded data does, and is kept.
+    """
+    global log_listener
+    if log_listener is not None:
+        # Workers log to their own files, so they don't rotate each other's
+        log_listener = setup_logging(log_dir, suffix=f"_{os.getpid()}")
+    debug_dumper.after_fork()
+    car_listings_pool.after_fork()
+    bmw_cars_pool.after_fork()
+    bmw_cars_watcher.after_fork()
+    search_cache.after_fork()
+
+os.register_at_fork(after_in_child=after_fork)
+
+# Readiness for load balancers and orchestrators: 503 until the warmup is done
+@app.get("/api/ready")
+def read_ready():
+    ready = warmup_seconds is not None and warmup_error is None
+    status = {
+        "ready": ready,
+        "import_seconds": round(import_seconds, 3),
+        "warmup_seconds": round(warmup_seconds, 3) if warmup_seconds is not None else None,
+    }
+    if warmup_error:
+        status["error"] = warmup_error
+    return JSONResponse(status, status_code=200 if ready else 503)
+
+# Admin endpoints need "Authorization: Bearer <ADMIN_TOKEN>" and are disabled without ADMIN_TOKEN
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+def require_admin(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
+
+# Reload the BMW model index after bmw_cars.db has been updated (also done
+# automatically when the file changes, see bmw_cars_watcher)
+@app.post("/api/admin/reload-model-index")
+def reload_model_index(request: Request):
+    require_admin(request)
+    try:
+        count = reload_model_data()
+    except Exception as e:
+        logger.error(f"Error reloading BMW model index: {e}")
+        raise HTTPException(status_code=500, detail=f"Could not reload model index: {e}")
+    return {"ok": True, "models": count}
+
+# In-flight searches (and their OpenAI calls) get this long to finish on shutdown
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "60"))
+
+def close_connections():
+    """Close the connection pools, the bmw_cars.db watcher and the search cache file."""
+    car_listings_pool.close()
+    bmw_cars_pool.close()
+    bmw_cars_watcher.close()
+    search_cache.close()
+
+import_seconds = time.perf_counter() - _import_started
+
 if __name__ == "__main__":
     import uvicorn
     
@@ -1065,5 +1612,5 @@ if __name__ == "__main__":
         host="127.0.0.1",  # Listen on localhost
         port=8000,
         reload=True,
-        log_level="debug"
+        log_level=os.getenv("LOG_LEVEL", "info").lower()
     )
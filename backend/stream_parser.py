@@ -0,0 +1,134 @@
+"""Incremental parsing of streamed structured-output completions.
+
+The completion arrives in small chunks of one JSON document.
+``JSONStreamScanner`` tracks string, escape and nesting state across chunk
+boundaries and reports every container (object or array) up to a given depth
+as soon as its closing bracket arrives, together with the object keys leading
+to it.  Each character is examined exactly once.  ``AnalysisStreamParser``
+validates the reported parts of an ``AnalysisResponse`` as they complete.
+"""
+import json
+from typing import List, Optional, Tuple
+
+from analysis_schema import AnalysisBlock, AnalysisResponse
+
+
+class _Frame:
+    __slots__ = ("kind", "path", "start", "expect_key", "key")
+
+    def __init__(self, kind: str, path: Tuple, start: Tuple[int, int]):
+        self.kind = kind
+        self.path = path
+        self.start = start
+        # Objects alternate between keys and values
+        self.expect_key = kind == "{"
+        self.key = None
+
+
+class JSONStreamScanner:
+    """Reports completed containers of a streamed JSON document.
+
+    ``feed`` returns ``(path, text)`` pairs, where ``path`` holds the object
+    keys from the root to the container (``None`` for array elements) and
+    ``text`` is the container's raw JSON.  Containers nested deeper than
+    ``max_depth`` are not reported on their own.
+    """
+
+    def __init__(self, max_depth: int = 3):
+        self.max_depth = max_depth
+        self._stack: List[_Frame] = []
+        # Chunks received so far; containers are sliced out of them on close
+        self._parts: List[str] = []
+        self._in_string = False
+        self._escaped = False
+        # Text of the object key being read, when the current string is a key
+        self._key_parts: Optional[List[str]] = None
+
+    def _text(self, start: Tuple[int, int], chunk: str, end: int) -> str:
+        part, offset = start
+        if part == len(self._parts) - 1:
+            return chunk[offset:end]
+        return "".join(self._parts[part:-1])[offset:] + chunk[:end]
+
+    def feed(self, chunk: str):
+        completed = []
+        self._parts.append(chunk)
+        part = len(self._parts) - 1
+        key_start = 0
+
+        for i, ch in enumerate(chunk):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._key_parts is not None:
+                        self._key_parts.append(chunk[key_start:i])
+                        key = "".join(self._key_parts)
+                        # Keys are reported decoded, like json.loads does
+                        self._stack[-1].key = json.loads(f'"{key}"') if "\\" in key else key
+                        self._key_parts = None
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                frame = self._stack[-1] if self._stack else None
+                if frame is not None and frame.kind == "{" and frame.expect_key:
+                    self._key_parts = []
+                    key_start = i + 1
+            elif ch == ":":
+                if self._stack and self._stack[-1].kind == "{":
+                    self._stack[-1].expect_key = False
+            elif ch == ",":
+                if self._stack and self._stack[-1].kind == "{":
+                    self._stack[-1].expect_key = True
+            elif ch in "{[":
+                parent = self._stack[-1] if self._stack else None
+                if parent is None:
+                    path = ()
+                else:
+                    path = parent.path + ((parent.key if parent.kind == "{" else None),)
+                self._stack.append(_Frame(ch, path, (part, i)))
+            elif ch in "}]" and self._stack:
+                frame = self._stack.pop()
+                if len(self._stack) < self.max_depth:
+                    completed.append((frame.path, self._text(frame.start, chunk, i + 1)))
+
+        if self._key_parts is not None:
+            self._key_parts.append(chunk[key_start:])
+        return completed
+
+    def text(self) -> str:
+        """The document received so far."""
+        return "".join(self._parts)
+
+
+class AnalysisStreamParser:
+    """Picks the selected IDs and each analysis out of a streamed ``AnalysisResponse``.
+
+    An analysis that does not match ``AnalysisBlock`` raises the pydantic
+    ``ValidationError`` from ``feed``; a stream that ended early or is
+    otherwise invalid raises it from ``close``.
+    """
+
+    def __init__(self):
+        self._scanner = JSONStreamScanner(max_depth=3)
+        self.selected_ids = None
+
+    def feed(self, chunk: str):
+        """Feed a chunk; returns a list of ``("selected_ids", ids)`` and
+        ``("analysis", AnalysisBlock)`` events completed by it."""
+        events = []
+        for path, text in self._scanner.feed(chunk):
+            if path == ("selected_ids",) and self.selected_ids is None:
+                self.selected_ids = [str(id).strip() for id in json.loads(text)]
+                events.append(("selected_ids", self.selected_ids))
+            elif path == ("analyses", None):
+                events.append(("analysis", AnalysisBlock.model_validate_json(text)))
+        return events
+
+    def close(self) -> AnalysisResponse:
+        """Validate the complete document once the stream has ended."""
+        return AnalysisResponse.model_validate_json(self._scanner.text())
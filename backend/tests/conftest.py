@@ -0,0 +1,6 @@
+"""Backend tests run from backend/ with ``python -m pytest``; the modules are
+imported from backend/ like the server does."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
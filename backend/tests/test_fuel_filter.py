@@ -0,0 +1,86 @@
+import sqlite3
+
+import pytest
+
+import listings_schema
+
+ENGINES = [
+    "1.5 Benzīns",
+    "2.0 Benzīns",
+    "2.0 Benzīns/gāze",
+    "2.0 Dīzelis",
+    "3.0 Dīzelis",
+    "2.0 Hibrīds",
+    "3.0 Hibrīds",
+    "2.0 Dīzelis hibrīds",
+    "2.0 Benzīns hibrīds",
+    "2.0 Benzīns/elektrība",
+    "3.0 Dīzelis/elektrība",
+    "Elektriskais",
+    "2.0 Petrol",
+    "3.0 Diesel",
+    "Cits",
+    None,
+]
+FILTERS = ["Benzīns", "Dīzelis", "Hibrīds", "Elektriskais"]
+
+# Matches the category filter adds on top of the old substring filter:
+# petrol or diesel engines combined with electricity are hybrids, and
+# English fuel names are recognized.
+ADDED = {
+    "Benzīns": {"2.0 Petrol"},
+    "Dīzelis": {"3.0 Diesel"},
+    "Hibrīds": {"2.0 Benzīns/elektrība", "3.0 Dīzelis/elektrība"},
+    "Elektriskais": set(),
+}
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE cars (engine TEXT)")
+    conn.executemany("INSERT INTO cars (engine) VALUES (?)", [(engine,) for engine in ENGINES])
+    conn.execute("ALTER TABLE cars ADD COLUMN fuel_category TEXT")
+    conn.execute(f"UPDATE cars SET fuel_category = {listings_schema.FUEL_CATEGORY_SQL}")
+    yield conn
+    conn.close()
+
+
+def old_matches(conn, fuel):
+    rows = conn.execute("SELECT engine FROM cars WHERE LOWER(engine) LIKE LOWER(?)", (f"%{fuel}%",))
+    return {engine for engine, in rows}
+
+
+def new_matches(conn, fuel):
+    categories = listings_schema.fuel_filter_categories(fuel)
+    rows = conn.execute(
+        f"SELECT engine FROM cars WHERE fuel_category IN ({', '.join('?' * len(categories))})", categories
+    )
+    return {engine for engine, in rows}
+
+
+@pytest.mark.parametrize("fuel", FILTERS)
+def test_category_filter_keeps_substring_matches(conn, fuel):
+    old = old_matches(conn, fuel)
+    new = new_matches(conn, fuel)
+    assert old <= new
+    assert new - old == ADDED[fuel]
+
+
+def test_combined_engines_name_every_fuel(conn):
+    categories = dict(conn.execute("SELECT engine, fuel_category FROM cars"))
+    assert categories["2.0 Benzīns/elektrība"] == "petrol+electric"
+    assert categories["3.0 Dīzelis/elektrība"] == "diesel+electric"
+    assert categories["2.0 Dīzelis hibrīds"] == "diesel+hybrid"
+    assert categories["Cits"] == "other"
+    assert categories[None] is None
+
+
+@pytest.mark.parametrize("engine", [engine for engine in ENGINES if engine])
+def test_python_mapping_matches_sql(conn, engine):
+    stored, = conn.execute("SELECT fuel_category FROM cars WHERE engine = ?", (engine,)).fetchone()
+    assert (listings_schema.normalize_fuel(engine) or "other") == stored
+
+
+def test_unknown_fuel_has_no_categories():
+    assert listings_schema.fuel_filter_categories("Ūdeņradis") is None
@@ -0,0 +1,137 @@
+import os
+import sqlite3
+
+import pytest
+
+import ingest
+import listings_schema
+from db_pool import SQLitePool
+from listings_schema import LISTING_COLUMNS
+
+
+def listing(id, price="10 000 €", **values):
+    row = {name: None for name in LISTING_COLUMNS}
+    row.update({
+        "id": id,
+        "fetch_time": "2024-01-01 12:00",
+        "price": price,
+        "make_model": "BMW 320",
+        "year": "2015",
+        "engine": "2.0 Dīzelis",
+        "mileage": "150 000 km",
+        "color": "Melna",
+        "options": "Komforts: Ādas salons, Navigācija",
+    })
+    row.update(values)
+    return row
+
+
+def version(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return listings_schema.read_version(conn)
+    finally:
+        conn.close()
+
+
+def rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return dict(conn.execute("SELECT id, price_eur FROM cars"))
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "car_listings.db")
+    ingest.ingest([listing("a"), listing("b"), listing("c")], path)
+    return path
+
+
+def test_upsert_inserts_updates_and_skips_unchanged(db_path):
+    before = version(db_path)
+    stats = ingest.ingest([
+        listing("a"),
+        listing("b", price="12 500 €"),
+        listing("d", price="8 000 €"),
+        # A new scrape time alone is not a content change
+        listing("c", fetch_time="2024-02-01 08:00"),
+    ], db_path)
+
+    assert (stats["inserted"], stats["updated"], stats["unchanged"]) == (1, 1, 2)
+    assert stats["version"] > before
+    assert rows(db_path) == {"a": 10000, "b": 12500, "c": 10000, "d": 8000}
+
+
+def test_unchanged_input_keeps_the_version(db_path):
+    first = ingest.ingest([listing("a"), listing("b"), listing("c")], db_path)
+    second = ingest.ingest([listing("a"), listing("b"), listing("c")], db_path)
+    assert second["unchanged"] == 3
+    assert second["version"] == first["version"]
+
+
+def test_prune_deletes_listings_missing_from_the_input(db_path):
+    stats = ingest.ingest([listing("a"), listing("c")], db_path, prune=True)
+    assert stats["deleted"] == 1
+    assert set(rows(db_path)) == {"a", "c"}
+
+
+def test_prune_refuses_an_empty_input(db_path):
+    with pytest.raises(ValueError):
+        ingest.ingest([], db_path, prune=True)
+    assert set(rows(db_path)) == {"a", "b", "c"}
+
+
+def test_swap_keeps_the_file_and_pooled_readers_see_new_data(db_path):
+    inode = os.stat(db_path).st_ino
+    pool = SQLitePool(db_path, size=2)
+    try:
+        with pool.connection() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM cars").fetchone()[0] == 3
+
+        stats = ingest.ingest([listing("a", price="9 000 €"), listing("e")], db_path, prune=True, swap=True)
+
+        assert (stats["inserted"], stats["updated"], stats["deleted"]) == (1, 1, 2)
+        assert os.stat(db_path).st_ino == inode
+        assert not os.path.exists(db_path + ".ingest")
+        with pool.connection() as conn:
+            assert dict(conn.execute("SELECT id, price_eur FROM cars")) == {"a": 9000, "e": 10000}
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert pool.stats()["recycles"] == 0
+    finally:
+        pool.close()
+
+
+def test_swap_creates_a_missing_database(tmp_path):
+    path = str(tmp_path / "new.db")
+    ingest.ingest([listing("a")], path, swap=True)
+    assert rows(path) == {"a": 10000}
+
+
+def test_migration_refuses_duplicate_ids_without_deleting_rows(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    # Databases written by the scraper before migration 4 had no unique id
+    conn.execute(f"CREATE TABLE cars ({', '.join(f'{name} TEXT' for name in LISTING_COLUMNS)})")
+    for row in (listing("a"), listing("a", price="11 000 €"), listing("b")):
+        conn.execute(
+            f"INSERT INTO cars VALUES ({', '.join('?' * len(LISTING_COLUMNS))})",
+            [row[name] for name in LISTING_COLUMNS]
+        )
+    conn.commit()
+    conn.close()
+
+    with pytest.raises(listings_schema.DuplicateListingsError):
+        listings_schema.migrate(path)
+
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM cars").fetchone()[0] == 3
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == 3
+    finally:
+        conn.close()
+
+    assert listings_schema.dedupe(path) == 1
+    assert listings_schema.migrate(path) == len(listings_schema.MIGRATIONS)
+    assert rows(path) == {"a": 11000, "b": 10000}
@@ -0,0 +1,255 @@
+import asyncio
+import random
+import selectors
+from types import SimpleNamespace
+
+import pytest
+
+from llm_scheduler import LLMScheduler, SchedulerBusy
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class VirtualSelector(selectors.DefaultSelector):
+    """Jumps the clock forward instead of sleeping while the loop waits for a timer."""
+
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+
+    def select(self, timeout=None):
+        if timeout is None:
+            raise RuntimeError("Event loop would wait forever")
+        self.clock.now += timeout
+        return super().select(0)
+
+
+class VirtualLoop(asyncio.SelectorEventLoop):
+    def __init__(self, clock):
+        super().__init__(VirtualSelector(clock))
+        self.clock = clock
+
+    def time(self):
+        return self.clock.now
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after=None):
+        super().__init__("rate limited")
+        headers = {} if retry_after is None else {"retry-after": str(retry_after)}
+        self.response = SimpleNamespace(headers=headers)
+
+
+@pytest.fixture
+def clock():
+    return VirtualClock()
+
+
+@pytest.fixture
+def run(clock):
+    loop = VirtualLoop(clock)
+    yield loop.run_until_complete
+    loop.close()
+
+
+@pytest.fixture(autouse=True)
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(random, "uniform", lambda low, high: low)
+
+
+async def settle():
+    # Let the woken tasks run until they wait again
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+async def hold(scheduler, released, **slot):
+    async with scheduler.slot(**slot):
+        await released.wait()
+
+
+def test_queued_calls_run_in_priority_order(clock, run):
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, clock=clock)
+        released = asyncio.Event()
+        order = []
+
+        async def call(name, priority):
+            async with scheduler.slot(priority=priority):
+                order.append(name)
+
+        holder = asyncio.ensure_future(hold(scheduler, released))
+        await settle()
+        calls = [asyncio.ensure_future(call(name, priority))
+                 for name, priority in (("low", 2), ("first", 0), ("middle", 1), ("second", 0))]
+        await settle()
+        assert scheduler.stats()["queued"] == 4
+
+        released.set()
+        await asyncio.gather(holder, *calls)
+        return order
+
+    assert run(scenario()) == ["first", "second", "middle", "low"]
+
+
+def test_retry_after_delays_the_retry_and_other_calls(clock, run):
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=4, clock=clock)
+        attempts = []
+
+        async def flaky():
+            attempts.append(clock.now)
+            if len(attempts) == 1:
+                raise RateLimited(retry_after=2)
+            return "ok"
+
+        async def later():
+            await asyncio.sleep(0.5)
+            async with scheduler.slot():
+                return clock.now
+
+        result, other_started = await asyncio.gather(scheduler.run(flaky), later())
+        return result, attempts, other_started, scheduler.stats()
+
+    result, attempts, other_started, stats = run(scenario())
+    assert result == "ok"
+    assert attempts == [0.0, 2.0]
+    # The Retry-After pause holds back every queued call, not just the retry
+    assert other_started == 2.0
+    assert (stats["retries"], stats["rate_limited"]) == (1, 1)
+
+
+def test_retry_after_beyond_the_cap_is_not_retried(clock, run):
+    async def scenario():
+        scheduler = LLMScheduler(max_retry_after=5, clock=clock)
+
+        async def limited():
+            raise RateLimited(retry_after=60)
+
+        with pytest.raises(RateLimited):
+            await scheduler.run(limited)
+        return scheduler.stats()
+
+    assert run(scenario())["retries"] == 0
+
+
+def test_rate_limit_halves_concurrency_and_success_grows_it(clock, run):
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=8, clock=clock)
+        limits = []
+
+        async def limited(started):
+            with pytest.raises(RateLimited):
+                async with scheduler.slot():
+                    await started.wait()
+                    raise RateLimited()
+
+        # Two calls sent under the same limit lower it once
+        started = asyncio.Event()
+        failing = [asyncio.ensure_future(limited(started)) for _ in range(2)]
+        await settle()
+        started.set()
+        await asyncio.gather(*failing)
+        limits.append(scheduler.limit)
+
+        for _ in range(5):
+            async with scheduler.slot():
+                pass
+            limits.append(scheduler.limit)
+        for _ in range(100):
+            async with scheduler.slot():
+                pass
+        limits.append(scheduler.limit)
+        return limits
+
+    # About one more slot per round of `limit` successful calls, up to max_concurrency
+    assert run(scenario()) == [4, 4, 4, 4, 4, 5, 8]
+
+
+def test_concurrency_limit_holds_back_calls(clock, run):
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=2, clock=clock)
+        released = asyncio.Event()
+        holders = [asyncio.ensure_future(hold(scheduler, released)) for _ in range(3)]
+        await settle()
+        stats = scheduler.stats()
+        released.set()
+        await asyncio.gather(*holders)
+        return stats, scheduler.stats()
+
+    during, after = run(scenario())
+    assert (during["in_flight"], during["queued"]) == (2, 1)
+    assert (after["in_flight"], after["queued"], after["dispatched"]) == (0, 0, 3)
+
+
+def test_cancelled_queued_call_frees_its_place(clock, run):
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, clock=clock)
+        released = asyncio.Event()
+        holder = asyncio.ensure_future(hold(scheduler, released))
+        await settle()
+        queued = asyncio.ensure_future(hold(scheduler, asyncio.Event()))
+        await settle()
+        assert scheduler.stats()["queued"] == 1
+
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        assert (scheduler.stats()["queued"], scheduler.stats()["in_flight"]) == (0, 1)
+
+        released.set()
+        await holder
+        # The cancelled call neither kept the slot nor blocks the next call
+        async with scheduler.slot():
+            assert scheduler.stats()["in_flight"] == 1
+        return scheduler.stats()
+
+    stats = run(scenario())
+    assert (stats["in_flight"], stats["queued"], stats["dispatched"]) == (0, 0, 2)
+
+
+def test_requests_per_minute_budget(clock, run):
+    async def scenario():
+        scheduler = LLMScheduler(rpm=2, clock=clock)
+        started = []
+
+        async def call():
+            async with scheduler.slot():
+                started.append(clock.now)
+
+        await asyncio.gather(*(call() for _ in range(3)))
+        return started
+
+    # A two-request bucket refills one request every 30 seconds
+    assert run(scenario()) == [0.0, 0.0, 30.0]
+
+
+def test_full_queue_and_long_waits_raise_scheduler_busy(clock, run):
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=1, max_wait=10, clock=clock)
+        released = asyncio.Event()
+        holder = asyncio.ensure_future(hold(scheduler, released))
+        await settle()
+        queued = asyncio.ensure_future(hold(scheduler, asyncio.Event()))
+        await settle()
+
+        with pytest.raises(SchedulerBusy):
+            await hold(scheduler, asyncio.Event())
+        with pytest.raises(SchedulerBusy):
+            await queued
+        waited = clock.now
+        released.set()
+        await holder
+        return waited, scheduler.stats()
+
+    waited, stats = run(scenario())
+    assert waited == 10.0
+    assert (stats["rejected"], stats["timed_out"], stats["in_flight"]) == (1, 1, 0)
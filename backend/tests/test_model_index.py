@@ -0,0 +1,128 @@
+import itertools
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+
+import pytest
+
+from benchmarks import fixtures
+from model_index import MODEL_COLUMNS, ModelIndex, _row_to_model_info
+
+BUNDLED_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "bmw_cars.db")
+
+YEARS = [None, 2009, 2012, 2016, 2019, 2021, 2030]
+ENGINES = [None, "2.0 Dīzelis", "3.0 Benzīns", "2.0 Hibrīds", "Elektriskais", "diesel", "Petrol", "LPG"]
+# Exact names are added from the table; these hit the substring, base number and relaxed paths
+MODELS = ["320", "3 20d", "320i", "M340i xDrive", "340", "330e iPerformance", "X5", "x5 xdrive30d",
+          "X3 20d", "i3s", "i3", "118", "530", "Z4", "M3", "Cits", "1"]
+
+
+def legacy_match(conn, model_name, year=None, engine_type=None):
+    """The strict and relaxed bmw_models queries the server ran before the index.
+
+    Returns (pass, model info), with pass "strict", "relaxed" or None on a miss.
+    """
+    clean_model = re.sub(r'[^a-zA-Z0-9]', '', model_name).lower()
+    if engine_type:
+        engine_type = engine_type.lower()
+    base_model = re.search(r'(\d{3})', clean_model)
+    base_model = base_model.group(1) if base_model else clean_model
+    is_electric = bool(engine_type) and any(
+        term in engine_type for term in ['electric', 'elektr', 'ev', 'hybrid', 'hibrid']
+    )
+
+    query = f"""
+        SELECT {MODEL_COLUMNS} FROM bmw_models WHERE 1=1
+        AND (
+            LOWER(REPLACE(model_name, ' ', '')) = ?
+            OR LOWER(model_name) LIKE ?
+            OR LOWER(model_name) LIKE ?
+        )
+    """
+    params = [clean_model, f"%{model_name.lower()}%", f"%{base_model}%"]
+    if engine_type:
+        if is_electric:
+            fuel = "electric"
+        elif 'diesel' in engine_type or 'd' in engine_type:
+            fuel = "diesel"
+        elif 'petrol' in engine_type or 'benzin' in engine_type or 'gasoline' in engine_type:
+            fuel = "petrol"
+        else:
+            fuel = None
+        if fuel:
+            query += " AND (LOWER(fuel_type) LIKE ? OR LOWER(engine_specifications) LIKE ?)"
+            params.extend([f"%{fuel}%", f"%{fuel}%"])
+    if year:
+        query += """
+            AND (
+                production_years LIKE ? OR
+                (
+                    CAST(SUBSTR(production_years, 1, 4) AS INTEGER) <= ? AND
+                    (
+                        production_years LIKE '%present%' OR
+                        CAST(SUBSTR(production_years, 6, 4) AS INTEGER) >= ?
+                    )
+                )
+            )
+        """
+        params.extend([f"%{year}%", year, year])
+    query += """
+        ORDER BY
+            CASE
+                WHEN LOWER(REPLACE(model_name, ' ', '')) = ? THEN 1
+                WHEN LOWER(model_name) LIKE ? THEN 2
+                ELSE 3
+            END,
+            LENGTH(model_name) ASC
+        LIMIT 1
+    """
+    params.extend([clean_model, f"%{model_name.lower()}%"])
+    row = conn.execute(query, params).fetchone()
+    if row:
+        return "strict", _row_to_model_info(row)
+
+    row = conn.execute(
+        f"SELECT {MODEL_COLUMNS} FROM bmw_models WHERE LOWER(model_name) LIKE ? ORDER BY LENGTH(model_name) ASC LIMIT 1",
+        [f"%{base_model}%"]
+    ).fetchone()
+    if row:
+        return "relaxed", _row_to_model_info(row)
+    return None, None
+
+
+def fixture_db(tmp_path):
+    path = str(tmp_path / "bmw_cars.db")
+    fixtures.generate_bmw_db(path)
+    return path
+
+
+def bundled_db(tmp_path):
+    if not os.path.exists(BUNDLED_DB):
+        pytest.skip("backend/data/bmw_cars.db is not present")
+    return BUNDLED_DB
+
+
+@pytest.mark.parametrize("source", [fixture_db, bundled_db], ids=["fixtures", "bundled"])
+def test_index_matches_legacy_queries(tmp_path, source):
+    path = source(tmp_path)
+
+    @contextmanager
+    def connect():
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    index = ModelIndex(connect)
+    with connect() as conn:
+        names = [name for name, in conn.execute("SELECT model_name FROM bmw_models")]
+        passes = {"strict": 0, "relaxed": 0, None: 0}
+        for model, year, engine in itertools.product(MODELS + names, YEARS, ENGINES):
+            matched_pass, expected = legacy_match(conn, model, year, engine)
+            passes[matched_pass] += 1
+            assert index.match(model, year, engine) == expected, (model, year, engine)
+
+    # Every path of the matcher was exercised
+    assert all(passes.values()), passes
@@ -0,0 +1,157 @@
+import math
+import re
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+import listings_schema
+from listings_schema import LISTING_COLUMNS
+from scoring import listing_columns, match_scores, priority_scores
+
+CURRENT_YEAR = 2026
+
+PRICES = ["12 500 €", "12500", "12,500 €", "€ 9 900", "1.5 tūkst. €", "Pēc vienošanās", "", None]
+MILEAGES = ["185 000 km", "185,000 km", "90000", "45 000km", "nav norādīts", None]
+YEARS = ["2011 janvāris", "2015", " 2019 ", "janvāris 2011", "03.2016", "20123", "", None]
+
+
+# The per-listing scorer that the vectorized scores replaced
+def baseline_digits(value):
+    return int(''.join(filter(str.isdigit, str(value))) or 0)
+
+
+def baseline_year(value):
+    if not value:
+        return None
+    match = re.search(r'(\d{4})', value)
+    return int(match.group(1)) if match else None
+
+
+def baseline_priority(listing):
+    year = baseline_year(str(listing.get("year")))
+    year_score = (year - 1950) / (CURRENT_YEAR - 1950) if year else 0
+    mileage = baseline_digits(listing.get("mileage", "0"))
+    mileage_score = max(0.1, 1 - (math.log10(mileage) - 4) / 3) if mileage > 0 else 1.0
+    return (year_score * 0.5 + mileage_score * 0.5) * 100
+
+
+def baseline_range(value, low, high):
+    if low is not None and high is not None:
+        span = high - low
+        if span <= 0:
+            return 0
+        if low <= value <= high:
+            return 0.7 + 0.3 * (1 - ((value - low) / span))
+        return max(0, 0.7 - min(abs(value - low), abs(value - high)) / span)
+    if low is not None:
+        return 0.8 if value >= low else max(0.3, 0.8 * (value / low))
+    if value <= high:
+        return 0.7 + 0.3 * (1 - (value / high))
+    return max(0, 0.7 - 0.5 * ((value - high) / high))
+
+
+def baseline_match(listing, filters):
+    price = baseline_digits(listing.get("price", "0"))
+    if filters.price.min is not None or filters.price.max is not None:
+        price_score = baseline_range(price, filters.price.min, filters.price.max)
+    else:
+        price_score = max(0.5, 1 - (math.log10(max(5000, price)) - math.log10(5000)) / 3)
+
+    mileage = baseline_digits(listing.get("mileage", "0"))
+    if filters.mileage.min is not None or filters.mileage.max is not None:
+        mileage_score = baseline_range(mileage, filters.mileage.min, filters.mileage.max)
+    else:
+        mileage_score = max(0.4, 1 - (math.log10(max(1, mileage)) - 3) / 5)
+
+    year = baseline_year(listing.get("year"))
+    if not year:
+        age_score = 0.4
+    elif filters.price.max is not None:
+        expected_max_age = 5 + (15 * (1 - min(filters.price.max, 50000) / 50000))
+        age_score = max(0.3, 1 - ((CURRENT_YEAR - year) / expected_max_age))
+    else:
+        age = CURRENT_YEAR - year
+        if age <= 3:
+            age_score = 1.0 - (age / 30)
+        elif age <= 7:
+            age_score = 0.9 - ((age - 3) / 40)
+        elif age <= 15:
+            age_score = 0.7 - ((age - 7) / 40)
+        else:
+            age_score = max(0.3, 0.4 - ((age - 15) / 100))
+
+    score = price_score * 0.40 + mileage_score * 0.35 + age_score * 0.25
+    return min(max(score * 100, 30), 100)
+
+
+def search_filters(price=(None, None), mileage=(None, None)):
+    return SimpleNamespace(
+        price=SimpleNamespace(min=price[0], max=price[1]),
+        mileage=SimpleNamespace(min=mileage[0], max=mileage[1]),
+    )
+
+
+FILTERS = [
+    search_filters(),
+    search_filters(price=(5000, 15000), mileage=(None, 200000)),
+    search_filters(price=(None, 20000)),
+    search_filters(price=(10000, None), mileage=(100000, None)),
+]
+
+
+@pytest.fixture
+def conn(tmp_path):
+    path = str(tmp_path / "car_listings.db")
+    conn = sqlite3.connect(path)
+    listings_schema.create_listings_table(conn)
+    rows = []
+    for i in range(max(len(PRICES), len(MILEAGES), len(YEARS)) * 3):
+        row = {name: None for name in LISTING_COLUMNS}
+        row.update(id=str(i), price=PRICES[i % len(PRICES)], mileage=MILEAGES[i % len(MILEAGES)],
+                   year=YEARS[i % len(YEARS)])
+        rows.append([row[name] for name in LISTING_COLUMNS])
+    conn.executemany(f"INSERT INTO cars VALUES ({', '.join('?' * len(LISTING_COLUMNS))})", rows)
+    conn.commit()
+    conn.close()
+    listings_schema.migrate(path)
+
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
+
+
+def test_ranking_projection_scores_like_the_display_strings(conn):
+    ranked = [dict(row) for row in conn.execute(f"SELECT id, {listings_schema.SCORING_COLUMNS_SQL} FROM cars")]
+    raw = {row["id"]: dict(row) for row in conn.execute("SELECT * FROM cars")}
+    columns = listing_columns(ranked)
+
+    priorities = priority_scores(columns["mileage"], columns["year"], CURRENT_YEAR)
+    for row, priority in zip(ranked, priorities):
+        assert priority == pytest.approx(baseline_priority(raw[row["id"]])), raw[row["id"]]
+
+    for filters in FILTERS:
+        scores = match_scores(columns["price"], columns["mileage"], columns["year"], filters, CURRENT_YEAR)
+        for row, score in zip(ranked, scores):
+            assert score == pytest.approx(baseline_match(raw[row["id"]], filters)), raw[row["id"]]
+
+
+def test_full_rows_score_like_the_display_strings(conn):
+    rows = [dict(row) for row in conn.execute("SELECT * FROM cars")]
+    columns = listing_columns(rows)
+    for filters in FILTERS:
+        scores = match_scores(columns["price"], columns["mileage"], columns["year"], filters, CURRENT_YEAR)
+        assert list(scores) == pytest.approx([baseline_match(row, filters) for row in rows])
+
+
+def test_only_rows_with_odd_display_strings_are_flagged(conn):
+    conn.execute("INSERT INTO cars (id, price, mileage, year) VALUES ('a', '12 500 €', '185 000 km', '2011 janvāris')")
+    conn.execute("INSERT INTO cars (id, price, mileage, year) VALUES ('b', '12 500 €', '185 000 km', 'janvāris 2011')")
+    flags = dict(conn.execute("SELECT id, score_from_display FROM cars WHERE id IN ('a', 'b')"))
+    assert flags == {"a": 0, "b": 1}
+
+    # The update trigger keeps the flag current
+    conn.execute("UPDATE cars SET price = '12,500 €' WHERE id = 'a'")
+    row = conn.execute(f"SELECT {listings_schema.SCORING_COLUMNS_SQL} FROM cars WHERE id = 'a'").fetchone()
+    assert (row["price_eur"], row["price"], row["year"]) == (12, "12,500 €", "2011 janvāris")
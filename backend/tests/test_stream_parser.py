@@ -0,0 +1,124 @@
+import json
+
+import pytest
+from pydantic import ValidationError
+
+from analysis_schema import AnalysisResponse
+from stream_parser import AnalysisStreamParser, JSONStreamScanner
+
+# Brackets, braces, quotes and backslashes inside strings must not count as structure
+DOCUMENT = {
+    "selected_ids": ["a1", "b\"2", "c]3"],
+    "meta": {"note": "{not [an] object}", "path": "C:\\cars\\", "unicode": "\u0101 \u00e9 \U0001F697"},
+    "matrix": [[1, [2, 3]], [], [{"x": "]"}]],
+    "empty": {},
+}
+PAYLOAD = json.dumps(DOCUMENT)
+ASCII_PAYLOAD = json.dumps(DOCUMENT, ensure_ascii=True)
+
+ANALYSIS = {
+    "matchScore": 87,
+    "strengths": ["Zems nobraukums", "Pilna \"servisa\" vēsture"],
+    "considerations": ["Cena [virs] vidējās"],
+    "commonProblems": "Ūdens sūknis {N47}",
+    "highMileageConcerns": "Ķēdes spriegotājs\\",
+    "valueAssessment": "Laba",
+    "recommendation": "Pirkt",
+    "checklistItems": ["Pārbaudīt ķēdi"],
+    "comparison": "Labāks par E90",
+    "summary": "Labs auto\n\tar \u00e9 \U0001F697",
+}
+RESPONSE = {
+    "selected_ids": ["1", "2"],
+    "analyses": [{"id": "1", "analysis": ANALYSIS}, {"id": "2", "analysis": dict(ANALYSIS, matchScore=70)}],
+}
+RESPONSE_PAYLOAD = json.dumps(RESPONSE, ensure_ascii=False)
+
+
+def containers(value, path=(), depth=0, max_depth=3):
+    """(path, value) of every container up to ``max_depth``, in closing order."""
+    found = []
+    if isinstance(value, dict):
+        for key, child in value.items():
+            found += containers(child, path + (key,), depth + 1, max_depth)
+    elif isinstance(value, list):
+        for child in value:
+            found += containers(child, path + (None,), depth + 1, max_depth)
+    else:
+        return found
+    if depth < max_depth:
+        found.append((path, value))
+    return found
+
+
+def scan(chunks, max_depth=3):
+    scanner = JSONStreamScanner(max_depth)
+    found = []
+    for chunk in chunks:
+        found += [(path, json.loads(text)) for path, text in scanner.feed(chunk)]
+    return found
+
+
+@pytest.mark.parametrize("payload", [PAYLOAD, ASCII_PAYLOAD])
+def test_every_split_offset_matches_json_loads(payload):
+    expected = containers(json.loads(payload))
+    for offset in range(len(payload) + 1):
+        assert scan([payload[:offset], payload[offset:]]) == expected, offset
+
+
+@pytest.mark.parametrize("payload", [PAYLOAD, ASCII_PAYLOAD])
+def test_single_character_chunks(payload):
+    assert scan(payload) == containers(json.loads(payload))
+
+
+def test_max_depth_limits_reported_containers():
+    expected = containers(DOCUMENT, max_depth=1)
+    assert scan([PAYLOAD], max_depth=1) == expected
+    assert [path for path, _ in expected] == [()]
+
+
+def test_keys_split_across_chunks():
+    payload = json.dumps({"a\"b": [1], "c\\d": {"e": []}})
+    for offset in range(len(payload) + 1):
+        paths = [path for path, _ in scan([payload[:offset], payload[offset:]])]
+        assert paths == [("a\"b",), ("c\\d", "e"), ("c\\d",), ()], offset
+
+
+def feed_split(parser, payload, offset):
+    return parser.feed(payload[:offset]) + parser.feed(payload[offset:])
+
+
+def test_analysis_parser_at_every_split_offset():
+    expected = AnalysisResponse.model_validate_json(RESPONSE_PAYLOAD)
+    for offset in range(len(RESPONSE_PAYLOAD) + 1):
+        parser = AnalysisStreamParser()
+        events = feed_split(parser, RESPONSE_PAYLOAD, offset)
+        assert events == [("selected_ids", ["1", "2"])] + [("analysis", block) for block in expected.analyses]
+        assert parser.close() == expected
+
+
+def test_truncated_stream_raises_validation_error():
+    for end in range(len(RESPONSE_PAYLOAD)):
+        parser = AnalysisStreamParser()
+        parser.feed(RESPONSE_PAYLOAD[:end])
+        with pytest.raises(ValidationError):
+            parser.close()
+
+
+@pytest.mark.parametrize("analysis", [
+    dict(ANALYSIS, matchScore="high"),
+    {name: value for name, value in ANALYSIS.items() if name != "summary"},
+])
+def test_invalid_analysis_raises_validation_error(analysis):
+    payload = json.dumps({"selected_ids": ["1"], "analyses": [{"id": "1", "analysis": analysis}]})
+    parser = AnalysisStreamParser()
+    with pytest.raises(ValidationError):
+        for offset in range(0, len(payload), 7):
+            parser.feed(payload[offset:offset + 7])
+
+
+def test_invalid_document_raises_validation_error_on_close():
+    parser = AnalysisStreamParser()
+    assert parser.feed(json.dumps({"selected_ids": ["1"]})) == [("selected_ids", ["1"])]
+    with pytest.raises(ValidationError):
+        parser.close()
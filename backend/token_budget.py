@@ -0,0 +1,141 @@
+import hashlib
+import json
+import logging
+import threading
+from typing import Dict, List, NamedTuple, Sequence
+
+from cache import LRUCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+
+class PackedListings(NamedTuple):
+    listings: List[dict]
+    fragments: List[str]
+    tokens: int
+
+
+class TokenBudget:
+    """Token counting and prompt packing around a single shared encoder.
+
+    The tiktoken encoder is loaded once (``preload`` or first use) instead of
+    per call.  Listing token counts are cached by listing id plus a hash of the
+    serialized listing, and uncached listings are counted in one
+    ``encode_batch`` call spread over worker threads.
+    """
+
+    def __init__(self, model: str = "gpt-4", cache_size: int = 20000, threads: int = 4):
+        self.model = model
+        self.threads = max(1, threads)
+        self._encoder = None
+        self._load_failed = False
+        self._lock = threading.Lock()
+        self._counts = LRUCache(maxsize=cache_size)
+
+    def preload(self):
+        """Load the encoder now so the first request doesn't pay for it."""
+        return self.encoder
+
+    @property
+    def encoder(self):
+        if self._encoder is None and not self._load_failed:
+            with self._lock:
+                if self._encoder is None and not self._load_failed:
+                    try:
+                        # Imported here so importing the server doesn't pay for it
+                        import tiktoken
+                        self._encoder = tiktoken.encoding_for_model(self.model)
+                    except Exception as e:
+                        # Don't retry the download/load on every call
+                        logger.error(f"Error loading tiktoken encoder for {self.model}: {e}")
+                        self._load_failed = True
+        return self._encoder
+
+    def count(self, text: str) -> int:
+        """Count tokens in a text string"""
+        encoder = self.encoder
+        if encoder is None:
+            # Fallback to approximate count (4 characters per token)
+            return len(text) // 4
+        try:
+            return len(encoder.encode(text))
+        except Exception as e:
+            logger.error(f"Error counting tokens: {e}")
+            return len(text) // 4
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut ``text`` to at most ``max_tokens`` tokens, marking the cut with an ellipsis."""
+        if not text or max_tokens <= 0:
+            return text
+        encoder = self.encoder
+        if encoder is None:
+            limit = max_tokens * 4
+            return text if len(text) <= limit else text[:limit].rstrip() + "…"
+        try:
+            tokens = encoder.encode(text)
+        except Exception as e:
+            logger.error(f"Error truncating text: {e}")
+            return text
+        if len(tokens) <= max_tokens:
+            return text
+        return encoder.decode(tokens[:max_tokens]).rstrip() + "…"
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        """Count tokens for many strings in one batched, multi-threaded pass."""
+        if not texts:
+            return []
+        encoder = self.encoder
+        if encoder is None:
+            return [len(text) // 4 for text in texts]
+        try:
+            return [len(tokens) for tokens in encoder.encode_batch(list(texts), num_threads=self.threads)]
+        except Exception as e:
+            logger.error(f"Error batch counting tokens: {e}")
+            return [len(text) // 4 for text in texts]
+
+    def count_listings(self, fragments: Sequence[str], listing_ids: Sequence[str]) -> List[int]:
+        """Token counts for serialized listings, served from cache where possible."""
+        keys = [
+            (listing_id, hashlib.sha1(fragment.encode("utf-8")).hexdigest())
+            for listing_id, fragment in zip(listing_ids, fragments)
+        ]
+        counts = [self._counts.get(key) for key in keys]
+
+        missing = [i for i, count in enumerate(counts) if count is MISSING]
+        if missing:
+            for i, count in zip(missing, self.count_batch([fragments[i] for i in missing])):
+                counts[i] = count
+                self._counts.set(keys[i], count)
+        return counts
+
+    def pack(self, listings: Sequence[dict], max_tokens: int) -> PackedListings:
+        """Take listings in order until the next one would exceed ``max_tokens``.
+
+        Each listing is serialized exactly once; the returned fragments are
+        reused by ``assemble`` to build the request body.
+        """
+        fragments = [json.dumps(listing) for listing in listings]
+        counts = self.count_listings(fragments, [str(listing.get("id", "")) for listing in listings])
+
+        total = 0
+        packed = 0
+        for count in counts:
+            if total + count > max_tokens:
+                break
+            total += count
+            packed += 1
+        return PackedListings(list(listings[:packed]), fragments[:packed], total)
+
+    @staticmethod
+    def assemble(envelope_json: str, fragments: Sequence[str]) -> str:
+        """Splice serialized listings into an envelope whose last key is an empty list.
+
+        Produces exactly what ``json.dumps`` would for the full payload.
+        """
+        if not envelope_json.endswith("[]}"):
+            raise ValueError("Envelope must end with an empty listings array")
+        return envelope_json[:-3] + "[" + ", ".join(fragments) + "]}"
+
+    def stats(self) -> Dict:
+        return {"encoder_loaded": self._encoder is not None, "listing_counts": self._counts.stats()}
+
@@ -77,7 +77,8 @@ export const searchCarListings = async (filters: SearchFilters): Promise<AIRecom
           engineDetails: item.carDetails.engineDetails || '',
           bodyType: item.carDetails.bodyType || '',
           technicalInspection: item.carDetails.technicalInspection || '',
-          description: item.carDetails.description || ''
+          description: item.carDetails.description || '',
+          market: item.carDetails.market || null
         },
         aiAnalysis: {
           matchScore: Number(item.aiAnalysis?.matchScore) || 0,
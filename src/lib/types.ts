@@ -41,6 +41,15 @@ export interface CarListing {
   technicalInspection?: string;
   options?: string;
   bodyType?: string;
+  market?: MarketPosition | null;
+}
+
+// Price position among comparable listings (same model, year and fuel type)
+export interface MarketPosition {
+  pricePercentile: number;
+  medianPrice: number;
+  medianMileage: number;
+  listings: number;
 }
 
 export interface BMWModelInfo {